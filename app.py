@@ -2,11 +2,14 @@ import os
 import logging
 import time
 import json
+import tempfile
+import posixpath
+import mimetypes
 from typing import Dict, Any
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
@@ -21,6 +24,23 @@ try:
 except ImportError:
     pass
 
+from config.config import SCAN_QUEUE_CONFIG, REPORT_CONFIG, RETENTION_CONFIG, get_scan_config_hash
+from src.result_cache import ScanResultCache
+from src.maven_daemon import shutdown_daemon_pool
+from src.lazy_report import DATA_DIR_NAME, ensure_rendered, has_report_data, is_rendered
+from src.report_summary import SUMMARY_FILE, load_summary
+from src.blob_store import get_blob_store
+from src.report_archive import accepts_gzip, has_archive, pack_report, read_report_member
+from src.report_catalog import MAX_PAGE_SIZE, get_report_catalog, report_size
+from src.report_gc import ReportGarbageCollector
+from src.report_publish import new_version_dir, publish_dir, transfer_file, transfer_tree
+from src.coverage_store import get_coverage_store
+from src.jacoco_tasks import cancel_scan, clear_cancelled
+from src.scan_queue import (
+    ScanQueue, ScanWorkerPool, JobCancelled, new_job_id,
+    STATUS_QUEUED, STATUS_RUNNING, FINISHED_STATUSES
+)
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
@@ -61,9 +81,8 @@ class AdminAction(BaseModel):
     action: str
     data: dict = None
 
-REPORTS_BASE_DIR = "./reports"
+REPORTS_BASE_DIR = REPORT_CONFIG["reports_dir"]
 os.makedirs(REPORTS_BASE_DIR, exist_ok=True)
-app.mount("/reports", StaticFiles(directory=REPORTS_BASE_DIR), name="reports")
 
 def get_config_manager():
     """获取当前配置管理器"""
@@ -157,22 +176,67 @@ def get_server_base_url(request: Request = None) -> str:
         return f"{scheme}://{host}"
     return "http://localhost:8002"
 
-def save_html_report(reports_dir: str, project_name: str, commit_id: str, request_id: str, base_url: str = None) -> str:
+def save_html_report(
+    reports_dir: str,
+    project_name: str,
+    commit_id: str,
+    request_id: str,
+    base_url: str = None,
+    branch_name: str = None
+) -> str:
     try:
         import shutil
         project_reports_dir = os.path.join(REPORTS_BASE_DIR, project_name)
         os.makedirs(project_reports_dir, exist_ok=True)
 
         source_html_dir = os.path.join(reports_dir, "html")
-        if not os.path.exists(source_html_dir):
+        source_data_dir = os.path.join(reports_dir, DATA_DIR_NAME)
+        target_html_dir = os.path.join(project_reports_dir, commit_id[:8])
+
+        if not os.path.exists(source_html_dir) and not os.path.exists(os.path.join(source_data_dir, "jacoco.xml")):
             logger.warning(f"[{request_id}] HTML报告目录不存在: {source_html_dir}")
             return None
 
-        target_html_dir = os.path.join(project_reports_dir, commit_id[:8])
-        if os.path.exists(target_html_dir):
-            shutil.rmtree(target_html_dir)
+        # 临时报告目录发布后即删除，文件直接移入（与报告目录在同一文件系统时为 rename）；
+        # 开启去重时文件以硬链接的方式指向内容寻址存储中的 blob
+        blob_store = get_blob_store()
+
+        def move_tree(source_dir, target_dir):
+            if blob_store is not None:
+                stats = blob_store.store_tree(source_dir, target_dir)
+                logger.info(f"[{request_id}] 保存 {stats['files']} 个文件，其中 {stats['deduplicated']} 个去重")
+            else:
+                if os.path.isdir(target_dir):
+                    # 空的版本目录，直接用源目录替换
+                    os.rmdir(target_dir)
+                transfer_tree(source_dir, target_dir, disposable=True)
+
+        # 新版本写完后再原子地替换 <项目>/<提交> 链接，读取方不会看到写了一半的报告
+        version_dir = new_version_dir(target_html_dir)
+        try:
+            if os.path.exists(source_html_dir):
+                if REPORT_CONFIG["archive_reports"]:
+                    # 数千个 HTML 文件按目录保存为少量归档（开启去重时归档同样去重），访问时直接从归档读取
+                    stats = pack_report(source_html_dir, version_dir, blob_store)
+                    logger.info(f"[{request_id}] 归档 {stats['files']} 个文件为 {stats['archives']} 个归档，"
+                                f"其中 {stats['deduplicated']} 个去重")
+                else:
+                    move_tree(source_html_dir, version_dir)
+            else:
+                # 只发布报告数据，首次访问时生成 HTML
+                move_tree(source_data_dir, os.path.join(version_dir, DATA_DIR_NAME))
+
+            # 摘要与报告一起保存，报告列表等只读取摘要
+            source_summary = os.path.join(reports_dir, SUMMARY_FILE)
+            if os.path.exists(source_summary):
+                transfer_file(source_summary, os.path.join(version_dir, SUMMARY_FILE), disposable=True)
+            publish_dir(version_dir, target_html_dir, REPORT_CONFIG["staging_dir"])
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+
+        _record_report(project_name, commit_id, branch_name, request_id)
 
-        shutil.copytree(source_html_dir, target_html_dir)
         relative_url = f"/reports/{project_name}/{commit_id[:8]}/index.html"
         full_url = f"{base_url}{relative_url}" if base_url else relative_url
 
@@ -182,6 +246,17 @@ def save_html_report(reports_dir: str, project_name: str, commit_id: str, reques
         logger.error(f"[{request_id}] 保存HTML报告失败: {str(e)}")
         return None
 
+def _record_report(project_name: str, commit_id: str, branch_name: str, request_id: str):
+    """把已发布的报告记录到报告目录（同一提交再次推送到其他分支时更新分支和发布时间）"""
+    report_dir = os.path.join(REPORTS_BASE_DIR, project_name, commit_id[:8])
+    try:
+        get_report_catalog().record(
+            project_name, commit_id[:8], commit_id, branch_name, load_summary(report_dir),
+            size_bytes=report_size(report_dir)
+        )
+    except Exception as e:
+        logger.warning(f"[{request_id}] 更新报告目录失败: {str(e)}")
+
 @app.get("/")
 async def root():
     return {
@@ -203,18 +278,329 @@ async def health_check():
         "service": "JaCoCo Scanner"
     }
 
-@app.post("/github/webhook-no-auth")
-def github_webhook_no_auth(request: Request):
+@app.get("/metrics/maven-cache")
+def maven_cache_metrics():
+    """共享 Maven 仓库缓存的命中率与下载统计"""
+    from src.maven_cache import get_maven_cache
+    return {"status": "success", "metrics": get_maven_cache().get_metrics()}
+
+def _enter_stage(job_id: str, stage: str):
+    """进入新的扫描阶段前检查任务是否已被取消"""
+    if scan_queue.is_cancel_requested(job_id):
+        raise JobCancelled("扫描任务已被取消或被新的推送取代")
+    scan_queue.update_stage(job_id, stage)
+
+def _scan_and_publish(job: Dict[str, Any], service_config: Dict[str, Any]):
+    """执行扫描、解析报告并保存HTML报告，返回 (scan_result, report_data)"""
+    from src.jacoco_tasks import run_jacoco_scan_docker, parse_jacoco_reports, ScanCancelledError
+    import shutil
+
+    job_id = request_id = job["job_id"]
+    params = job.get("params") or {}
+    repo_url = job["repo_url"]
+    commit_id = job["commit_id"]
+    branch_name = job["branch_name"]
+    service_name = service_config['service_name']
+
+    _enter_stage(job_id, "scanning")
+    # 与报告目录在同一文件系统，发布时直接移动
+    os.makedirs(REPORT_CONFIG["staging_dir"], exist_ok=True)
+    reports_dir = tempfile.mkdtemp(prefix=f"jacoco_reports_{request_id}_", dir=REPORT_CONFIG["staging_dir"])
+    logger.info(f"[{request_id}] 开始 JaCoCo 扫描任务 {job_id}...")
+
+    try:
+        try:
+            scan_result = run_jacoco_scan_docker(
+                repo_url, commit_id, branch_name, reports_dir, service_config, request_id,
+                params.get("before_commit")
+            )
+        except ScanCancelledError as e:
+            raise JobCancelled(str(e))
+
+        _enter_stage(job_id, "parsing")
+        report_data = parse_jacoco_reports(reports_dir, request_id)
+        logger.info(f"[{request_id}] 报告解析结果: {report_data}")
+
+        if not report_data.get('reports_available', False) and scan_result.get('status') in ['completed', 'partial']:
+            logger.info(f"[{request_id}] 使用扫描结果中的覆盖率数据")
+            report_data.update({
+                'coverage_summary': {
+                    'instruction_coverage': scan_result.get('instruction_coverage', 0),
+                    'branch_coverage': scan_result.get('branch_coverage', 0),
+                    'line_coverage': scan_result.get('line_coverage', 0),
+                    'complexity_coverage': scan_result.get('complexity_coverage', 0),
+                    'method_coverage': scan_result.get('method_coverage', 0),
+                    'class_coverage': scan_result.get('class_coverage', 0)
+                }
+            })
+
+        _enter_stage(job_id, "publishing")
+        html_report_url = save_html_report(
+            reports_dir, service_name, commit_id, request_id, params.get("base_url"), branch_name
+        )
+
+        if html_report_url:
+            report_data['html_report_url'] = html_report_url
+            logger.info(f"[{request_id}] HTML报告链接: {html_report_url}")
+            report_data['html_report_dir'] = os.path.join(REPORTS_BASE_DIR, service_name, commit_id[:8])
+
+        # 保存包/类/方法/逐行覆盖率，供按提交查询
+        xml_path = os.path.join(reports_dir, "jacoco.xml")
+        if os.path.exists(xml_path):
+            try:
+                get_coverage_store().record_scan(service_name, commit_id, xml_path, repo_url, branch_name)
+            except Exception as e:
+                logger.warning(f"[{request_id}] 保存细粒度覆盖率失败: {str(e)}")
+
+        return scan_result, report_data
+    finally:
+        # 报告已发布到报告目录，临时目录不再需要（异常退出留下的由报告清理线程删除）
+        shutil.rmtree(reports_dir, ignore_errors=True)
+
+def _compute_diff_coverage(
+    repo_url: str,
+    service_name: str,
+    commit_id: str,
+    before_commit: str,
+    service_config: Dict[str, Any],
+    request_id: str,
+    changes: Dict[str, Any] = None
+):
+    """before..commit 变更行的覆盖率；没有 before、没有逐行数据或 diff 失败时返回 None。
+    changes 为扫描时在检出目录中计算的变更行；没有时（Docker 扫描、命中结果缓存）使用仓库镜像计算，
+    但只在 checkout_mode 为 mirror 或镜像已存在时，不为其他项目创建镜像"""
+    if not before_commit or not service_config.get('diff_coverage', True):
+        return None
     try:
-        request_id = f"req_{int(time.time())}"
+        from src.diff_coverage import changed_lines, compute_diff_coverage
+        from src.repo_cache import get_repo_cache
+        from src.jacoco_tasks import _run_command
+
+        store = get_coverage_store()
+        scan = store.find_scan(service_name, commit_id)
+        if scan is None:
+            return None
+
+        def run(command, cwd=None, timeout=None):
+            return _run_command(command, request_id, cwd=cwd, timeout=timeout)
+
+        started = time.time()
+        if changes is None:
+            repo_cache = get_repo_cache()
+            if (service_config.get('checkout_mode') != 'mirror'
+                    and not os.path.exists(os.path.join(repo_cache.mirror_path(repo_url), "HEAD"))):
+                logger.info(f"[{request_id}] 没有仓库镜像，跳过变更行覆盖率")
+                return None
+            mirror = repo_cache.update(repo_url, commit_id, request_id, run)
+            changes = changed_lines(mirror, before_commit, commit_id, run)
+        if changes is None:
+            return None
+        result = compute_diff_coverage(store, scan["scan_id"], changes)
+        result["base_commit"] = before_commit
+        logger.info(
+            f"[{request_id}] 变更行覆盖率: {result['lines_covered']}/{result['lines_executable']}"
+            f" ({len(changes)} 个文件，耗时 {(time.time() - started) * 1000:.0f}ms)"
+        )
+        return result
+    except Exception as e:
+        logger.warning(f"[{request_id}] 计算变更行覆盖率失败: {str(e)}")
+        return None
 
-        import asyncio
+def _compute_baseline_delta(
+    service_name: str,
+    commit_id: str,
+    service_config: Dict[str, Any],
+    request_id: str
+):
+    """与基准分支（默认 main/master）最近一次扫描相比的总体覆盖率变化"""
+    try:
+        from src.coverage_delta import summary_delta
+
+        store = get_coverage_store()
+        scan = store.find_scan(service_name, commit_id)
+        branches = service_config.get('coverage_baseline_branches') or []
+        base = store.latest_scan(service_name, branches, exclude_commit=commit_id) if scan else None
+        if base is None:
+            return None
+        result = summary_delta(store.get_node(base["scan_id"], "report"), store.get_node(scan["scan_id"], "report"))
+        result.update({"base_commit": base["commit_id"], "base_branch": base["branch"]})
+        return result
+    except Exception as e:
+        logger.warning(f"[{request_id}] 计算覆盖率变化失败: {str(e)}")
+        return None
+
+def run_scan_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """后台 worker 执行单个扫描任务：扫描、解析报告、保存HTML报告并发送通知"""
+    job_id = request_id = job["job_id"]
+    params = job.get("params") or {}
+    repo_url = job["repo_url"]
+    commit_id = job["commit_id"]
+    branch_name = job["branch_name"]
+    event_type = job.get("event_type", "unknown")
+
+    service_config = get_service_config(repo_url)
+    service_name = service_config['service_name']
+
+    config_hash = get_scan_config_hash(service_config)
+    cached = None
+    if params.get("force_rescan"):
+        logger.info(f"[{request_id}] 强制重新扫描，跳过结果缓存")
+    else:
+        _enter_stage(job_id, "cache_lookup")
+        cached = scan_result_cache.get(repo_url, commit_id, config_hash)
+        if cached and cached["scan_result"].get("status") != "completed":
+            # 构建或测试失败的结果可能是偶发失败，重新扫描
+            logger.info(f"[{request_id}] 缓存的扫描结果为 {cached['scan_result'].get('status')}，重新扫描")
+            scan_result_cache.invalidate(repo_url, commit_id, config_hash)
+            cached = None
+
+    changes = None
+    if cached:
+        logger.info(f"[{request_id}] 命中扫描结果缓存，跳过构建: {commit_id}")
+        scan_result = dict(cached["scan_result"], cached=True)
+        report_data = cached["report_data"]
+        if report_data.get('html_report_dir'):
+            _record_report(service_name, commit_id, branch_name, request_id)
+    else:
+        scan_result, report_data = _scan_and_publish(job, service_config)
+        changes = scan_result.pop("changed_lines", None)
+        # 只缓存构建和测试都成功的结果（partial 表示构建或测试失败）
+        if report_data.get('reports_available') and scan_result.get('status') == 'completed':
+            cached_scan_result = {
+                key: value for key, value in scan_result.items()
+                if key not in ("maven_output", "maven_errors")
+            }
+            scan_result_cache.put(
+                repo_url, commit_id, config_hash,
+                {"scan_result": cached_scan_result, "report_data": report_data},
+                project=service_name,
+                report_path=report_data.get('html_report_dir')
+            )
+
+    # 本次推送变更行的覆盖率（不写入结果缓存，同一提交的不同推送 before 不同）
+    diff_coverage = _compute_diff_coverage(
+        repo_url, service_name, commit_id, params.get("before_commit"), service_config, request_id, changes
+    )
+    if diff_coverage is not None:
+        report_data['diff_coverage'] = diff_coverage
+    coverage_delta = _compute_baseline_delta(service_name, commit_id, service_config, request_id)
+    if coverage_delta is not None:
+        report_data['coverage_delta'] = coverage_delta
+
+    # 发送Lark通知 - 无论扫描成功或失败都发送
+    if service_config.get('enable_notifications', True):
+        _enter_stage(job_id, "notifying")
         try:
-            loop = asyncio.get_running_loop()
-            body = loop.run_until_complete(request.body())
-        except RuntimeError:
-            body = asyncio.run(request.body())
+            from src.lark_notification import send_jacoco_notification
+
+            coverage_data = report_data.get('coverage_summary', {
+                'instruction_coverage': 0,
+                'branch_coverage': 0,
+                'line_coverage': 0,
+                'complexity_coverage': 0,
+                'method_coverage': 0,
+                'class_coverage': 0
+            })
+
+            bot_id = service_config.get('bot_id', 'default')
+            bot_name = service_config.get('bot_name', '默认机器人')
+            webhook_url = service_config.get('notification_webhook')
+
+            logger.info(f"[{request_id}] 准备发送Lark通知...")
+            logger.info(f"[{request_id}] 目标机器人: {bot_name} (ID: {bot_id})")
+            logger.info(f"[{request_id}] Webhook URL: {webhook_url}")
+            logger.info(f"[{request_id}] 覆盖率数据: {coverage_data}")
+            logger.info(f"[{request_id}] 扫描状态: {scan_result.get('status', 'unknown')}")
+
+            send_jacoco_notification(
+                repo_url=repo_url,
+                branch_name=branch_name,
+                commit_id=commit_id,
+                coverage_data=coverage_data,
+                scan_result=scan_result,
+                request_id=request_id,
+                html_report_url=report_data.get('html_report_url'),
+                webhook_url=webhook_url,
+                bot_id=bot_id,
+                diff_coverage=report_data.get('diff_coverage'),
+                coverage_delta=report_data.get('coverage_delta')
+            )
+            logger.info(f"[{request_id}] ✅ lark通知已发送到 {bot_name}")
+        except Exception as notify_error:
+            logger.error(f"[{request_id}] ❌ 发送通知失败: {notify_error}")
+            import traceback
+            logger.error(f"[{request_id}] 通知错误详情: {traceback.format_exc()}")
+    else:
+        logger.warning(f"[{request_id}] 未配置Lark webhook URL，跳过通知发送")
+
+    logger.info(f"[{request_id}] JaCoCo 扫描任务完成")
+
+    return {
+        "request_id": request_id,
+        "event_type": event_type,
+        "message": f"项目 {service_name} 的提交 {commit_id[:8]} 的 JaCoCo 扫描已完成",
+        "scan_result": scan_result,
+        "report_data": report_data
+    }
+
+scan_queue = ScanQueue(SCAN_QUEUE_CONFIG["db_path"], max_attempts=SCAN_QUEUE_CONFIG["max_attempts"])
+scan_result_cache = ScanResultCache(SCAN_QUEUE_CONFIG["result_cache_db"])
+scan_workers = ScanWorkerPool(
+    scan_queue,
+    run_scan_job,
+    worker_count=SCAN_QUEUE_CONFIG["worker_count"],
+    poll_interval=SCAN_QUEUE_CONFIG["poll_interval"],
+    on_finished=clear_cancelled
+)
+
+report_gc = ReportGarbageCollector(
+    REPORTS_BASE_DIR, RETENTION_CONFIG, [tempfile.gettempdir(), REPORT_CONFIG["staging_dir"]]
+)
+
+@app.on_event("startup")
+def start_scan_workers():
+    # 报告目录第一次创建时在后台收录已有的报告
+    get_report_catalog()
+    scan_workers.start()
+    if RETENTION_CONFIG["enabled"]:
+        report_gc.start()
+
+@app.on_event("shutdown")
+def stop_scan_workers():
+    scan_workers.stop()
+    report_gc.stop()
+    shutdown_daemon_pool()
+
+def _cancel_running_scan(job_id: str):
+    """终止执行中任务的扫描进程；任务恰好已结束时清除取消标记，避免残留"""
+    cancel_scan(job_id)
+    job = scan_queue.get(job_id)
+    if job is None or job["status"] in FINISHED_STATUSES:
+        clear_cancelled(job_id)
+
+def _enqueue_scan(request_id: str, **job) -> str:
+    """扫描任务入队；开启 cancel_superseded_running 时同时取消同一分支上正在执行的旧任务"""
+    job_id = scan_queue.enqueue(
+        **job,
+        job_id=request_id,
+        coalesce=SCAN_QUEUE_CONFIG["coalesce_pushes"],
+        delay=SCAN_QUEUE_CONFIG["debounce_seconds"]
+    )
+    scan_workers.notify()
+    logger.info(f"[{request_id}] 扫描任务已入队: {job_id}")
+
+    if SCAN_QUEUE_CONFIG["coalesce_pushes"] and SCAN_QUEUE_CONFIG["cancel_superseded_running"]:
+        for running_id in scan_queue.request_cancel_running(job["repo_url"], job["branch_name"], job_id):
+            logger.info(f"[{request_id}] 取消被取代的执行中任务: {running_id}")
+            _cancel_running_scan(running_id)
+    return job_id
+
+@app.post("/github/webhook-no-auth")
+async def github_webhook_no_auth(request: Request):
+    try:
+        request_id = new_job_id()
 
+        body = await request.body()
         if not body:
             raise HTTPException(status_code=400, detail="Empty request body")
 
@@ -254,6 +640,10 @@ def github_webhook_no_auth(request: Request):
 
         service_config = get_service_config(repo_url)
         service_name = service_config['service_name']
+        force_rescan = (
+            request.query_params.get("force", "").lower() in ("1", "true")
+            or bool(payload.get("force_rescan"))
+        )
 
         logger.info(f"[{request_id}] Webhook received: {event_type}")
         logger.info(f"[{request_id}] Repository: {repo_url}")
@@ -261,93 +651,30 @@ def github_webhook_no_auth(request: Request):
         logger.info(f"[{request_id}] Commit: {commit_id}")
         logger.info(f"[{request_id}] Branch: {branch_name}")
 
-        logger.info(f"[{request_id}] 使用同步扫描模式")
-
-        try:
-            from src.jacoco_tasks import run_jacoco_scan_docker, parse_jacoco_reports
-            import tempfile
-
-            reports_dir = tempfile.mkdtemp(prefix=f"jacoco_reports_{request_id}_")
-            logger.info(f"[{request_id}] 开始同步 JaCoCo 扫描...")
-
-            scan_result = run_jacoco_scan_docker(
-                repo_url, commit_id, branch_name, reports_dir, service_config, request_id
-            )
-
-            report_data = parse_jacoco_reports(reports_dir, request_id)
-            logger.info(f"[{request_id}] 报告解析结果: {report_data}")
-
-            if not report_data.get('reports_available', False) and scan_result.get('status') in ['completed', 'partial']:
-                logger.info(f"[{request_id}] 使用扫描结果中的覆盖率数据")
-                report_data.update({
-                    'coverage_summary': {
-                        'instruction_coverage': scan_result.get('instruction_coverage', 0),
-                        'branch_coverage': scan_result.get('branch_coverage', 0),
-                        'line_coverage': scan_result.get('line_coverage', 0),
-                        'complexity_coverage': scan_result.get('complexity_coverage', 0),
-                        'method_coverage': scan_result.get('method_coverage', 0),
-                        'class_coverage': scan_result.get('class_coverage', 0)
-                    }
-                })
-
-            base_url = get_server_base_url(request)
-            html_report_url = save_html_report(reports_dir, service_name, commit_id, request_id, base_url)
-
-            if html_report_url:
-                report_data['html_report_url'] = html_report_url
-                logger.info(f"[{request_id}] HTML报告链接: {html_report_url}")
-
-            # 发送Lark通知 - 无论扫描成功或失败都发送
-            if service_config.get('enable_notifications', True):
-                try:
-                    from src.lark_notification import send_jacoco_notification
-
-                    coverage_data = report_data.get('coverage_summary', {
-                        'instruction_coverage': 0,
-                        'branch_coverage': 0,
-                        'line_coverage': 0,
-                        'complexity_coverage': 0,
-                        'method_coverage': 0,
-                        'class_coverage': 0
-                    })
-
-                    bot_id = service_config.get('bot_id', 'default')
-                    bot_name = service_config.get('bot_name', '默认机器人')
-                    webhook_url = service_config.get('notification_webhook')
-
-                    logger.info(f"[{request_id}] 准备发送Lark通知...")
-                    logger.info(f"[{request_id}] 目标机器人: {bot_name} (ID: {bot_id})")
-                    logger.info(f"[{request_id}] Webhook URL: {webhook_url}")
-                    logger.info(f"[{request_id}] 覆盖率数据: {coverage_data}")
-                    logger.info(f"[{request_id}] 扫描状态: {scan_result.get('status', 'unknown')}")
-
-                    send_jacoco_notification(
-                        repo_url=repo_url,
-                        branch_name=branch_name,
-                        commit_id=commit_id,
-                        coverage_data=coverage_data,
-                        scan_result=scan_result,
-                        request_id=request_id,
-                        html_report_url=report_data.get('html_report_url'),
-                        webhook_url=webhook_url,
-                        bot_id=bot_id
-                    )
-                    logger.info(f"[{request_id}] ✅ lark通知已发送到 {bot_name}")
-                except Exception as notify_error:
-                    logger.error(f"[{request_id}] ❌ 发送通知失败: {notify_error}")
-                    import traceback
-                    logger.error(f"[{request_id}] 通知错误详情: {traceback.format_exc()}")
-            else:
-                logger.warning(f"[{request_id}] 未配置Lark webhook URL，跳过通知发送")
+        # 队列操作会等待 SQLite 锁，放到线程池执行，不阻塞事件循环
+        job_id = await run_in_threadpool(
+            _enqueue_scan,
+            request_id,
+            repo_url=repo_url,
+            commit_id=commit_id,
+            branch_name=branch_name,
+            project=service_name,
+            event_type=event_type,
+            params={
+                "base_url": get_server_base_url(request),
+                "force_rescan": force_rescan,
+                "before_commit": payload.get("before")
+            }
+        )
 
-            # 构建响应数据
-            response_data = {
-                "status": "completed",
+        return JSONResponse(
+            status_code=202,
+            content={
+                "status": "accepted",
+                "job_id": job_id,
                 "request_id": request_id,
                 "event_type": event_type,
-                "message": f"项目 {service_name} 的提交 {commit_id[:8]} 的 JaCoCo 扫描已完成（同步）",
-                "scan_result": scan_result,
-                "report_data": report_data,
+                "message": f"项目 {service_name} 的提交 {commit_id[:8]} 的 JaCoCo 扫描已加入队列",
                 "extracted_info": {
                     "repo_url": repo_url,
                     "commit_id": commit_id,
@@ -355,45 +682,95 @@ def github_webhook_no_auth(request: Request):
                     "service_name": service_name
                 }
             }
+        )
 
-            logger.info(f"[{request_id}] 同步 JaCoCo 扫描完成")
-
-            try:
-                logger.info(f"[{request_id}] 临时目录将由系统自动清理: {reports_dir}")
-            except Exception as cleanup_error:
-                logger.warning(f"[{request_id}] 临时目录清理注意: {cleanup_error}")
-
-            return JSONResponse(
-                status_code=200,
-                content=response_data
-            )
-
-        except Exception as sync_error:
-            logger.error(f"[{request_id}] 同步扫描失败: {sync_error}")
-
-            return JSONResponse(
-                    status_code=200,
-                    content={
-                        "status": "error",
-                        "request_id": request_id,
-                        "message": f"JaCoCo 扫描失败: {str(sync_error)}",
-                        "error_details": str(sync_error),
-                        "extracted_info": {
-                            "repo_url": repo_url,
-                            "commit_id": commit_id,
-                            "branch_name": branch_name,
-                            "service_name": service_name
-                        },
-                        "note": "Webhook接收成功，但扫描执行失败。请检查Docker环境和网络连接。"
-                    }
-                )
-        
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
     except Exception as e:
         logger.error(f"[{request_id}] Webhook processing failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Webhook processing failed: {str(e)}")
 
+def _format_scan_job(job: Dict[str, Any], include_result: bool = False) -> Dict[str, Any]:
+    """将任务记录转换为接口响应（阶段、耗时、覆盖率摘要、报告链接）"""
+    created_at = job.get("created_at")
+    started_at = job.get("started_at")
+    finished_at = job.get("finished_at")
+    data = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "stage": job.get("stage"),
+        "project": job.get("project"),
+        "repo_url": job.get("repo_url"),
+        "branch_name": job.get("branch_name"),
+        "commit_id": job.get("commit_id"),
+        "event_type": job.get("event_type"),
+        "coverage_summary": job.get("coverage_summary") or None,
+        "report_url": job.get("report_url"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts"),
+        "timings": {
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "queue_seconds": round((started_at or time.time()) - created_at, 3) if created_at else None,
+            "run_seconds": round((finished_at or time.time()) - started_at, 3) if started_at else None,
+            "stages": job.get("stage_times") or {}
+        }
+    }
+    if include_result:
+        data["result"] = job.get("result")
+    return data
+
+@app.get("/scans/{job_id}")
+def get_scan_job(job_id: str, include_result: bool = False):
+    """查询单个扫描任务的状态和结果"""
+    job = scan_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"扫描任务 {job_id} 不存在")
+    return {"status": "success", "job": _format_scan_job(job, include_result)}
+
+@app.get("/scans")
+def list_scan_jobs(project: str = None, branch: str = None, status: str = None, page: int = 1, page_size: int = 20):
+    """分页查询扫描任务"""
+    page = max(1, page)
+    page_size = min(max(1, page_size), 100)
+    data = scan_queue.list_jobs(
+        project=project, branch_name=branch, status=status,
+        limit=page_size, offset=(page - 1) * page_size
+    )
+    return {
+        "status": "success",
+        "page": page,
+        "page_size": page_size,
+        "total": data["total"],
+        "jobs": [_format_scan_job(job) for job in data["jobs"]]
+    }
+
+@app.delete("/scans/{job_id}")
+def delete_scan_job(job_id: str):
+    """取消排队中或执行中的任务，或删除已结束任务的记录"""
+    job = scan_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"扫描任务 {job_id} 不存在")
+
+    if job["status"] == STATUS_QUEUED and scan_queue.cancel(job_id):
+        return {"status": "success", "message": f"扫描任务 {job_id} 已取消"}
+    if job["status"] == STATUS_RUNNING and scan_queue.request_cancel(job_id):
+        _cancel_running_scan(job_id)
+        return JSONResponse(
+            status_code=202,
+            content={"status": "success", "message": f"已请求取消执行中的扫描任务 {job_id}"}
+        )
+    if job["status"] in FINISHED_STATUSES and scan_queue.delete(job_id):
+        return {"status": "success", "message": f"扫描任务 {job_id} 已删除"}
+
+    return JSONResponse(
+        status_code=409,
+        content={"status": "error", "message": f"扫描任务 {job_id} 状态已变化，请重试"}
+    )
+
 @app.get("/config/bots")
 async def list_bots():
     """列出所有配置的Lark机器人"""
@@ -789,44 +1166,195 @@ async def admin_action(action_data: AdminAction):
             content={"status": "error", "message": f"操作失败: {str(e)}"}
         )
 
+@app.get("/coverage/{project_name}/diff")
+def get_coverage_diff(
+    project_name: str,
+    from_commit: str = Query(..., alias="from"),
+    to_commit: str = Query(..., alias="to"),
+    limit: int = 200
+):
+    """两次扫描之间按包、按文件的覆盖率变化（各取行覆盖率下降最多的 limit 个）"""
+    from src.coverage_delta import compare_columns, summary_delta
+
+    store = get_coverage_store()
+    scans = {}
+    for label, commit in (("from", from_commit), ("to", to_commit)):
+        scans[label] = store.find_scan(project_name, commit)
+        if scans[label] is None:
+            raise HTTPException(status_code=404, detail=f"没有提交 {commit} 的覆盖率数据")
+    from_id, to_id = scans["from"]["scan_id"], scans["to"]["scan_id"]
+
+    response = {
+        "status": "success",
+        "project_name": project_name,
+        "from": {"commit_id": scans["from"]["commit_id"], "branch": scans["from"]["branch"]},
+        "to": {"commit_id": scans["to"]["commit_id"], "branch": scans["to"]["branch"]},
+        "summary": summary_delta(store.get_node(from_id, "report"), store.get_node(to_id, "report")),
+    }
+    for key, kind in (("packages", "package"), ("files", "sourcefile")):
+        from_columns = store.load_columns(from_id, kind)
+        to_columns = store.load_columns(to_id, kind)
+        if from_columns is None or to_columns is None:
+            raise HTTPException(status_code=404, detail="扫描缺少按列保存的覆盖率数据")
+        response[key] = compare_columns(from_columns, to_columns, limit=limit)
+    return response
+
+@app.get("/coverage/{project_name}/{commit_id}")
+def get_commit_coverage(
+    project_name: str,
+    commit_id: str,
+    kind: str = "package",
+    parent: str = None,
+    name: str = None
+):
+    """某次提交的覆盖率：指定 name 时返回单个元素，否则列出 kind 类型的元素（可按 parent 过滤）"""
+    store = get_coverage_store()
+    scan = store.find_scan(project_name, commit_id)
+    if scan is None:
+        raise HTTPException(status_code=404, detail="没有该提交的覆盖率数据")
+    response = {
+        "status": "success",
+        "project_name": project_name,
+        "commit_id": scan["commit_id"],
+        "branch": scan["branch"],
+        "summary": (store.get_node(scan["scan_id"], "report") or {}).get("counters", {}),
+    }
+    if name is not None:
+        node = store.get_node(scan["scan_id"], kind, name)
+        if node is None:
+            raise HTTPException(status_code=404, detail=f"{kind} 不存在: {name}")
+        response["node"] = node
+        if kind == "sourcefile":
+            lines = store.get_lines(scan["scan_id"], node["parent"], name, node["group"])
+            if lines is not None:
+                response["lines"] = {field: values.tolist() for field, values in lines.items()}
+    else:
+        response["nodes"] = store.list_nodes(scan["scan_id"], kind, parent)
+    return response
+
+@app.get("/reports/{project_name}/{commit_dir}/{file_path:path}")
+def get_report_file(project_name: str, commit_dir: str, file_path: str, request: Request):
+    """报告文件；按需生成的报告在首次访问时生成 HTML"""
+    base_dir = os.path.realpath(REPORTS_BASE_DIR)
+    report_dir = os.path.realpath(os.path.join(base_dir, project_name, commit_dir))
+    if (project_name.startswith(".") or commit_dir.startswith(".")
+            or os.path.dirname(os.path.dirname(report_dir)) != base_dir
+            or not os.path.isdir(report_dir)):
+        raise HTTPException(status_code=404, detail="报告不存在")
+
+    target = os.path.realpath(os.path.join(report_dir, file_path or "index.html"))
+    if os.path.isdir(target):
+        target = os.path.join(target, "index.html")
+    if not target.startswith(report_dir + os.sep):
+        raise HTTPException(status_code=404, detail="报告文件不存在")
+
+    if not os.path.isfile(target) and has_report_data(report_dir) and not is_rendered(report_dir):
+        try:
+            ensure_rendered(report_dir, project_name)
+            # 生成的 HTML 计入报告大小（清理时按大小统计）
+            get_report_catalog().update_size(project_name, commit_dir, report_size(report_dir))
+        except Exception as e:
+            logger.error(f"生成HTML报告失败: {report_dir}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"生成HTML报告失败: {str(e)}")
+
+    if not os.path.isfile(target) and has_archive(report_dir):
+        response = _archive_response(report_dir, os.path.relpath(target, report_dir).replace(os.sep, "/"), request)
+        if response is not None:
+            return response
+    if not os.path.isfile(target):
+        raise HTTPException(status_code=404, detail="报告文件不存在")
+    return FileResponse(target)
+
+def _archive_response(report_dir: str, name: str, request: Request):
+    """从报告归档返回成员；重新扫描会把新报告发布到同一地址，缓存过期后按 ETag 重新验证"""
+    accept_gzip = accepts_gzip(request.headers.get("accept-encoding"))
+    content = read_report_member(report_dir, name, accept_gzip)
+    if content is None and not name.endswith("index.html"):
+        # 目录地址（不带 index.html）
+        name = posixpath.join(name, "index.html")
+        content = read_report_member(report_dir, name, accept_gzip)
+    if content is None:
+        return None
+
+    headers = {
+        "ETag": content.etag,
+        "Cache-Control": f"public, max-age={REPORT_CONFIG['report_cache_max_age']}",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # 弱比较：忽略 W/ 前缀
+    if if_none_match.strip() == "*" or content.etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]:
+        return Response(status_code=304, headers=headers)
+    if content.encoding:
+        headers["Content-Encoding"] = content.encoding
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Response(content=content.body, media_type=media_type, headers=headers)
+
+def _parse_since(since: str) -> float:
+    """时间戳或 YYYY-MM-DD[ HH:MM:SS]（本地时间）"""
+    try:
+        return float(since)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(since, fmt))
+        except ValueError:
+            continue
+    raise HTTPException(status_code=400, detail=f"无效的时间: {since}")
+
+def _catalog_entry(item: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    relative_url = f"/reports/{item['project']}/{item['commit_dir']}/index.html"
+    return {
+        "commit_id": item["commit_dir"],
+        "full_commit_id": item["commit_id"],
+        "branch": item["branch"],
+        "url": relative_url,
+        "full_url": f"{base_url}{relative_url}",
+        "created_time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item["created_at"])),
+        "coverage": item["coverage"]
+    }
+
 @app.get("/reports")
-async def list_reports(request: Request):
+def list_reports(
+    request: Request,
+    project: str = None,
+    branch: str = None,
+    since: str = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None
+):
+    """已发布的报告，按发布时间倒序分页（next_cursor 为空表示没有下一页）"""
     try:
-        reports = []
         base_url = get_server_base_url(request)
+        try:
+            items, next_cursor = get_report_catalog().list_reports(
+                project, branch, _parse_since(since) if since else None, limit, cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        if os.path.exists(REPORTS_BASE_DIR):
-            for project_name in os.listdir(REPORTS_BASE_DIR):
-                project_dir = os.path.join(REPORTS_BASE_DIR, project_name)
-                if os.path.isdir(project_dir):
-                    project_reports = []
-                    for commit_dir in os.listdir(project_dir):
-                        commit_path = os.path.join(project_dir, commit_dir)
-                        index_file = os.path.join(commit_path, "index.html")
-                        if os.path.isdir(commit_path) and os.path.exists(index_file):
-                            mtime = os.path.getmtime(index_file)
-                            relative_url = f"/reports/{project_name}/{commit_dir}/index.html"
-                            project_reports.append({
-                                "commit_id": commit_dir,
-                                "url": relative_url,
-                                "full_url": f"{base_url}{relative_url}",
-                                "created_time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
-                            })
-
-                    if project_reports:
-                        project_reports.sort(key=lambda x: x['created_time'], reverse=True)
-                        reports.append({
-                            "project_name": project_name,
-                            "reports": project_reports
-                        })
+        # 保持按项目分组的返回格式（组内仍按时间倒序）
+        reports = []
+        groups = {}
+        for item in items:
+            if item["project"] not in groups:
+                groups[item["project"]] = {"project_name": item["project"], "reports": []}
+                reports.append(groups[item["project"]])
+            groups[item["project"]]["reports"].append(_catalog_entry(item, base_url))
 
         return {
             "status": "success",
             "total_projects": len(reports),
+            "count": len(items),
             "reports": reports,
+            "next_cursor": next_cursor,
             "message": "HTML报告列表获取成功"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取报告列表失败: {str(e)}")
         return JSONResponse(
@@ -834,6 +1362,22 @@ async def list_reports(request: Request):
             content={"status": "error", "message": f"获取报告列表失败: {str(e)}"}
         )
 
+@app.get("/reports/{project_name}/latest")
+def latest_reports(project_name: str, request: Request, branch: str = None):
+    """每个分支最近一次发布的报告；指定 branch 时只返回该分支"""
+    base_url = get_server_base_url(request)
+    items = get_report_catalog().latest_per_branch(project_name)
+    if branch is not None:
+        items = [item for item in items if item["branch"] == branch]
+        if not items:
+            raise HTTPException(status_code=404, detail=f"分支 {branch} 没有报告")
+        return {"status": "success", "project_name": project_name, "report": _catalog_entry(items[0], base_url)}
+    return {
+        "status": "success",
+        "project_name": project_name,
+        "branches": {item["branch"] or "": _catalog_entry(item, base_url) for item in items}
+    }
+
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(_: Request, exc: HTTPException):
@@ -1,5 +1,7 @@
 from typing import Dict, Any, Optional
+import os
 import re
+import json
 import hashlib
 
 # 管理员密码配置（用于修改已存在的配置）
@@ -31,7 +33,21 @@ PROJECT_BOT_MAPPING: Dict[str, str] = {
 # 默认扫描配置
 DEFAULT_SCAN_CONFIG: Dict[str, Any] = {
     "maven_goals": ["clean", "test", "jacoco:report"],
+    # mirror: 本地镜像缓存 + 共享对象检出; shallow: 只获取目标提交; clone: 每次完整克隆
+    "checkout_mode": "mirror",
     "use_docker": True,
+    "shared_maven_cache": True,  # Docker 扫描挂载宿主机共享的 Maven 本地仓库
+    "maven_executor": "mvn",  # 本地扫描使用的 Maven: mvn / mvnd（常驻守护进程）
+    "scan_profile": "default",  # 见 SCAN_PROFILES
+    # 本地扫描复用每个分支的工作区和 target/ 目录，仅在 POM 变更或构建失败时 clean
+    "incremental_build": False,
+    # 多模块项目只构建自上次扫描以来有变更的模块（及其上下游），需要开启 incremental_build
+    "changed_modules_only": False,
+    # 只运行受变更影响的测试（静态引用分析），其余测试的覆盖率来自上次的执行数据，需要开启 incremental_build
+    "test_selection": False,
+    "test_selection_full_run_every": 20,  # 连续多少次选择性运行后运行一次全部测试
+    "diff_coverage": True,  # 计算本次推送变更行（before..after）的覆盖率，在扫描检出目录（或已有的仓库镜像）中执行 git diff
+    "coverage_baseline_branches": ["main", "master"],  # 通知中对比的基准分支（取第一个有扫描记录的）
     "force_local_scan": False,
     "scan_timeout": 1800,  # 正常模式30分钟
     "debug_timeout": 300,   # 调试模式5分钟
@@ -40,31 +56,140 @@ DEFAULT_SCAN_CONFIG: Dict[str, Any] = {
     "verbose_logging": False,
 }
 
-def get_bot_for_project(repo_url: str, project_name: str) -> str:
-    """根据项目信息匹配对应的机器人ID"""
+# 扫描配置模板，通过 scan_profile 选择
+SCAN_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    # 多模块并行构建 + 多个测试 JVM；JaCoCo 以追加方式写入同一个 exec 文件
+    "parallel": {
+        "maven_threads": "1C",  # mvn -T，1C 表示每个CPU核一个线程
+        "surefire_fork_count": "1C",
+        "surefire_reuse_forks": True,
+        "surefire_parallel": None,  # 如 "classes"，要求测试本身线程安全
+        "surefire_thread_count": None,
+    },
+}
+
+# 按项目覆盖扫描配置（键与 PROJECT_BOT_MAPPING 相同，支持通配符和路径匹配）
+PROJECT_SCAN_CONFIG: Dict[str, Dict[str, Any]] = {
+    # "backend-*": {"scan_profile": "parallel"},
+}
+
+# 扫描队列配置（webhook 入队，后台 worker 执行扫描）
+SCAN_QUEUE_CONFIG: Dict[str, Any] = {
+    "db_path": os.environ.get("JACOCO_QUEUE_DB", "./data/scan_queue.db"),
+    "worker_count": int(os.environ.get("JACOCO_SCAN_WORKERS", "2")),
+    "poll_interval": 1.0,  # 队列为空时的轮询间隔（秒）
+    # 任务最多被领取的次数；执行期间服务多次中断（如扫描导致进程崩溃）的任务重启后标记为失败
+    "max_attempts": int(os.environ.get("JACOCO_SCAN_MAX_ATTEMPTS", "3")),
+    # 同一仓库同一分支的新推送会取代尚未开始的旧任务
+    "coalesce_pushes": os.environ.get("JACOCO_COALESCE_PUSHES", "true").lower() == "true",
+    # 新推送到达后等待的秒数，期间的连续推送只扫描最后一次
+    "debounce_seconds": float(os.environ.get("JACOCO_SCAN_DEBOUNCE", "0")),
+    # 是否同时取消同一分支上正在执行的旧任务
+    "cancel_superseded_running": os.environ.get("JACOCO_CANCEL_SUPERSEDED", "false").lower() == "true",
+    # 按 仓库+提交+扫描配置 缓存扫描结果
+    "result_cache_db": os.environ.get("JACOCO_RESULT_CACHE_DB", "./data/result_cache.db"),
+}
 
-    # 文件配置系统（回退方案）
+# 本地缓存配置
+CACHE_CONFIG: Dict[str, Any] = {
+    "repo_cache_dir": os.environ.get("JACOCO_REPO_CACHE_DIR", "./data/repo_cache"),
+    "git_timeout": 600,
+    "maven_repo_dir": os.environ.get("JACOCO_MAVEN_REPO_DIR", "./data/maven_repo"),
+    "maven_repo_max_bytes": int(float(os.environ.get("JACOCO_MAVEN_REPO_MAX_GB", "20")) * 1024 ** 3),
+    "workspace_dir": os.environ.get("JACOCO_WORKSPACE_DIR", "./data/workspaces"),
+}
+
+# 本地扫描的 mvnd 守护进程配置（maven_executor 为 mvnd 时生效）
+MAVEN_DAEMON_CONFIG: Dict[str, Any] = {
+    "executable": os.environ.get("JACOCO_MVND_PATH", "mvnd"),
+    "daemon_dir": os.environ.get("JACOCO_MVND_DIR", "./data/mvnd"),
+    "max_builds": int(os.environ.get("JACOCO_MVND_MAX_BUILDS", "50")),  # 每个守护进程最多执行的构建次数
+    "max_rss_mb": int(os.environ.get("JACOCO_MVND_MAX_RSS_MB", "2048")),  # 内存超过该值时回收
+}
+
+# HTML 报告配置：lazy_html 开启时扫描只保存执行数据、class 文件和源码，首次访问时生成 HTML
+# 默认只在配置了 jacococli 时开启，未配置时内置的简化渲染需要显式开启（JACOCO_LAZY_HTML=true）
+_JACOCO_CLI_JAR = os.environ.get("JACOCO_CLI_JAR", "")
+REPORT_CONFIG: Dict[str, Any] = {
+    "reports_dir": os.environ.get("JACOCO_REPORTS_DIR", "./reports"),
+    # 扫描的临时报告目录，与报告目录在同一文件系统，发布时直接 rename / 硬链接
+    "staging_dir": os.path.join(os.environ.get("JACOCO_REPORTS_DIR", "./reports"), ".staging"),
+    "lazy_html": os.environ.get("JACOCO_LAZY_HTML", "true" if _JACOCO_CLI_JAR else "false").lower() == "true",
+    "jacoco_cli_jar": _JACOCO_CLI_JAR,  # 配置后使用 jacococli 渲染，否则使用内置渲染
+    "render_timeout": 300,
+    # 按提交保存的细粒度覆盖率（包/类/方法/逐行）
+    "coverage_db": os.environ.get("JACOCO_COVERAGE_DB", "./data/coverage.db"),
+    # 已发布报告的目录，GET /reports 分页查询
+    "catalog_db": os.environ.get("JACOCO_REPORT_CATALOG_DB", "./data/report_catalog.db"),
+    # 进程内缓存的报告摘要（summary.json）总大小上限
+    "summary_cache_bytes": int(os.environ.get("JACOCO_SUMMARY_CACHE_MB", "16")) * 1024 * 1024,
+    # 报告文件按内容去重：相同文件在所有报告间只保存一份（硬链接到 blob_dir）
+    "dedupe_reports": os.environ.get("JACOCO_DEDUPE_REPORTS", "true").lower() != "false",
+    "blob_dir": os.environ.get(
+        "JACOCO_REPORT_BLOBS", os.path.join(os.environ.get("JACOCO_REPORTS_DIR", "./reports"), ".blobs")
+    ),
+    # HTML 报告按目录打包为 report.zip 和 report.d/*.zip（开启去重时归档去重），访问时直接从归档返回（接受 gzip 时不解压）
+    "archive_reports": os.environ.get("JACOCO_ARCHIVE_REPORTS", "true").lower() != "false",
+    # 同一提交强制重新扫描或扫描配置变化时会重新发布到相同地址，报告响应只短时间缓存，之后按 ETag 重新验证
+    "report_cache_max_age": int(os.environ.get("JACOCO_REPORT_CACHE_MAX_AGE", "60")),
+}
+
+# 报告保留策略（后台清理线程，见 src/report_gc.py）
+RETENTION_CONFIG: Dict[str, Any] = {
+    "enabled": os.environ.get("JACOCO_REPORT_GC", "true").lower() != "false",
+    "interval": int(os.environ.get("JACOCO_REPORT_GC_INTERVAL", "600")),  # 每轮清理的间隔（秒）
+    "keep_per_branch": int(os.environ.get("JACOCO_KEEP_PER_BRANCH", "20")),  # 每个项目每个分支保留的报告数
+    # 受保护分支（支持通配符）的报告在 protected_days 天内全部保留
+    "protected_branches": [
+        b.strip() for b in os.environ.get("JACOCO_PROTECTED_BRANCHES", "main,master,release/*").split(",") if b.strip()
+    ],
+    "protected_days": int(os.environ.get("JACOCO_PROTECTED_DAYS", "90")),
+    # 报告总大小上限，0 表示不限制
+    "max_total_bytes": int(os.environ.get("JACOCO_REPORTS_MAX_MB", "0")) * 1024 * 1024,
+    # 按项目覆盖以上规则，如 {"my-service": {"keep_per_branch": 5}}
+    "project_overrides": json.loads(os.environ.get("JACOCO_RETENTION_OVERRIDES", "{}")),
+    # 超过该时间的扫描临时目录视为异常退出留下的（需大于最长扫描时间）
+    "temp_max_age": int(os.environ.get("JACOCO_TEMP_MAX_AGE", str(6 * 3600))),
+    "max_deletions_per_pass": 200,  # 每轮最多删除的报告数
+    "delete_rate": float(os.environ.get("JACOCO_GC_DELETE_RATE", "500")),  # 每秒最多删除的文件数
+    "blob_prune_interval": 24 * 3600,  # 清理未引用 blob 的最小间隔（需遍历整个 blob 目录）
+}
+
+# 不影响扫描结果的配置项（计算扫描配置哈希时忽略）
+_NON_SCAN_CONFIG_KEYS = {
+    "bot_id", "bot_name", "notification_webhook", "notification_timeout",
+    "notification_retry_count", "enable_notifications", "verbose_logging",
+    "maven_executor", "diff_coverage", "coverage_baseline_branches",
+}
+
+def _match_project_config(mapping: Dict[str, Any], repo_url: str, project_name: str) -> Optional[Any]:
+    """按 精确名称 -> 通配符名称 -> URL路径 的顺序查找项目配置（机器人映射和扫描配置共用）"""
     # 1. 精确匹配项目名称
-    if project_name in PROJECT_BOT_MAPPING:
-        return PROJECT_BOT_MAPPING[project_name]
+    if project_name in mapping:
+        return mapping[project_name]
 
     # 2. 通配符匹配项目名称
-    for pattern, bot_id in PROJECT_BOT_MAPPING.items():
+    for pattern, value in mapping.items():
         if '*' in pattern:
             # 将通配符转换为正则表达式
             regex_pattern = pattern.replace('*', '.*')
             if re.match(f"^{regex_pattern}$", project_name):
-                return bot_id
+                return value
 
     # 3. URL路径匹配
-    for pattern, bot_id in PROJECT_BOT_MAPPING.items():
+    for pattern, value in mapping.items():
         if '/' in pattern and '*' in pattern:
             regex_pattern = pattern.replace('*', '.*')
-            if re.search(regex_pattern, repo_url):
-                return bot_id
+            if re.search(regex_pattern, repo_url or ""):
+                return value
+
+    return None
 
-    # 4. 返回默认机器人
-    return "default"
+def get_bot_for_project(repo_url: str, project_name: str) -> str:
+    """根据项目信息匹配对应的机器人ID，没有匹配时返回默认机器人"""
+    bot_id = _match_project_config(PROJECT_BOT_MAPPING, repo_url, project_name)
+    return "default" if bot_id is None else bot_id
 
 def get_lark_config(bot_id: str) -> Dict[str, Any]:
     """获取指定机器人的配置"""
@@ -79,6 +204,10 @@ def get_service_config(repo_url: str) -> Dict[str, Any]:
     lark_config = get_lark_config(bot_id)
 
     config = DEFAULT_SCAN_CONFIG.copy()
+    overrides = _match_project_config(PROJECT_SCAN_CONFIG, repo_url, project_name) or {}
+    profile = overrides.get("scan_profile", config["scan_profile"])
+    config.update(SCAN_PROFILES.get(profile, {}))
+    config.update(overrides)
     config.update({
         "service_name": project_name,
         "repo_url": repo_url,
@@ -90,6 +219,15 @@ def get_service_config(repo_url: str) -> Dict[str, Any]:
     })
     return config
 
+def get_scan_config_hash(service_config: Dict[str, Any]) -> str:
+    """计算影响扫描结果的配置项的哈希（通知相关配置不参与计算）"""
+    scan_config = {
+        key: value for key, value in service_config.items()
+        if key not in _NON_SCAN_CONFIG_KEYS
+    }
+    canonical = json.dumps(scan_config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
 def list_all_bots() -> Dict[str, Dict[str, Any]]:
     """列出所有配置的机器人"""
     return LARK_BOTS.copy()
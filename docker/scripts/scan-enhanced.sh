@@ -7,6 +7,8 @@ REPO_URL=""
 COMMIT_ID=""
 BRANCH=""
 SERVICE_NAME=""
+MIRROR_DIR=""
+CHECKOUT_MODE="clone"
 
 log_info() {
     echo "[$(date '+%H:%M:%S')] INFO: $1"
@@ -43,6 +45,14 @@ while [[ $# -gt 0 ]]; do
             SERVICE_NAME="$2"
             shift 2
             ;;
+        --mirror-dir)
+            MIRROR_DIR="$2"
+            shift 2
+            ;;
+        --checkout-mode)
+            CHECKOUT_MODE="$2"
+            shift 2
+            ;;
         *)
             log_error "未知参数: $1"
             exit 1
@@ -53,7 +63,7 @@ done
 # 验证必需参数
 if [[ -z "$REPO_URL" || -z "$COMMIT_ID" || -z "$SERVICE_NAME" ]]; then
     log_error "缺少必需参数"
-    echo "用法: $0 --repo-url <URL> --commit-id <ID> --branch <BRANCH> --service-name <name>"
+    echo "用法: $0 --repo-url <URL> --commit-id <ID> --branch <BRANCH> --service-name <name> [--mirror-dir <DIR>] [--checkout-mode clone|shallow]"
     exit 1
 fi
 
@@ -89,6 +99,30 @@ if [[ -d "$REPO_DIR/.git" ]]; then
     cd "$REPO_DIR"
     git fetch origin
     git reset --hard "$COMMIT_ID"
+elif [[ -n "$MIRROR_DIR" && -f "$MIRROR_DIR/HEAD" ]]; then
+    log_info "从仓库镜像检出: $MIRROR_DIR"
+    # 容器内的检出目录随容器删除，可以通过 alternates 共享镜像对象
+    git clone --shared --no-checkout "$MIRROR_DIR" "$REPO_DIR"
+    cd "$REPO_DIR"
+    git remote set-url origin "$REPO_URL"
+    git checkout --detach "$COMMIT_ID" || git checkout --detach "origin/$BRANCH"
+elif [[ "$CHECKOUT_MODE" == "shallow" ]]; then
+    log_info "浅获取目标提交..."
+    export GIT_LFS_SKIP_SMUDGE=1
+    cd "$REPO_DIR"
+    git init -q
+    git remote add origin "$REPO_URL"
+    FETCH_ARGS=(--depth 1 --filter=blob:none --no-tags origin)
+    if git fetch "${FETCH_ARGS[@]}" "$COMMIT_ID"; then
+        git checkout -q --detach FETCH_HEAD
+    else
+        log_warning "服务端不支持按SHA获取，改为获取分支 $BRANCH"
+        git fetch "${FETCH_ARGS[@]}" "+refs/heads/$BRANCH:refs/remotes/origin/$BRANCH"
+        if ! git checkout -q --detach "$COMMIT_ID"; then
+            git fetch --unshallow --filter=blob:none --no-tags origin "+refs/heads/$BRANCH:refs/remotes/origin/$BRANCH"
+            git checkout -q --detach "$COMMIT_ID" || git checkout -q --detach "origin/$BRANCH"
+        fi
+    fi
 else
     log_info "克隆仓库..."
     git clone "$REPO_URL" "$REPO_DIR"
@@ -150,6 +184,7 @@ else
     # 创建增强的pom.xml
     python3 << 'EOF'
 import xml.etree.ElementTree as ET
+import os
 import sys
 
 try:
@@ -269,6 +304,13 @@ try:
     sure_fail_ignore = ET.SubElement(sure_config, 'testFailureIgnore')
     sure_fail_ignore.text = 'true'
 
+    # 并行扫描配置传入的 Surefire 参数，如 "forkCount=1C reuseForks=true"
+    surefire_settings = dict(
+        item.split('=', 1) for item in os.environ.get('SUREFIRE_SETTINGS', '').split() if '=' in item
+    )
+    for name, value in surefire_settings.items():
+        ET.SubElement(sure_config, name).text = value
+
     # 添加JaCoCo插件
     jacoco_plugin = ET.SubElement(plugins, 'plugin')
 
@@ -290,6 +332,10 @@ try:
     exec1_goals = ET.SubElement(execution1, 'goals')
     exec1_goal = ET.SubElement(exec1_goals, 'goal')
     exec1_goal.text = 'prepare-agent'
+    if surefire_settings:
+        # 多个测试 JVM 写入同一个 jacoco.exec，必须追加而不是覆盖
+        exec1_config = ET.SubElement(execution1, 'configuration')
+        ET.SubElement(exec1_config, 'append').text = 'true'
 
     # report execution
     execution2 = ET.SubElement(executions, 'execution')
@@ -326,7 +372,13 @@ grep -A 20 "jacoco-maven-plugin" pom.xml || log_warning "未找到JaCoCo插件
 export MAVEN_OPTS="-Xmx2g -XX:MetaspaceSize=512m"
 export JAVA_OPTS="-Xmx2g"
 
+MAVEN_EXTRA_ARGS="${MAVEN_EXTRA_ARGS:-}"
+
 log_info "Maven环境变量: MAVEN_OPTS=$MAVEN_OPTS"
+log_info "Maven附加参数: $MAVEN_EXTRA_ARGS"
+if [[ -n "${SUREFIRE_SETTINGS:-}" ]]; then
+    log_info "Surefire并行参数: $SUREFIRE_SETTINGS"
+fi
 
 # 使用智能编译修复
 log_info "使用智能编译修复..."
@@ -345,7 +397,7 @@ if [[ -f "/app/scripts/smart-compile.sh" ]]; then
             -Dmaven.resolver.transport=wagon \
             -Dmaven.wagon.http.retryHandler.count=3 \
             -Dmaven.wagon.http.pool=false \
-            -U
+            -U $MAVEN_EXTRA_ARGS
 
         MAVEN_EXIT_CODE=$?
         log_info "Maven执行完成，返回码: $MAVEN_EXIT_CODE"
@@ -376,7 +428,7 @@ else
         -Dmaven.resolver.transport=wagon \
         -Dmaven.wagon.http.retryHandler.count=3 \
         -Dmaven.wagon.http.pool=false \
-        -U
+        -U $MAVEN_EXTRA_ARGS
 
     MAVEN_EXIT_CODE=$?
     log_info "Maven执行完成，返回码: $MAVEN_EXIT_CODE"
@@ -433,8 +485,38 @@ if [[ -n "$JACOCO_XML" && -f "$JACOCO_XML" ]]; then
     cp "$JACOCO_XML" "$REPORTS_DIR/"
     log_success "XML报告已复制到: $REPORTS_DIR/jacoco.xml"
     
+    # 按需生成HTML：只保存执行数据、class文件和源码
+    if [[ "${LAZY_HTML:-false}" == "true" ]]; then
+        mkdir -p "$REPORTS_DIR/_data"
+        cp "$JACOCO_XML" "$REPORTS_DIR/_data/jacoco.xml"
+        # exec 文件允许直接拼接（每段带自己的文件头）
+        find . -path "*/target/jacoco.exec" -exec cat {} + > "$REPORTS_DIR/_data/jacoco.exec" 2>/dev/null || true
+        python3 - "$REPORTS_DIR/_data" << 'PYEOF'
+import os, sys, zipfile
+dest = sys.argv[1]
+for zip_name, subdir, suffix in (("classes.zip", "target/classes", ".class"), ("sources.zip", "src/main/java", ".java")):
+    seen = set()
+    with zipfile.ZipFile(os.path.join(dest, zip_name), "w", zipfile.ZIP_DEFLATED) as zf:
+        for root, dirs, files in os.walk("."):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            rel_root = os.path.relpath(root, ".").replace(os.sep, "/")
+            if not (rel_root == subdir or rel_root.endswith("/" + subdir)):
+                continue
+            module = rel_root[:-len(subdir)]
+            for base, _, names in os.walk(root):
+                for name in names:
+                    if not name.endswith(suffix):
+                        continue
+                    rel_path = os.path.relpath(os.path.join(base, name), root).replace(os.sep, "/")
+                    arcname = (module + rel_path) if suffix == ".class" else rel_path
+                    if arcname not in seen:
+                        seen.add(arcname)
+                        zf.write(os.path.join(base, name), arcname)
+PYEOF
+        log_success "报告数据已保存到: $REPORTS_DIR/_data"
+
     # 复制HTML报告目录
-    if [[ -d "$JACOCO_HTML_DIR" ]]; then
+    elif [[ -d "$JACOCO_HTML_DIR" ]]; then
         cp -r "$JACOCO_HTML_DIR" "$REPORTS_DIR/html"
         log_success "HTML报告已复制到: $REPORTS_DIR/html"
         
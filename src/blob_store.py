@@ -0,0 +1,192 @@
+"""按内容寻址的报告文件存储
+
+每次扫描发布的报告里大部分文件与之前的报告完全相同（jacoco-resources 下的 CSS/JS/图片、
+未改动类的页面、相同的 class/源码压缩包等）。发布时按 SHA-256 把每个文件存入
+`<blob_dir>/ab/cd/abcd...`（两级扇出，数百万个文件时每个目录也只有几百项），
+报告目录中的文件是指向 blob 的硬链接：相同内容只占一份磁盘空间，读取方式不变。
+
+blob 的链接数为 1 时已没有报告引用，`prune()` 删除这些文件。
+文件系统不支持硬链接时退回普通复制（不去重）。
+"""
+
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK = 1024 * 1024
+_STALE_TMP_SECONDS = 3600
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """报告文件的内容寻址存储"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._links_supported = True
+        os.makedirs(self.root, exist_ok=True)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _tmp_name(self, path: str) -> str:
+        return f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+
+    def _ensure_blob(self, source: str, digest: str) -> str:
+        """blob 不存在时写入（同一文件系统时直接链接源文件，否则复制）"""
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            return blob
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_path = self._tmp_name(blob)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.chmod(tmp_path, 0o444)
+        # 并发写入同一内容时后写入的覆盖先写入的，内容相同
+        os.replace(tmp_path, blob)
+        return blob
+
+    def _link(self, blob: str, target: str) -> bool:
+        try:
+            # 已经是同一个 blob（rename 到同一 inode 的另一个名字什么也不做，临时链接会残留）
+            if os.path.samefile(blob, target):
+                return True
+        except FileNotFoundError:
+            pass
+        tmp_path = self._tmp_name(target)
+        try:
+            os.link(blob, tmp_path)
+        except OSError as e:
+            if e.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+                if self._links_supported:
+                    logger.warning(f"报告目录不支持硬链接，不再去重: {e}")
+                self._links_supported = False
+                return False
+            raise
+        os.replace(tmp_path, target)
+        return True
+
+    def store_file(self, source: str, target: str) -> bool:
+        """把 source 以去重方式放到 target（source 与 target 可以相同），返回是否去重"""
+        if self._links_supported:
+            try:
+                digest = file_digest(source)
+                for _ in range(2):
+                    blob = self._ensure_blob(source, digest)
+                    try:
+                        if self._link(blob, target):
+                            return True
+                        break
+                    except FileNotFoundError:
+                        # blob 恰好被 prune 删除，重新写入
+                        continue
+            except OSError as e:
+                logger.warning(f"写入 blob 失败，直接复制: {source}: {str(e)}")
+        if os.path.abspath(source) != os.path.abspath(target):
+            shutil.copy2(source, target)
+        return False
+
+    def store_tree(self, source_dir: str, target_dir: Optional[str] = None) -> Dict[str, int]:
+        """把目录中的文件去重后放到 target_dir（默认就地替换为 blob 的硬链接）"""
+        target_dir = target_dir or source_dir
+        stats = {"files": 0, "deduplicated": 0, "bytes": 0}
+        for root, _, files in os.walk(source_dir):
+            rel_dir = os.path.relpath(root, source_dir)
+            dest_dir = os.path.normpath(os.path.join(target_dir, rel_dir))
+            os.makedirs(dest_dir, exist_ok=True)
+            for name in files:
+                source = os.path.join(root, name)
+                if os.path.islink(source):
+                    continue
+                stats["files"] += 1
+                stats["bytes"] += os.path.getsize(source)
+                if self.store_file(source, os.path.join(dest_dir, name)):
+                    stats["deduplicated"] += 1
+        return stats
+
+    def prune(self, limiter=None) -> Dict[str, int]:
+        """删除已没有报告引用（链接数为 1）的 blob；limiter 用于限制删除速度"""
+        removed = freed = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".tmp"):
+                        # 写入中断留下的临时文件，留出时间给正在进行的写入
+                        if time.time() - stat.st_ctime < _STALE_TMP_SECONDS:
+                            continue
+                    elif stat.st_nlink > 1:
+                        continue
+                    if limiter is not None:
+                        limiter.acquire()
+                    os.unlink(path)
+                    removed += 1
+                    freed += stat.st_size
+                except FileNotFoundError:
+                    continue
+        return {"removed": removed, "freed_bytes": freed}
+
+
+_blob_store: Optional[BlobStore] = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    """未开启去重时返回 None"""
+    global _blob_store
+    from config.config import REPORT_CONFIG
+    if not REPORT_CONFIG.get("dedupe_reports"):
+        return None
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(REPORT_CONFIG["blob_dir"])
+        return _blob_store
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行: python -m src.blob_store dedupe <报告目录> | prune"""
+    argv = sys.argv[1:] if argv is None else argv
+    from config.config import REPORT_CONFIG
+    store = BlobStore(REPORT_CONFIG["blob_dir"])
+    if len(argv) == 2 and argv[0] == "dedupe":
+        # 把已有报告中的文件替换为 blob 的硬链接
+        blob_root = os.path.realpath(store.root)
+        files = deduplicated = 0
+        for entry in sorted(os.listdir(argv[1])):
+            path = os.path.join(argv[1], entry)
+            if entry.startswith(".") or not os.path.isdir(path) or os.path.realpath(path) == blob_root:
+                continue
+            stats = store.store_tree(path)
+            files += stats["files"]
+            deduplicated += stats["deduplicated"]
+        print(f"处理 {files} 个文件，{deduplicated} 个已链接到 {store.root}")
+        return 0
+    if argv == ["prune"]:
+        stats = store.prune()
+        print(f"删除 {stats['removed']} 个未引用的 blob，释放 {stats['freed_bytes'] / 1024 / 1024:.1f} MB")
+        return 0
+    print(main.__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
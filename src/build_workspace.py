@@ -0,0 +1,92 @@
+"""增量构建工作区
+
+`incremental_build` 开启时，每个 仓库 + 分支 保留一个长期存在的检出目录，连同各模块的
+`target/` 一起复用，Maven 依靠增量编译只重新编译变化的类。工作区旁边的状态文件记录
+上次构建的提交和 POM 哈希，用于判断下一次构建是否需要 `clean`。
+同一工作区同一时间只允许一个扫描使用。
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 下仅使用进程内锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class BuildWorkspaceCache:
+    """按 仓库URL + 分支 管理的构建工作区"""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._thread_locks_guard = threading.Lock()
+
+    def path(self, repo_url: str, branch_name: str) -> str:
+        name = repo_url.rstrip('/').split('/')[-1].replace('.git', '') or "repo"
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', f"{name}-{branch_name or 'default'}")
+        digest = hashlib.sha1(f"{repo_url}\n{branch_name}".encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.root_dir, f"{name}-{digest}")
+
+    @contextmanager
+    def lock(self, workspace: str):
+        """工作区互斥（进程内线程锁 + 跨进程文件锁）"""
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.setdefault(workspace, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{workspace}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_state(self, workspace: str) -> Dict[str, Any]:
+        """上次构建的状态；工作区不存在或状态损坏时返回空字典"""
+        if not os.path.isdir(os.path.join(workspace, ".git")):
+            return {}
+        try:
+            with open(f"{workspace}.state.json", "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, workspace: str, state: Dict[str, Any]):
+        state = dict(state, updated_at=time.time())
+        tmp_path = f"{workspace}.state.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, f"{workspace}.state.json")
+
+    def clear_state(self, workspace: str):
+        try:
+            os.remove(f"{workspace}.state.json")
+        except OSError:
+            pass
+
+
+_workspace_cache: Optional[BuildWorkspaceCache] = None
+_workspace_cache_guard = threading.Lock()
+
+
+def get_workspace_cache() -> BuildWorkspaceCache:
+    global _workspace_cache
+    with _workspace_cache_guard:
+        if _workspace_cache is None:
+            from config.config import CACHE_CONFIG
+            _workspace_cache = BuildWorkspaceCache(CACHE_CONFIG["workspace_dir"])
+        return _workspace_cache
@@ -0,0 +1,347 @@
+"""按提交保存的细粒度覆盖率
+
+扫描完成时从 jacoco.xml 流式解析一次，把 package / class / method / sourcefile 各级的 counter
+和逐行覆盖数据写入 SQLite，之后查询某次提交中某个包、类或文件的覆盖率不需要再解析 XML 或读取 HTML 报告。
+
+- coverage_nodes: 每个元素一行，六种 counter 各占 missed / covered 两列
+- coverage_lines: 每个源文件一行，行号和 mi/ci/mb/cb 以 array('I') 的字节形式按列保存
+- coverage_columns: 每次扫描每类元素（package / class / sourcefile）一行，元素键和各 counter 列
+  以数组整体保存，两次扫描对比时直接按列运算（见 coverage_delta）
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.jacoco_xml import COUNTER_TYPES, LINE_FIELDS, iter_coverage
+
+logger = logging.getLogger(__name__)
+
+NODE_KINDS = ("report", "group", "package", "class", "method", "sourcefile")
+
+_BATCH_SIZE = 2000
+# 写入中的扫描的 project（真实项目名不会为空），查询都按项目过滤，看不到写入中的扫描
+_PENDING_PROJECT = ""
+
+COUNTER_COLUMNS = [f"{t.lower()}_{k}" for t in COUNTER_TYPES for k in ("missed", "covered")]
+
+# 按列保存的元素类型
+COLUMN_KINDS = ("package", "class", "sourcefile")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS coverage_scans (
+    scan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    commit_id TEXT NOT NULL,
+    repo_url TEXT,
+    branch TEXT,
+    created_at REAL NOT NULL,
+    UNIQUE (project, commit_id)
+);
+CREATE TABLE IF NOT EXISTS coverage_nodes (
+    scan_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in COUNTER_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS idx_coverage_nodes ON coverage_nodes (scan_id, kind, name);
+CREATE TABLE IF NOT EXISTS coverage_lines (
+    scan_id INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    package TEXT NOT NULL,
+    sourcefile TEXT NOT NULL,
+    {", ".join(f"{f} BLOB NOT NULL" for f in LINE_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS idx_coverage_lines ON coverage_lines (scan_id, package, sourcefile);
+CREATE INDEX IF NOT EXISTS idx_coverage_lines_file ON coverage_lines (scan_id, sourcefile);
+CREATE TABLE IF NOT EXISTS coverage_columns (
+    scan_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    keys BLOB NOT NULL,
+    {", ".join(f"{c} BLOB NOT NULL" for c in COUNTER_COLUMNS)},
+    PRIMARY KEY (scan_id, kind)
+);
+"""
+
+
+def _counter_values(counters: Dict[str, Dict[str, int]]) -> List[int]:
+    values = []
+    for counter_type in COUNTER_TYPES:
+        entry = counters.get(counter_type)
+        values += [entry["missed"], entry["covered"]] if entry else [0, 0]
+    return values
+
+
+def _row_counters(row: sqlite3.Row) -> Dict[str, Dict[str, int]]:
+    counters = {}
+    for counter_type in COUNTER_TYPES:
+        missed = row[f"{counter_type.lower()}_missed"]
+        covered = row[f"{counter_type.lower()}_covered"]
+        if missed or covered:
+            counters[counter_type] = {"missed": missed, "covered": covered}
+    return counters
+
+
+def _decode_lines(row: sqlite3.Row) -> Dict[str, array]:
+    lines = {}
+    for field in LINE_FIELDS:
+        lines[field] = array("I")
+        lines[field].frombytes(row[field])
+    return lines
+
+
+def _node(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "kind": row["kind"],
+        "group": row["grp"],
+        "parent": row["parent"],
+        "name": row["name"],
+        "counters": _row_counters(row),
+    }
+
+
+class CoverageStore:
+    """SQLite 细粒度覆盖率存储"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- 写入 ----
+
+    def record_scan(
+        self,
+        project: str,
+        commit_id: str,
+        xml_path: str,
+        repo_url: str = None,
+        branch: str = None
+    ) -> int:
+        """解析 jacoco.xml 并写入覆盖率；同一项目同一提交的旧数据被替换。返回 scan_id
+
+        先以占位记录分配 scan_id，解析出的行按批在各自的短事务中写入，不在整个解析期间占用锁和写事务；
+        全部写完后在一个事务中把占位记录替换为正式记录，查询不会看到写了一半的扫描"""
+        commit_id = commit_id.lower()
+        node_sql = (
+            f"INSERT INTO coverage_nodes (scan_id, kind, grp, parent, name, {', '.join(COUNTER_COLUMNS)})"
+            f" VALUES ({', '.join('?' * (5 + len(COUNTER_COLUMNS)))})"
+        )
+        line_sql = (
+            f"INSERT INTO coverage_lines (scan_id, grp, package, sourcefile, {', '.join(LINE_FIELDS)})"
+            f" VALUES ({', '.join('?' * (4 + len(LINE_FIELDS)))})"
+        )
+        with self._lock, self._connect() as conn:
+            scan_id = conn.execute(
+                "INSERT INTO coverage_scans (project, commit_id, created_at) VALUES (?, ?, ?)",
+                (_PENDING_PROJECT, uuid.uuid4().hex, time.time())
+            ).lastrowid
+
+        def write(sql, rows):
+            if rows:
+                with self._lock, self._connect() as conn:
+                    conn.executemany(sql, rows)
+
+        try:
+            nodes, lines = [], []
+            columns = {kind: ([], [array("I") for _ in COUNTER_COLUMNS]) for kind in COLUMN_KINDS}
+            for record in iter_coverage(xml_path, NODE_KINDS, with_lines=True):
+                values = _counter_values(record.counters)
+                nodes.append([scan_id, record.kind, record.group, record.parent, record.name] + values)
+                if record.kind in columns:
+                    keys, arrays = columns[record.kind]
+                    keys.append(f"{record.group}\t{record.parent}\t{record.name}")
+                    for column, value in zip(arrays, values):
+                        column.append(value)
+                if record.lines:
+                    lines.append([scan_id, record.group, record.parent, record.name]
+                                 + [record.lines[f].tobytes() for f in LINE_FIELDS])
+                if len(nodes) >= _BATCH_SIZE:
+                    write(node_sql, nodes)
+                    nodes = []
+                if len(lines) >= _BATCH_SIZE:
+                    write(line_sql, lines)
+                    lines = []
+            write(node_sql, nodes)
+            write(line_sql, lines)
+            write(
+                f"INSERT INTO coverage_columns (scan_id, kind, keys, {', '.join(COUNTER_COLUMNS)})"
+                f" VALUES ({', '.join('?' * (3 + len(COUNTER_COLUMNS)))})",
+                [[scan_id, kind, "\n".join(keys).encode("utf-8")] + [a.tobytes() for a in arrays]
+                 for kind, (keys, arrays) in columns.items()]
+            )
+
+            with self._lock, self._connect() as conn:
+                previous = self._find_exact(conn, project, commit_id)
+                if previous is not None:
+                    conn.execute("DELETE FROM coverage_scans WHERE scan_id = ?", (previous,))
+                conn.execute(
+                    "UPDATE coverage_scans SET project = ?, commit_id = ?, repo_url = ?, branch = ?, created_at = ?"
+                    " WHERE scan_id = ?",
+                    (project, commit_id, repo_url, branch, time.time(), scan_id)
+                )
+        except BaseException:
+            self._delete_rows(scan_id)
+            raise
+        if previous is not None:
+            self._delete_rows(previous)
+        return scan_id
+
+    @staticmethod
+    def _find_exact(conn: sqlite3.Connection, project: str, commit_id: str) -> Optional[int]:
+        row = conn.execute(
+            "SELECT scan_id FROM coverage_scans WHERE project = ? AND commit_id = ?", (project, commit_id)
+        ).fetchone()
+        return row["scan_id"] if row else None
+
+    def _delete_rows(self, scan_id: int):
+        with self._lock, self._connect() as conn:
+            for table in ("coverage_nodes", "coverage_lines", "coverage_columns", "coverage_scans"):
+                conn.execute(f"DELETE FROM {table} WHERE scan_id = ?", (scan_id,))
+
+    def delete_scan(self, project: str, commit_id: str) -> bool:
+        """删除一次扫描的覆盖率（commit_id 为完整SHA）"""
+        with self._lock, self._connect() as conn:
+            scan_id = self._find_exact(conn, project, commit_id.lower())
+            if scan_id is not None:
+                # 先删除扫描记录，查询不再看到这次扫描
+                conn.execute("DELETE FROM coverage_scans WHERE scan_id = ?", (scan_id,))
+        if scan_id is None:
+            return False
+        self._delete_rows(scan_id)
+        return True
+
+    def delete_incomplete(self, max_age: float = 3600) -> int:
+        """删除写入中断（进程退出等）留下的占位扫描，返回删除数"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT scan_id FROM coverage_scans WHERE project = ? AND created_at < ?",
+                (_PENDING_PROJECT, time.time() - max_age)
+            ).fetchall()
+        for row in rows:
+            self._delete_rows(row["scan_id"])
+        return len(rows)
+
+    # ---- 查询 ----
+
+    def find_scan(self, project: str, commit_id: str) -> Optional[Dict[str, Any]]:
+        """按完整提交SHA或前缀查找扫描，前缀对应多个提交时取最新的一次"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM coverage_scans WHERE project = ? AND commit_id >= ? AND commit_id < ?"
+                " ORDER BY created_at DESC LIMIT 1",
+                (project, commit_id.lower(), commit_id.lower() + "~")
+            ).fetchone()
+        return dict(row) if row else None
+
+    def latest_scan(self, project: str, branches: List[str], exclude_commit: str = None) -> Optional[Dict[str, Any]]:
+        """指定分支上最近一次扫描（按 branches 的顺序依次查找）"""
+        with self._connect() as conn:
+            for branch in branches:
+                row = conn.execute(
+                    "SELECT * FROM coverage_scans WHERE project = ? AND branch = ? AND commit_id != ?"
+                    " ORDER BY created_at DESC LIMIT 1",
+                    (project, branch, (exclude_commit or "").lower())
+                ).fetchone()
+                if row is not None:
+                    return dict(row)
+        return None
+
+    def load_columns(self, scan_id: int, kind: str) -> Optional[Dict[str, Any]]:
+        """按列读取一类元素：{"keys": ["模块\t父元素\t名称", ...], counter列: array('I')}"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM coverage_columns WHERE scan_id = ? AND kind = ?", (scan_id, kind)
+            ).fetchone()
+        if row is None:
+            return None
+        columns: Dict[str, Any] = {"keys": row["keys"].decode("utf-8").split("\n") if row["keys"] else []}
+        for column in COUNTER_COLUMNS:
+            columns[column] = array("I")
+            columns[column].frombytes(row[column])
+        return columns
+
+    def get_node(self, scan_id: int, kind: str, name: str = None, group: str = None) -> Optional[Dict[str, Any]]:
+        """单个元素的覆盖率（report 不需要 name）"""
+        sql = "SELECT * FROM coverage_nodes WHERE scan_id = ? AND kind = ?"
+        params: List[Any] = [scan_id, kind]
+        if name is not None:
+            sql += " AND name = ?"
+            params.append(name)
+        if group is not None:
+            sql += " AND grp = ?"
+            params.append(group)
+        with self._connect() as conn:
+            row = conn.execute(sql + " LIMIT 1", params).fetchone()
+        return _node(row) if row else None
+
+    def list_nodes(self, scan_id: int, kind: str, parent: str = None) -> List[Dict[str, Any]]:
+        """某一类元素的覆盖率，可按所在的 group / package / class 过滤"""
+        sql = "SELECT * FROM coverage_nodes WHERE scan_id = ? AND kind = ?"
+        params: List[Any] = [scan_id, kind]
+        if parent is not None:
+            sql += " AND parent = ?"
+            params.append(parent)
+        with self._connect() as conn:
+            return [_node(row) for row in conn.execute(sql + " ORDER BY grp, parent, name", params)]
+
+    def get_lines(
+        self,
+        scan_id: int,
+        package: str,
+        sourcefile: str,
+        group: str = None
+    ) -> Optional[Dict[str, array]]:
+        """源文件的逐行数据 {nr/mi/ci/mb/cb: array('I')}，按行号升序"""
+        sql = "SELECT * FROM coverage_lines WHERE scan_id = ? AND package = ? AND sourcefile = ?"
+        params: List[Any] = [scan_id, package, sourcefile]
+        if group is not None:
+            sql += " AND grp = ?"
+            params.append(group)
+        with self._connect() as conn:
+            row = conn.execute(sql + " LIMIT 1", params).fetchone()
+        return _decode_lines(row) if row else None
+
+    def find_sourcefiles(self, scan_id: int, sourcefile: str) -> List[Dict[str, str]]:
+        """同名源文件所在的模块和包"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT grp, package, sourcefile FROM coverage_lines WHERE scan_id = ? AND sourcefile = ?",
+                (scan_id, sourcefile)
+            ).fetchall()
+        return [{"group": row["grp"], "package": row["package"], "sourcefile": row["sourcefile"]} for row in rows]
+
+    def iter_lines(self, scan_id: int) -> Iterator[Dict[str, Any]]:
+        """逐个源文件产出逐行数据"""
+        with self._connect() as conn:
+            for row in conn.execute("SELECT * FROM coverage_lines WHERE scan_id = ?", (scan_id,)):
+                yield {"group": row["grp"], "package": row["package"], "sourcefile": row["sourcefile"],
+                       "lines": _decode_lines(row)}
+
+
+_coverage_store: Optional[CoverageStore] = None
+_coverage_store_guard = threading.Lock()
+
+
+def get_coverage_store() -> CoverageStore:
+    global _coverage_store
+    with _coverage_store_guard:
+        if _coverage_store is None:
+            from config.config import REPORT_CONFIG
+            _coverage_store = CoverageStore(REPORT_CONFIG["coverage_db"])
+        return _coverage_store
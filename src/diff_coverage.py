@@ -0,0 +1,125 @@
+"""推送变更的覆盖率（diff coverage）
+
+对 webhook 中的 before..after 执行 `git diff -U0`，得到每个 Java 文件新增/修改的行，
+再与覆盖率存储中该文件的逐行数据求交集：只统计有字节码的行，ci > 0 视为已覆盖（与 JaCoCo 的 LINE 计数一致）。
+逐行数据按行号升序保存，每个变更区间用二分查找定位，即使是很大的 diff 也只需几毫秒。
+"""
+
+import re
+import bisect
+import logging
+import posixpath
+import subprocess
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_NULL_COMMIT = re.compile(r"^0+$")
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# 卡片和结果中每个文件最多列出的未覆盖行
+MAX_UNCOVERED_LINES = 50
+
+CommandRunner = Callable[..., subprocess.CompletedProcess]
+
+
+def parse_unified_diff(diff_text: str) -> Dict[str, List[Tuple[int, int]]]:
+    """解析 -U0 的 diff，返回 {新文件路径: [(起始行, 行数), ...]}，纯删除的区间不计"""
+    changed: Dict[str, List[Tuple[int, int]]] = {}
+    current = None
+    for line in diff_text.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:].strip()
+            current = None if path == "/dev/null" else path[2:] if path.startswith("b/") else path
+            if current is not None:
+                changed.setdefault(current, [])
+        elif current is not None and line.startswith("@@"):
+            match = _HUNK_HEADER.match(line)
+            if match:
+                start = int(match.group(1))
+                count = 1 if match.group(2) is None else int(match.group(2))
+                if count:
+                    changed[current].append((start, count))
+    return {path: ranges for path, ranges in changed.items() if ranges}
+
+
+def changed_lines(
+    git_dir: str,
+    before: str,
+    after: str,
+    run: CommandRunner,
+    timeout: int = 120
+) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+    """before..after 中 Java 文件的新增/修改行；before 不可用（新分支等）时返回 None"""
+    if not before or _NULL_COMMIT.match(before):
+        return None
+    result = run(
+        ["git", "--git-dir", git_dir, "diff", "-U0", "--no-color", "--no-ext-diff", "-M",
+         "--diff-filter=AMR", before, after, "--", "*.java"],
+        timeout=timeout
+    )
+    if result.returncode != 0:
+        logger.warning(f"git diff {before[:8]}..{after[:8]} 失败: {result.stderr.strip()}")
+        return None
+    return parse_unified_diff(result.stdout)
+
+
+def _match_sourcefile(path: str, candidates: List[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """在同名源文件中找到与路径对应的一个：目录以包路径结尾，多模块时再按模块前缀区分"""
+    directory = posixpath.dirname(path)
+    matches = [
+        c for c in candidates
+        if directory == c["package"] or directory.endswith("/" + c["package"]) or not c["package"]
+    ]
+    if len(matches) > 1:
+        matches = [c for c in matches if c["group"] and path.startswith(c["group"] + "/")] or matches
+    return matches[0] if matches else None
+
+
+def compute_diff_coverage(store, scan_id: int, changes: Dict[str, List[Tuple[int, int]]]) -> Dict[str, Any]:
+    """变更行与逐行覆盖率求交集"""
+    files = []
+    total_changed = total_executable = total_covered = 0
+    for path in sorted(changes):
+        ranges = changes[path]
+        total_changed += sum(count for _, count in ranges)
+        source = _match_sourcefile(path, store.find_sourcefiles(scan_id, posixpath.basename(path)))
+        if source is None:
+            # 测试代码、未参与构建的模块等没有覆盖率数据
+            continue
+        lines = store.get_lines(scan_id, source["package"], source["sourcefile"], source["group"])
+        if lines is None:
+            continue
+        numbers, covered_instructions = lines["nr"], lines["ci"]
+
+        executable = covered = 0
+        uncovered: List[int] = []
+        for start, count in ranges:
+            index = bisect.bisect_left(numbers, start)
+            end = start + count
+            while index < len(numbers) and numbers[index] < end:
+                executable += 1
+                if covered_instructions[index] > 0:
+                    covered += 1
+                elif len(uncovered) < MAX_UNCOVERED_LINES:
+                    uncovered.append(numbers[index])
+                index += 1
+        if not executable:
+            continue
+        files.append({
+            "path": path,
+            "lines_executable": executable,
+            "lines_covered": covered,
+            "coverage": round(covered / executable * 100, 2),
+            "uncovered_lines": uncovered,
+        })
+        total_executable += executable
+        total_covered += covered
+
+    return {
+        "lines_changed": total_changed,
+        "lines_executable": total_executable,
+        "lines_covered": total_covered,
+        "coverage": round(total_covered / total_executable * 100, 2) if total_executable else None,
+        "files": files,
+    }
@@ -0,0 +1,209 @@
+"""测试影响分析：只运行受本次提交影响的测试
+
+维护一个按仓库分支保存的 Java 源码静态引用索引（每个源文件的包名、import 和引用的类名），
+据此计算 测试类 -> 生产类 的映射。推送后把变更的生产类沿反向引用关系扩展到所有间接依赖它们的类，
+再选出引用了这些类的测试。未运行的测试的覆盖率来自基线执行数据：构建前把基线 jacoco.exec
+放回各模块的 target/，JaCoCo agent 以追加方式写入本次的执行数据，报告即为两者的合并结果；
+构建后再与原基线按探针合并（src.jacoco_exec）作为新的基线。
+"""
+
+import os
+import re
+import json
+import shutil
+import logging
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAIN_SOURCE_ROOT = "src/main/java/"
+TEST_SOURCE_ROOT = "src/test/java/"
+
+_COMMENT_PATTERN = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+_PACKAGE_PATTERN = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+_IMPORT_PATTERN = re.compile(r"^\s*import\s+(static\s+)?([\w.]+(?:\.\*)?)\s*;", re.MULTILINE)
+_TYPE_NAME_PATTERN = re.compile(r"\b[A-Z][A-Za-z0-9_]*\b")
+
+
+def parse_java_source(text: str) -> Dict[str, Any]:
+    """提取包名、import 和代码中出现的类型名"""
+    code = _STRING_PATTERN.sub('""', _COMMENT_PATTERN.sub(" ", text))
+    package_match = _PACKAGE_PATTERN.search(code)
+    imports = []
+    for is_static, name in _IMPORT_PATTERN.findall(code):
+        if is_static:
+            # import static a.b.C.method / a.b.C.* 引用的是类 a.b.C
+            name = name.rsplit(".", 1)[0]
+        imports.append(name)
+    body = _IMPORT_PATTERN.sub(" ", _PACKAGE_PATTERN.sub(" ", code))
+    return {
+        "package": package_match.group(1) if package_match else "",
+        "imports": sorted(set(imports)),
+        "types": sorted(set(_TYPE_NAME_PATTERN.findall(body))),
+    }
+
+
+def source_class(path: str) -> Optional[Tuple[str, str, str]]:
+    """源文件路径 -> (模块路径, main/test, 类全名)；不是 Java 源文件时返回 None"""
+    if not path.endswith(".java"):
+        return None
+    for kind, root in (("main", MAIN_SOURCE_ROOT), ("test", TEST_SOURCE_ROOT)):
+        index = path.find(root)
+        if index == 0 or (index > 0 and path[index - 1] == "/"):
+            module = path[:index].rstrip("/")
+            return module, kind, path[index + len(root):-len(".java")].replace("/", ".")
+    return None
+
+
+def classify_changes(changed_files: Iterable[str]) -> Tuple[Set[str], Set[str], List[str]]:
+    """把变更文件分为 (变更的生产类, 变更的测试类, 无法分析的文件)。
+    资源文件等 src/ 下的非 Java 文件可能影响任意测试，归为无法分析；src/ 之外的文件（文档等）忽略"""
+    main_classes: Set[str] = set()
+    test_classes: Set[str] = set()
+    unknown: List[str] = []
+    for path in changed_files:
+        parsed = source_class(path)
+        if parsed:
+            (main_classes if parsed[1] == "main" else test_classes).add(parsed[2])
+        elif path.startswith("src/") or "/src/" in path:
+            unknown.append(path)
+    return main_classes, test_classes, unknown
+
+
+class ImpactIndex:
+    """保存在工作区旁边的静态引用索引和基线执行数据"""
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.index_path = os.path.join(state_dir, "index.json")
+        self.baseline_dir = os.path.join(state_dir, "baseline")
+        os.makedirs(state_dir, exist_ok=True)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except (OSError, ValueError):
+            self.files = {}
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _index_file(self, repo_dir: str, path: str):
+        parsed = source_class(path)
+        full_path = os.path.join(repo_dir, path)
+        if not parsed or not os.path.isfile(full_path):
+            self.files.pop(path, None)
+            return
+        with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+            entry = parse_java_source(f.read())
+        entry.update({"module": parsed[0], "kind": parsed[1], "class": parsed[2]})
+        self.files[path] = entry
+
+    def rebuild(self, repo_dir: str):
+        self.files = {}
+        for root, dirs, files in os.walk(repo_dir):
+            dirs[:] = [d for d in dirs if d not in (".git", "target", "node_modules")]
+            for name in files:
+                if name.endswith(".java"):
+                    path = os.path.relpath(os.path.join(root, name), repo_dir).replace(os.sep, "/")
+                    self._index_file(repo_dir, path)
+
+    def update(self, repo_dir: str, changed_files: Iterable[str]):
+        for path in changed_files:
+            self._index_file(repo_dir, path)
+
+    def _references(self, entry: Dict[str, Any], main_classes: Set[str]) -> Set[str]:
+        refs = {name for name in entry["imports"] if name in main_classes}
+        packages = [entry["package"]] + [name[:-2] for name in entry["imports"] if name.endswith(".*")]
+        for type_name in entry["types"]:
+            for package in packages:
+                candidate = f"{package}.{type_name}" if package else type_name
+                if candidate in main_classes:
+                    refs.add(candidate)
+        refs.discard(entry["class"])
+        return refs
+
+    def select_tests(self, changed_classes: Set[str], changed_tests: Set[str]) -> Set[str]:
+        """返回引用了变更类（含间接依赖变更类的生产类）的测试类，以及本身有变更的测试类"""
+        main_entries = [e for e in self.files.values() if e["kind"] == "main"]
+        main_classes = {e["class"] for e in main_entries}
+
+        dependents: Dict[str, Set[str]] = {}
+        for entry in main_entries:
+            for ref in self._references(entry, main_classes):
+                dependents.setdefault(ref, set()).add(entry["class"])
+
+        affected = set(changed_classes)
+        pending = list(changed_classes)
+        while pending:
+            for dependent in dependents.get(pending.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+
+        selected = set(changed_tests)
+        for entry in self.files.values():
+            if entry["kind"] == "test" and self._references(entry, main_classes) & affected:
+                selected.add(entry["class"])
+        # 只保留仍然存在的测试类（被删除的测试类无需运行）
+        test_classes = {e["class"] for e in self.files.values() if e["kind"] == "test"}
+        return selected & test_classes
+
+    def _exec_paths(self, repo_dir: str, modules: List[str]) -> List[Tuple[str, str]]:
+        """(工作区中的 jacoco.exec, 基线副本) 列表"""
+        pairs = []
+        for module in [""] + list(modules):
+            name = module.replace("/", "__") or "_root"
+            pairs.append((
+                os.path.join(repo_dir, *[p for p in module.split("/") if p], "target", "jacoco.exec"),
+                os.path.join(self.baseline_dir, name, "jacoco.exec"),
+            ))
+        return pairs
+
+    def has_baseline(self) -> bool:
+        return os.path.isdir(self.baseline_dir) and bool(os.listdir(self.baseline_dir))
+
+    def restore_baseline(self, repo_dir: str, modules: List[str]) -> int:
+        """把基线执行数据放回各模块 target/，本次测试的执行数据将追加在其后"""
+        restored = 0
+        for exec_path, baseline_path in self._exec_paths(repo_dir, modules):
+            if os.path.isfile(baseline_path):
+                os.makedirs(os.path.dirname(exec_path), exist_ok=True)
+                shutil.copy2(baseline_path, exec_path)
+                restored += 1
+        return restored
+
+    def save_baseline(self, repo_dir: str, modules: List[str], merge: bool = False) -> int:
+        """保存各模块的执行数据作为新的基线。
+        merge 时与原基线按探针合并，即使项目把 agent 配置为覆盖写入，未运行测试的覆盖率也不会丢失"""
+        from src.jacoco_exec import ExecFormatError, merge_exec_files
+
+        if not merge:
+            shutil.rmtree(self.baseline_dir, ignore_errors=True)
+        saved = 0
+        for exec_path, baseline_path in self._exec_paths(repo_dir, modules):
+            if not os.path.isfile(exec_path):
+                continue
+            os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+            if merge and os.path.isfile(baseline_path):
+                try:
+                    merge_exec_files([baseline_path, exec_path], baseline_path)
+                    saved += 1
+                    continue
+                except (ExecFormatError, OSError) as e:
+                    logger.warning(f"合并基线执行数据失败，直接覆盖: {exec_path}: {str(e)}")
+            shutil.copy2(exec_path, baseline_path)
+            saved += 1
+        return saved
+
+    def clear(self):
+        self.files = {}
+        shutil.rmtree(self.baseline_dir, ignore_errors=True)
+        try:
+            os.remove(self.index_path)
+        except OSError:
+            pass
@@ -0,0 +1,268 @@
+"""JaCoCo 执行数据（jacoco.exec）的读写与合并
+
+纯 Python 实现 JaCoCo 执行数据格式（格式版本 0x1007，JaCoCo 0.7.5 及以上）：
+    0x01 文件头:   magic 0xC0C0 (char) + 格式版本 (char)
+    0x10 会话信息: id (UTF) + 开始时间 (long) + dump 时间 (long)
+    0x11 执行数据: 类ID (long) + 类名 (UTF) + 探针数组 (变长整数长度 + 按位打包的 boolean，低位在前)
+UTF 为 Java DataOutput.writeUTF 的 modified UTF-8。agent 以追加方式写入时文件中会出现多个文件头。
+
+探针以打包后的字节保存，合并时对同一个类的探针按位或；安装了 NumPy 时使用向量化运算。
+合并分片、增量运行或多个测试阶段的执行数据不需要再启动 JVM。
+"""
+
+import os
+import sys
+import struct
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时使用整数按位运算
+    np = None
+
+BLOCK_HEADER = 0x01
+BLOCK_SESSIONINFO = 0x10
+BLOCK_EXECUTIONDATA = 0x11
+
+MAGIC_NUMBER = 0xC0C0
+FORMAT_VERSION = 0x1007
+
+_LONG = struct.Struct(">q")
+_CHAR = struct.Struct(">H")
+
+
+class ExecFormatError(Exception):
+    """执行数据格式错误"""
+
+
+class SessionInfo(NamedTuple):
+    id: str
+    start: int
+    dump: int
+
+
+class ClassExecution:
+    """一个类的执行数据"""
+
+    __slots__ = ("id", "name", "probe_count", "probe_bytes")
+
+    def __init__(self, class_id: int, name: str, probe_count: int, probe_bytes: bytes):
+        self.id = class_id
+        self.name = name
+        self.probe_count = probe_count
+        self.probe_bytes = probe_bytes
+
+    @classmethod
+    def from_probes(cls, class_id: int, name: str, probes: Iterable[bool]) -> "ClassExecution":
+        probes = list(probes)
+        packed = bytearray((len(probes) + 7) // 8)
+        for index, hit in enumerate(probes):
+            if hit:
+                packed[index >> 3] |= 1 << (index & 7)
+        return cls(class_id, name, len(probes), bytes(packed))
+
+    @property
+    def probes(self) -> List[bool]:
+        return [bool(self.probe_bytes[i >> 3] & (1 << (i & 7))) for i in range(self.probe_count)]
+
+    @property
+    def covered_count(self) -> int:
+        return sum(bin(b).count("1") for b in self.probe_bytes)
+
+    def merge(self, other: "ClassExecution"):
+        """按位或合并另一份同一个类的执行数据"""
+        if other.name != self.name:
+            raise ExecFormatError(f"类ID {self.id:016x} 对应不同的类名: {self.name} / {other.name}")
+        if other.probe_count != self.probe_count:
+            raise ExecFormatError(f"类 {self.name} 的探针数量不一致: {self.probe_count} / {other.probe_count}")
+        self.probe_bytes = _or_bytes(self.probe_bytes, other.probe_bytes)
+
+
+def _or_bytes(left: bytes, right: bytes) -> bytes:
+    if np is not None:
+        return np.bitwise_or(np.frombuffer(left, np.uint8), np.frombuffer(right, np.uint8)).tobytes()
+    length = len(left)
+    return (int.from_bytes(left, "little") | int.from_bytes(right, "little")).to_bytes(length, "little")
+
+
+class ExecutionData:
+    """一个或多个 exec 文件的内容：会话列表 + 按类ID索引的执行数据"""
+
+    def __init__(self):
+        self.sessions: List[SessionInfo] = []
+        self.classes: Dict[int, ClassExecution] = {}
+        self._session_set = set()
+
+    def add_session(self, session: SessionInfo):
+        # 反复合并同一份基线时不重复记录会话
+        if session not in self._session_set:
+            self._session_set.add(session)
+            self.sessions.append(session)
+
+    def add_class(self, execution: ClassExecution):
+        existing = self.classes.get(execution.id)
+        if existing is None:
+            self.classes[execution.id] = ClassExecution(
+                execution.id, execution.name, execution.probe_count, execution.probe_bytes
+            )
+        else:
+            existing.merge(execution)
+
+    def merge(self, other: "ExecutionData"):
+        for session in other.sessions:
+            self.add_session(session)
+        for execution in other.classes.values():
+            self.add_class(execution)
+
+
+# ---- 读取 ----
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ExecFormatError("执行数据文件不完整")
+    return data
+
+
+def _read_utf(stream: BinaryIO) -> str:
+    length = _CHAR.unpack(_read_exact(stream, 2))[0]
+    raw = _read_exact(stream, length)
+    try:
+        return raw.decode("ascii")
+    except UnicodeDecodeError:
+        pass
+    # modified UTF-8 把补充平面字符编码为两个代理项，先按代理项解码再组合
+    text = raw.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass")
+    return text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+
+def _read_varint(stream: BinaryIO) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = _read_exact(stream, 1)[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+        shift += 7
+
+
+def iter_blocks(stream: BinaryIO):
+    """逐块读取执行数据，产出 SessionInfo 或 ClassExecution"""
+    first = True
+    while True:
+        block_type = stream.read(1)
+        if not block_type:
+            return
+        block_type = block_type[0]
+        if block_type == BLOCK_HEADER:
+            magic, version = struct.unpack(">HH", _read_exact(stream, 4))
+            if magic != MAGIC_NUMBER:
+                raise ExecFormatError("不是 JaCoCo 执行数据文件")
+            if version != FORMAT_VERSION:
+                raise ExecFormatError(f"不支持的执行数据格式版本: 0x{version:04x}")
+        elif first:
+            raise ExecFormatError("执行数据文件缺少文件头")
+        elif block_type == BLOCK_SESSIONINFO:
+            session_id = _read_utf(stream)
+            start, dump = struct.unpack(">qq", _read_exact(stream, 16))
+            yield SessionInfo(session_id, start, dump)
+        elif block_type == BLOCK_EXECUTIONDATA:
+            class_id = _LONG.unpack(_read_exact(stream, 8))[0] & 0xFFFFFFFFFFFFFFFF
+            name = _read_utf(stream)
+            probe_count = _read_varint(stream)
+            probe_bytes = _read_exact(stream, (probe_count + 7) // 8)
+            yield ClassExecution(class_id, name, probe_count, probe_bytes)
+        else:
+            raise ExecFormatError(f"未知的数据块类型: 0x{block_type:02x}")
+        first = False
+
+
+def read_exec(source: Union[str, BinaryIO]) -> ExecutionData:
+    """读取 exec 文件（同一个类出现多次时合并探针）"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return read_exec(f)
+    data = ExecutionData()
+    for block in iter_blocks(source):
+        if isinstance(block, SessionInfo):
+            data.add_session(block)
+        else:
+            data.add_class(block)
+    return data
+
+
+# ---- 写入 ----
+
+def _write_utf(stream: BinaryIO, text: str):
+    if any(ord(c) > 0xFFFF for c in text):
+        # 补充平面字符拆成两个代理项分别编码
+        units = text.encode("utf-16-be")
+        text = "".join(chr(int.from_bytes(units[i:i + 2], "big")) for i in range(0, len(units), 2))
+    encoded = text.encode("utf-8", "surrogatepass").replace(b"\x00", b"\xc0\x80")
+    if len(encoded) > 0xFFFF:
+        raise ExecFormatError("字符串过长")
+    stream.write(_CHAR.pack(len(encoded)))
+    stream.write(encoded)
+
+
+def _write_varint(stream: BinaryIO, value: int):
+    while value & ~0x7F:
+        stream.write(bytes((0x80 | (value & 0x7F),)))
+        value >>= 7
+    stream.write(bytes((value,)))
+
+
+def write_exec(dest: Union[str, BinaryIO], data: ExecutionData):
+    """写出 exec 文件：文件头、全部会话、按类ID排序的执行数据"""
+    if isinstance(dest, (str, os.PathLike)):
+        tmp_path = f"{dest}.tmp"
+        with open(tmp_path, "wb") as f:
+            write_exec(f, data)
+        os.replace(tmp_path, dest)
+        return
+
+    dest.write(struct.pack(">BHH", BLOCK_HEADER, MAGIC_NUMBER, FORMAT_VERSION))
+    for session in data.sessions:
+        dest.write(bytes((BLOCK_SESSIONINFO,)))
+        _write_utf(dest, session.id)
+        dest.write(struct.pack(">qq", session.start, session.dump))
+    for class_id in sorted(data.classes):
+        execution = data.classes[class_id]
+        dest.write(bytes((BLOCK_EXECUTIONDATA,)))
+        dest.write(_LONG.pack(class_id - (1 << 64) if class_id >= 1 << 63 else class_id))
+        _write_utf(dest, execution.name)
+        _write_varint(dest, execution.probe_count)
+        dest.write(execution.probe_bytes)
+
+
+def merge_exec_files(sources: Iterable[Union[str, BinaryIO]], dest: Union[str, BinaryIO] = None) -> ExecutionData:
+    """合并多个 exec 文件；指定 dest 时写出合并结果"""
+    merged = ExecutionData()
+    for source in sources:
+        merged.merge(read_exec(source))
+    if dest is not None:
+        write_exec(dest, merged)
+    return merged
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行: python -m src.jacoco_exec merge <输出> <输入>... | info <文件>..."""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) >= 3 and argv[0] == "merge":
+        merged = merge_exec_files(argv[2:], argv[1])
+        print(f"合并 {len(argv) - 2} 个文件: {len(merged.sessions)} 个会话, {len(merged.classes)} 个类 -> {argv[1]}")
+        return 0
+    if len(argv) >= 2 and argv[0] == "info":
+        for path in argv[1:]:
+            data = read_exec(path)
+            probes = sum(e.probe_count for e in data.classes.values())
+            covered = sum(e.covered_count for e in data.classes.values())
+            print(f"{path}: {len(data.sessions)} 个会话, {len(data.classes)} 个类, 探针覆盖 {covered}/{probes}")
+        return 0
+    print(main.__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,104 @@
 import os
 import logging
 import subprocess
-import json
-import xml.etree.ElementTree as ET
-from typing import Dict, Any
+import shutil
+import threading
+import contextlib
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.jacoco_xml import coverage_percentages, read_report_counters
+from src.report_summary import load_summary
+from src.report_publish import clone_file, transfer_tree
 
 logger = logging.getLogger(__name__)
 
+# 正在执行的扫描子进程及已请求取消的扫描（按 request_id 索引）
+_active_processes: Dict[str, subprocess.Popen] = {}
+_cancelled_requests = set()
+_process_lock = threading.Lock()
+
+
+class ScanCancelledError(Exception):
+    """扫描被取消"""
+
+
+def cancel_scan(request_id: str) -> bool:
+    """取消扫描：终止当前正在执行的子进程，后续命令也不会再启动"""
+    with _process_lock:
+        _cancelled_requests.add(request_id)
+        process = _active_processes.get(request_id)
+    if process is not None:
+        logger.info(f"[{request_id}] 终止扫描进程 (pid={process.pid})")
+        process.terminate()
+    return process is not None
+
+
+def clear_cancelled(request_id: str):
+    """任务结束后清除取消标记（任务结束后才收到的取消请求也会留下标记）"""
+    with _process_lock:
+        _cancelled_requests.discard(request_id)
+
+
+def _run_command(
+    command: List[str],
+    request_id: str,
+    cwd: str = None,
+    timeout: int = None,
+    env: Dict[str, str] = None
+) -> subprocess.CompletedProcess:
+    """执行扫描命令，支持通过 cancel_scan 中途终止"""
+    with _process_lock:
+        if request_id in _cancelled_requests:
+            raise ScanCancelledError("扫描已取消")
+        process = subprocess.Popen(
+            command, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        _active_processes[request_id] = process
+
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    finally:
+        with _process_lock:
+            _active_processes.pop(request_id, None)
+
+    if request_id in _cancelled_requests:
+        raise ScanCancelledError("扫描已取消")
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
 def run_jacoco_scan_docker(
     repo_url: str,
     commit_id: str,
     branch_name: str,
     reports_dir: str,
     service_config: Dict[str, Any],
-    request_id: str
+    request_id: str,
+    before_commit: str = None
 ) -> Dict[str, Any]:
-    if _check_docker_available(request_id):
-        try:
-            logger.info(f"[{request_id}] 使用Docker扫描")
-            scan_result = _run_docker_scan(repo_url, commit_id, branch_name, reports_dir, service_config, request_id)
-            scan_result["notification_handled_by_caller"] = True
-            return scan_result
-        except Exception as e:
-            logger.warning(f"[{request_id}] Docker扫描失败，回退到本地扫描: {str(e)}")
+    """执行扫描；before_commit 为推送前的提交，用于计算变更行（结果在 scan_result["changed_lines"]）"""
+    try:
+        if _check_docker_available(request_id):
+            try:
+                logger.info(f"[{request_id}] 使用Docker扫描")
+                scan_result = _run_docker_scan(repo_url, commit_id, branch_name, reports_dir, service_config, request_id)
+                scan_result["notification_handled_by_caller"] = True
+                return scan_result
+            except ScanCancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[{request_id}] Docker扫描失败，回退到本地扫描: {str(e)}")
 
-    logger.info(f"[{request_id}] 使用本地扫描")
-    scan_result = _run_local_scan(repo_url, commit_id, branch_name, reports_dir, service_config, request_id)
-    scan_result["notification_handled_by_caller"] = True
-    return scan_result
+        logger.info(f"[{request_id}] 使用本地扫描")
+        scan_result = _run_local_scan(
+            repo_url, commit_id, branch_name, reports_dir, service_config, request_id, before_commit
+        )
+        scan_result["notification_handled_by_caller"] = True
+        return scan_result
+    finally:
+        clear_cancelled(request_id)
 
 def _check_docker_available(request_id: str) -> bool:
     try:
@@ -66,16 +137,60 @@ def _run_docker_scan(
 
     docker_cmd = [
         'docker', 'run', '--rm',
-        '-v', f'{abs_reports_dir}:/app/reports',
-        'jacoco-scanner:latest',
+        '-v', f'{abs_reports_dir}:/app/reports'
+    ]
+    scan_args = [
         '--repo-url', repo_url,
         '--commit-id', commit_id,
         '--branch', branch_name,
         '--service-name', service_name
     ]
 
+    # 在宿主机更新仓库镜像，容器内从只读挂载的镜像检出，无需重新下载历史
+    if service_config.get('checkout_mode') == 'mirror':
+        try:
+            from src.repo_cache import get_repo_cache
+            mirror = get_repo_cache().update(
+                repo_url, commit_id, request_id,
+                lambda command, cwd=None, timeout=None: _run_command(command, request_id, cwd=cwd, timeout=timeout)
+            )
+            docker_cmd += ['-v', f'{mirror}:/app/mirror:ro']
+            scan_args += ['--mirror-dir', '/app/mirror']
+        except ScanCancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[{request_id}] 仓库镜像更新失败，容器内完整克隆: {str(e)}")
+    elif service_config.get('checkout_mode') == 'shallow':
+        scan_args += ['--checkout-mode', 'shallow']
+
+    maven_extra_args = []
+    maven_cache = None
+    if service_config.get('shared_maven_cache', True):
+        from src.maven_cache import get_maven_cache, CONCURRENT_RESOLVER_ARGS
+        maven_cache = get_maven_cache()
+        docker_cmd += ['-v', f'{maven_cache.repository_dir}:/root/.m2/repository']
+        maven_extra_args += CONCURRENT_RESOLVER_ARGS
+    maven_extra_args += _maven_parallel_args(service_config)
+    if maven_extra_args:
+        docker_cmd += ['-e', f"MAVEN_EXTRA_ARGS={' '.join(maven_extra_args)}"]
+    surefire_settings = _surefire_settings(service_config)
+    if surefire_settings:
+        docker_cmd += ['-e', "SUREFIRE_SETTINGS=" + ' '.join(f"{k}={v}" for k, v in surefire_settings.items())]
+    from config.config import REPORT_CONFIG
+    if REPORT_CONFIG["lazy_html"]:
+        docker_cmd += ['-e', 'LAZY_HTML=true']
+
+    docker_cmd += ['jacoco-scanner:latest'] + scan_args
+    timeout = service_config.get('scan_timeout', 1800)
+
     try:
-        result = subprocess.run(docker_cmd, capture_output=True, text=True, timeout=300)
+        if maven_cache:
+            with maven_cache.in_use():
+                result = _run_command(docker_cmd, request_id, timeout=timeout)
+            maven_cache.record_build(result.stdout, request_id)
+            maven_cache.prune()
+        else:
+            result = _run_command(docker_cmd, request_id, timeout=timeout)
 
         if result.returncode == 0:
             return {"status": "completed", "scan_method": "docker"}
@@ -83,15 +198,12 @@ def _run_docker_scan(
             raise Exception(f"Docker扫描失败: {result.stderr}")
 
     except subprocess.TimeoutExpired:
-        raise Exception("Docker扫描超时")
-    except Exception as e:
-        raise e
+        raise Exception(f"Docker扫描超时（{timeout}秒）")
 
 def parse_jacoco_reports(reports_dir: str, request_id: str) -> Dict[str, Any]:
     logger.info(f"[{request_id}] Parsing JaCoCo reports: {reports_dir}")
 
     jacoco_xml_path = os.path.join(reports_dir, "jacoco.xml")
-    summary_json_path = os.path.join(reports_dir, "summary.json")
     html_report_dir = os.path.join(reports_dir, "html")
 
     result = {
@@ -107,8 +219,15 @@ def parse_jacoco_reports(reports_dir: str, request_id: str) -> Dict[str, Any]:
         result["reports_available"] = True
 
         try:
-            coverage_data = parse_jacoco_xml_file(jacoco_xml_path, request_id)
+            # 扫描时生成一次 summary.json，之后（包括同一扫描的再次解析）直接读取摘要
+            summary = load_summary(reports_dir, jacoco_xml_path)
+            if summary is None:
+                raise Exception("无法生成报告摘要")
+            coverage_data = summary["coverage"]
             result.update(coverage_data)
+            result["summary_available"] = True
+            logger.info(f"[{request_id}] 行覆盖率: {coverage_data['line_coverage']:.2f}%, "
+                        f"分支覆盖率: {coverage_data['branch_coverage']:.2f}%")
 
             result["coverage_summary"] = {
                 "instruction_coverage": coverage_data.get('instruction_coverage', 0),
@@ -128,16 +247,10 @@ def parse_jacoco_reports(reports_dir: str, request_id: str) -> Dict[str, Any]:
         logger.info(f"[{request_id}] Found JaCoCo HTML report")
         result["html_report_available"] = True
         result["html_report_path"] = html_report_dir
-
-    if os.path.exists(summary_json_path):
-        try:
-            with open(summary_json_path, 'r') as f:
-                summary_data = json.load(f)
-            result["coverage_summary"] = summary_data
-            result["summary_available"] = True
-            logger.info(f"[{request_id}] Loaded coverage summary from JSON")
-        except Exception as e:
-            logger.warning(f"[{request_id}] Failed to load summary JSON: {str(e)}")
+    elif os.path.exists(os.path.join(reports_dir, "_data", "jacoco.xml")):
+        # 按需生成：保存了报告数据，首次访问时生成 HTML
+        result["html_report_available"] = True
+        result["html_report_path"] = os.path.join(reports_dir, "_data")
 
     return result
 
@@ -145,59 +258,14 @@ def parse_jacoco_xml_file(xml_path: str, request_id: str) -> Dict[str, Any]:
     try:
         logger.info(f"[{request_id}] Parsing JaCoCo XML file: {xml_path}")
 
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-
-        counters = {
-            "INSTRUCTION": {"missed": 0, "covered": 0},
-            "BRANCH": {"missed": 0, "covered": 0},
-            "LINE": {"missed": 0, "covered": 0},
-            "COMPLEXITY": {"missed": 0, "covered": 0},
-            "METHOD": {"missed": 0, "covered": 0},
-            "CLASS": {"missed": 0, "covered": 0}
-        }
-
-        for counter in root.findall(".//counter"):
-            counter_type = counter.get("type")
-            missed = int(counter.get("missed", 0))
-            covered = int(counter.get("covered", 0))
-
-            if counter_type in counters:
-                counters[counter_type]["missed"] += missed
-                counters[counter_type]["covered"] += covered
-
-        def calculate_coverage(counter_data):
-            total = counter_data["missed"] + counter_data["covered"]
-            return (counter_data["covered"] / total * 100) if total > 0 else 0
-
-        instruction_coverage = calculate_coverage(counters["INSTRUCTION"])
-        branch_coverage = calculate_coverage(counters["BRANCH"])
-        line_coverage = calculate_coverage(counters["LINE"])
-        complexity_coverage = calculate_coverage(counters["COMPLEXITY"])
-        method_coverage = calculate_coverage(counters["METHOD"])
-        class_coverage = calculate_coverage(counters["CLASS"])
-
-        result = {
-            "coverage_percentage": round(line_coverage, 2),
-            "instruction_coverage": round(instruction_coverage, 2),
-            "branch_coverage": round(branch_coverage, 2),
-            "line_coverage": round(line_coverage, 2),
-            "complexity_coverage": round(complexity_coverage, 2),
-            "method_coverage": round(method_coverage, 2),
-            "class_coverage": round(class_coverage, 2),
-            "instructions_covered": counters["INSTRUCTION"]["covered"],
-            "instructions_total": counters["INSTRUCTION"]["missed"] + counters["INSTRUCTION"]["covered"],
-            "branches_covered": counters["BRANCH"]["covered"],
-            "branches_total": counters["BRANCH"]["missed"] + counters["BRANCH"]["covered"],
-            "lines_covered": counters["LINE"]["covered"],
-            "lines_total": counters["LINE"]["missed"] + counters["LINE"]["covered"],
-            "complexity_covered": counters["COMPLEXITY"]["covered"],
-            "complexity_total": counters["COMPLEXITY"]["missed"] + counters["COMPLEXITY"]["covered"],
-            "methods_covered": counters["METHOD"]["covered"],
-            "methods_total": counters["METHOD"]["missed"] + counters["METHOD"]["covered"],
-            "classes_covered": counters["CLASS"]["covered"],
-            "classes_total": counters["CLASS"]["missed"] + counters["CLASS"]["covered"]
-        }
+        # 流式解析，只取报告级别的汇总 counter
+        result = coverage_percentages(read_report_counters(xml_path))
+        instruction_coverage = result["instruction_coverage"]
+        branch_coverage = result["branch_coverage"]
+        line_coverage = result["line_coverage"]
+        complexity_coverage = result["complexity_coverage"]
+        method_coverage = result["method_coverage"]
+        class_coverage = result["class_coverage"]
 
         logger.info(f"[{request_id}] JaCoCo XML parsing completed:")
         logger.info(f"[{request_id}]   指令覆盖率: {instruction_coverage:.2f}%")
@@ -213,38 +281,406 @@ def parse_jacoco_xml_file(xml_path: str, request_id: str) -> Dict[str, Any]:
         logger.error(f"[{request_id}] Failed to parse JaCoCo XML: {str(e)}")
         raise Exception(f"Failed to parse JaCoCo XML: {str(e)}")
 
+def _shallow_checkout(
+    repo_url: str,
+    commit_id: str,
+    branch_name: str,
+    repo_dir: str,
+    request_id: str,
+    timeout: int = 300
+):
+    """只获取目标提交（--depth 1 / --filter=blob:none / 跳过 LFS），服务端不支持按SHA获取时回退到分支"""
+    env = dict(os.environ, GIT_LFS_SKIP_SMUDGE="1", GIT_TERMINAL_PROMPT="0")
+
+    def git(*args, check=True):
+        result = _run_command(["git", *args], request_id, cwd=repo_dir, timeout=timeout, env=env)
+        if check and result.returncode != 0:
+            raise Exception(f"git {args[0]} 失败: {result.stderr}")
+        return result
+
+    os.makedirs(repo_dir, exist_ok=True)
+    git("init", "-q")
+    git("remote", "add", "origin", repo_url)
+    fetch_args = ["fetch", "--depth", "1", "--filter=blob:none", "--no-tags", "origin"]
+
+    logger.info(f"[{request_id}] 浅获取提交: {commit_id}")
+    result = git(*fetch_args, commit_id, check=False)
+    if result.returncode == 0:
+        git("checkout", "-q", "--detach", "FETCH_HEAD")
+        return
+
+    logger.warning(f"[{request_id}] 服务端不支持按SHA获取，改为获取分支 {branch_name}: {result.stderr.strip()}")
+    branch_ref = f"refs/remotes/origin/{branch_name}"
+    git(*fetch_args, f"+refs/heads/{branch_name}:{branch_ref}")
+    if git("checkout", "-q", "--detach", commit_id, check=False).returncode == 0:
+        return
+
+    # 分支已前进，目标提交不在浅历史中：补全该分支历史（仍不下载无关 blob）
+    logger.info(f"[{request_id}] 目标提交不在分支最新提交中，补全分支历史")
+    git("fetch", "--unshallow", "--filter=blob:none", "--no-tags", "origin", f"+refs/heads/{branch_name}:{branch_ref}")
+    if git("checkout", "-q", "--detach", commit_id, check=False).returncode != 0:
+        logger.warning(f"[{request_id}] 切换提交失败，使用分支 {branch_name} 最新提交")
+        git("checkout", "-q", "--detach", branch_ref)
+
+def _prepare_checkout(
+    repo_url: str,
+    commit_id: str,
+    branch_name: str,
+    repo_dir: str,
+    service_config: Dict[str, Any],
+    request_id: str,
+    persistent: bool = False
+):
+    """按 checkout_mode 准备扫描用的代码目录；persistent 表示目录在扫描后保留（增量构建工作区）"""
+    checkout_mode = service_config.get('checkout_mode', 'clone')
+
+    def run(command, cwd=None, timeout=None):
+        return _run_command(command, request_id, cwd=cwd, timeout=timeout)
+
+    if checkout_mode == 'mirror':
+        try:
+            from src.repo_cache import get_repo_cache
+            logger.info(f"[{request_id}] 从仓库镜像缓存检出到: {repo_dir}")
+            get_repo_cache().checkout(repo_url, commit_id, branch_name, repo_dir, request_id, run, persistent)
+            return
+        except ScanCancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[{request_id}] 镜像缓存检出失败，回退到完整克隆: {str(e)}")
+            shutil.rmtree(repo_dir, ignore_errors=True)
+    elif checkout_mode == 'shallow':
+        try:
+            _shallow_checkout(repo_url, commit_id, branch_name, repo_dir, request_id)
+            return
+        except ScanCancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[{request_id}] 浅获取失败，回退到完整克隆: {str(e)}")
+            shutil.rmtree(repo_dir, ignore_errors=True)
+
+    # 1. 克隆仓库
+    logger.info(f"[{request_id}] 克隆仓库到: {repo_dir}")
+    clone_cmd = ["git", "clone", repo_url, repo_dir]
+    result = run(clone_cmd, timeout=300)
+
+    if result.returncode != 0:
+        raise Exception(f"克隆仓库失败: {result.stderr}")
+
+    # 2. 切换到指定提交
+    logger.info(f"[{request_id}] 切换到提交: {commit_id}")
+    checkout_cmd = ["git", "checkout", commit_id]
+    result = run(checkout_cmd, cwd=repo_dir)
+
+    if result.returncode != 0:
+        logger.warning(f"[{request_id}] 切换提交失败，使用默认分支: {result.stderr}")
+
+def _update_workspace(
+    repo_url: str,
+    commit_id: str,
+    branch_name: str,
+    repo_dir: str,
+    service_config: Dict[str, Any],
+    request_id: str
+):
+    """把已有的增量构建工作区切换到目标提交，保留被忽略的 target/ 目录"""
+    def git(*args, check=True, timeout=300):
+        result = _run_command(["git", *args], request_id, cwd=repo_dir, timeout=timeout)
+        if check and result.returncode != 0:
+            raise Exception(f"git {args[0]} 失败: {result.stderr}")
+        return result
+
+    alternates = os.path.join(repo_dir, ".git", "objects", "info", "alternates")
+    if os.path.exists(alternates):
+        # 早期以 --shared 创建的工作区依赖镜像中的对象，镜像清理后会损坏，先复制所需对象再断开
+        logger.info(f"[{request_id}] 工作区不再共享镜像对象: {repo_dir}")
+        git("repack", "-a", "-d", "-q", timeout=1800)
+        os.remove(alternates)
+
+    if service_config.get('checkout_mode') == 'mirror':
+        # 从镜像获取新提交的对象（镜像已包含时不需要联网）
+        from src.repo_cache import get_repo_cache
+        mirror = get_repo_cache().update(
+            repo_url, commit_id, request_id,
+            lambda command, cwd=None, timeout=None: _run_command(command, request_id, cwd=cwd, timeout=timeout)
+        )
+        git("fetch", "-q", "--no-tags", "--prune", mirror, "+refs/heads/*:refs/remotes/origin/*")
+    else:
+        fetch_args = ["fetch", "-q", "--no-tags"]
+        if service_config.get('checkout_mode') == 'shallow':
+            fetch_args += ["--depth", "1", "--filter=blob:none"]
+        if git(*fetch_args, "origin", commit_id, check=False).returncode != 0:
+            git(*fetch_args, "origin", f"+refs/heads/{branch_name}:refs/remotes/origin/{branch_name}")
+
+    if git("checkout", "-q", "--force", "--detach", commit_id, check=False).returncode != 0:
+        logger.warning(f"[{request_id}] 工作区切换提交失败，使用分支 {branch_name} 最新提交")
+        git("checkout", "-q", "--force", "--detach", f"origin/{branch_name}")
+    # 删除未跟踪文件（含上次扫描备份的pom），但保留各模块的构建输出
+    git("clean", "-q", "-ffdx", "-e", "target/")
+
+def _incremental_clean_reason(
+    workspace_state: Dict[str, Any],
+    pom_hash: str,
+    repo_dir: str,
+    commit_id: str,
+    request_id: str
+) -> str:
+    """判断增量构建是否需要 clean，返回原因；可以增量构建时返回空字符串"""
+    if not workspace_state:
+        return "首次构建"
+    if workspace_state.get("pom_hash") != pom_hash:
+        return "POM已变更"
+    if not workspace_state.get("build_ok"):
+        return "上次构建失败"
+
+    # 删除或重命名的源文件会在 target/classes 中留下过期的 class 文件
+    last_commit = workspace_state.get("commit_id")
+    result = _run_command(
+        ["git", "diff", "--name-only", "--diff-filter=DR", last_commit, commit_id],
+        request_id, cwd=repo_dir, timeout=120
+    )
+    if result.returncode != 0:
+        return "无法比较上次构建的提交"
+    if result.stdout.strip():
+        return "有文件被删除或重命名"
+    return ""
+
+def _changed_files(last_commit: str, commit_id: str, repo_dir: str, request_id: str) -> Optional[List[str]]:
+    """上次扫描的提交到本次提交之间变更的文件；无法比较时返回 None"""
+    result = _run_command(
+        ["git", "diff", "--name-only", last_commit, commit_id], request_id, cwd=repo_dir, timeout=120
+    )
+    if result.returncode != 0:
+        logger.warning(f"[{request_id}] 无法比较上次扫描的提交: {result.stderr}")
+        return None
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+def _changed_modules(changed_files: List[str], modules: List[str], request_id: str) -> Optional[List[str]]:
+    """计算变更的模块；需要构建整个 reactor 时返回 None"""
+    from src.module_reports import modules_for_files
+
+    changed, unowned = modules_for_files(changed_files, modules)
+    # 根目录下的文档、CI 配置等不影响模块构建；根项目自身的源码变更则需要全量构建
+    if any(path.startswith("src/") for path in unowned):
+        logger.info(f"[{request_id}] 根项目源码有变更，构建全部模块")
+        return None
+    logger.info(f"[{request_id}] {len(changed_files)} 个文件变更，涉及模块: {sorted(changed) or '无'}")
+    return sorted(changed)
+
+def _select_tests(
+    impact_index,
+    changed_files: Optional[List[str]],
+    workspace_state: Dict[str, Any],
+    repo_dir: str,
+    modules: List[str],
+    service_config: Dict[str, Any],
+    request_id: str
+) -> Optional[List[str]]:
+    """选择受变更影响的测试并恢复基线执行数据；需要运行全部测试时返回 None"""
+    from src.impact_analysis import classify_changes
+
+    full_run_every = service_config.get('test_selection_full_run_every', 20)
+    selective_runs = workspace_state.get("selective_runs", 0)
+    reason = None
+    if changed_files is None:
+        reason = "无法确定变更文件"
+    elif not impact_index.files or not impact_index.has_baseline():
+        reason = "没有基线覆盖率数据"
+    elif selective_runs >= full_run_every:
+        reason = f"已连续 {selective_runs} 次只运行受影响的测试"
+    else:
+        changed_classes, changed_tests, unknown = classify_changes(changed_files)
+        if unknown:
+            reason = f"{len(unknown)} 个资源等非Java源文件有变更"
+    if reason:
+        logger.info(f"[{request_id}] 运行全部测试: {reason}")
+        return None
+
+    impact_index.update(repo_dir, changed_files)
+    tests = sorted(impact_index.select_tests(changed_classes, changed_tests))
+    restored = impact_index.restore_baseline(repo_dir, modules)
+    logger.info(
+        f"[{request_id}] 变更 {len(changed_classes)} 个类，选择 {len(tests)} 个受影响的测试，"
+        f"恢复 {restored} 个模块的基线执行数据"
+    )
+    return tests
+
+def _collect_changed_lines(
+    repo_dir: str,
+    before_commit: str,
+    service_config: Dict[str, Any],
+    request_id: str
+) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+    """检出目录中 before..HEAD 变更的 Java 行；新分支、未开启 diff_coverage 或 diff 失败时返回 None"""
+    if not before_commit or not before_commit.strip("0") or not service_config.get('diff_coverage', True):
+        return None
+    from src.diff_coverage import changed_lines
+
+    def run(command, cwd=None, timeout=None):
+        return _run_command(command, request_id, cwd=cwd, timeout=timeout)
+
+    git_dir = os.path.join(repo_dir, ".git")
+    try:
+        result = run(["git", "--git-dir", git_dir, "cat-file", "-e", f"{before_commit}^{{commit}}"], timeout=30)
+        if result.returncode != 0:
+            # 浅获取的检出目录中没有 before，只获取这一个提交
+            run(["git", "--git-dir", git_dir, "fetch", "--depth", "1", "--filter=blob:none", "--no-tags",
+                 "origin", before_commit], timeout=120)
+        return changed_lines(git_dir, before_commit, "HEAD", run)
+    except ScanCancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"[{request_id}] 计算变更行失败: {str(e)}")
+        return None
+
+def _remove_stale_coverage_files(repo_dir: str, report_modules: List[str] = None):
+    """删除上次构建留下的 exec 数据和报告，避免 agent 追加写入旧的执行数据。
+    report_modules 为 None 时删除所有模块的，否则只删除这些模块的（本次构建的模块，含 -am/-amd 带上的上下游；其余模块不重新构建，沿用上次的执行数据和报告）"""
+    for root, dirs, files in os.walk(repo_dir):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        parts = os.path.relpath(root, repo_dir).split(os.sep)
+        if "target" not in parts:
+            continue
+        module = "/".join(p for p in parts[:parts.index("target")] if p != ".")
+        if report_modules is not None and module not in report_modules:
+            continue
+        for name in files:
+            if (name.startswith("jacoco") and name.endswith(".exec")) or name == "jacoco.xml":
+                os.remove(os.path.join(root, name))
+
+def _surefire_settings(service_config: Dict[str, Any]) -> Dict[str, str]:
+    """扫描配置中的 Surefire 并行参数（参数名 -> 值）"""
+    settings = {
+        "forkCount": service_config.get("surefire_fork_count"),
+        "reuseForks": service_config.get("surefire_reuse_forks"),
+        "parallel": service_config.get("surefire_parallel"),
+        "threadCount": service_config.get("surefire_thread_count"),
+    }
+    return {
+        name: str(value).lower() if isinstance(value, bool) else str(value)
+        for name, value in settings.items() if value is not None
+    }
+
+def _maven_parallel_args(service_config: Dict[str, Any]) -> List[str]:
+    args = []
+    if service_config.get("maven_threads"):
+        args += ["-T", str(service_config["maven_threads"])]
+    # pom 已自带 JaCoCo 配置而跳过增强时，Surefire 参数通过用户属性生效
+    args += [f"-D{name}={value}" for name, value in _surefire_settings(service_config).items()]
+    return args
+
+def _run_maven_build(
+    maven_cmd: List[str],
+    repo_dir: str,
+    service_config: Dict[str, Any],
+    request_id: str,
+    timeout: int = 600
+) -> subprocess.CompletedProcess:
+    """运行Maven构建；启用共享缓存时按POM哈希预取依赖，已预取的依赖集离线构建"""
+    daemon_pool = None
+    if service_config.get('maven_executor') == 'mvnd':
+        from src.maven_daemon import get_daemon_pool
+        daemon_pool = get_daemon_pool()
+        if not daemon_pool.available():
+            logger.warning(f"[{request_id}] 未找到 {daemon_pool.executable}，使用 mvn 构建")
+            daemon_pool = None
+
+    def mvn(command: List[str]) -> subprocess.CompletedProcess:
+        if daemon_pool is None:
+            return _run_command(command, request_id, cwd=repo_dir, timeout=timeout)
+        try:
+            return _run_command(daemon_pool.command(command), request_id, cwd=repo_dir, timeout=timeout)
+        finally:
+            daemon_pool.after_build(request_id=request_id)
+
+    if not service_config.get('shared_maven_cache', True):
+        return mvn(maven_cmd)
+
+    from src.maven_cache import (
+        get_maven_cache, hash_pom_files, is_offline_resolution_failure, CONCURRENT_RESOLVER_ARGS
+    )
+    maven_cache = get_maven_cache()
+    repo_args = [f"-Dmaven.repo.local={maven_cache.repository_dir}"] + CONCURRENT_RESOLVER_ARGS
+    # 在增强后的pom上计算哈希，JaCoCo插件版本也属于依赖集的一部分
+    pom_hash = hash_pom_files(repo_dir)
+    prefetched = maven_cache.is_prefetched(pom_hash)
+
+    # 预取的下载计入随后这次构建，指标中每次扫描只算一次构建
+    prefetch_output = ""
+    with maven_cache.in_use():
+        if prefetched:
+            logger.info(f"[{request_id}] 依赖已预取 (POM哈希 {pom_hash[:12]})，离线构建")
+            result = mvn(maven_cmd + repo_args + ["-o"])
+            if result.returncode == 0 or not is_offline_resolution_failure(result.stdout):
+                maven_cache.record_build(result.stdout, request_id)
+                return result
+            logger.warning(f"[{request_id}] 离线构建缺少依赖，联网重试")
+            maven_cache.clear_prefetched(pom_hash)
+        else:
+            logger.info(f"[{request_id}] 首次出现的POM哈希 {pom_hash[:12]}，预取依赖...")
+            prefetch = mvn(["mvn", "dependency:go-offline", "--batch-mode"] + repo_args)
+            prefetch_output = prefetch.stdout
+            if prefetch.returncode != 0:
+                # 多模块项目的模块间依赖等情况会导致 go-offline 失败，由正常构建继续下载
+                logger.warning(f"[{request_id}] 依赖预取失败，构建时在线下载: {prefetch.stderr}")
+
+        result = mvn(maven_cmd + repo_args)
+
+    maven_cache.record_build(prefetch_output + result.stdout, request_id)
+    # go-offline 不会解析运行期才确定的插件依赖，因此以一次成功的在线构建作为预取完成的标志
+    if result.returncode == 0:
+        maven_cache.mark_prefetched(pom_hash)
+    maven_cache.prune()
+    return result
+
 def _run_local_scan(
     repo_url: str,
     commit_id: str,
-    _: str,  # branch_name
+    branch_name: str,
     reports_dir: str,
-    __: Dict[str, Any],  # service_config
-    request_id: str
+    service_config: Dict[str, Any],
+    request_id: str,
+    before_commit: str = None
 ) -> Dict[str, Any]:
     logger.info(f"[{request_id}] 开始本地JaCoCo扫描")
     import tempfile
-    import shutil
 
-    # 创建临时工作目录
-    temp_dir = tempfile.mkdtemp(prefix=f"jacoco_local_{request_id}_")
+    # 创建临时工作目录（与输出目录在同一文件系统，报告可以直接移动过去）
+    temp_dir = tempfile.mkdtemp(
+        prefix=f"jacoco_local_{request_id}_", dir=os.path.dirname(os.path.abspath(reports_dir))
+    )
     repo_dir = os.path.join(temp_dir, "repo")
 
-    try:
-        # 1. 克隆仓库
-        logger.info(f"[{request_id}] 克隆仓库到: {repo_dir}")
-        clone_cmd = ["git", "clone", repo_url, repo_dir]
-        result = subprocess.run(clone_cmd, capture_output=True, text=True, timeout=300)
-
-        if result.returncode != 0:
-            raise Exception(f"克隆仓库失败: {result.stderr}")
-
-        # 2. 切换到指定提交
-        logger.info(f"[{request_id}] 切换到提交: {commit_id}")
-        checkout_cmd = ["git", "checkout", commit_id]
-        result = subprocess.run(checkout_cmd, cwd=repo_dir, capture_output=True, text=True)
+    # 增量构建：使用该分支长期保留的工作区（含 target/），同一工作区的扫描串行执行
+    workspace_cache = None
+    workspace_state = {}
+    workspace_lock = contextlib.ExitStack()
+    if service_config.get('incremental_build'):
+        from src.build_workspace import get_workspace_cache
+        workspace_cache = get_workspace_cache()
+        repo_dir = workspace_cache.path(repo_url, branch_name)
+        workspace_lock.enter_context(workspace_cache.lock(repo_dir))
 
-        if result.returncode != 0:
-            logger.warning(f"[{request_id}] 切换提交失败，使用默认分支: {result.stderr}")
+    try:
+        # 1-2. 获取代码并切换到指定提交
+        if workspace_cache:
+            workspace_state = workspace_cache.load_state(repo_dir)
+            if workspace_state:
+                try:
+                    logger.info(f"[{request_id}] 更新增量构建工作区: {repo_dir}")
+                    _update_workspace(repo_url, commit_id, branch_name, repo_dir, service_config, request_id)
+                except ScanCancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"[{request_id}] 工作区更新失败，重新检出: {str(e)}")
+                    workspace_state = {}
+            if not workspace_state:
+                workspace_cache.clear_state(repo_dir)
+                shutil.rmtree(repo_dir, ignore_errors=True)
+                _prepare_checkout(
+                    repo_url, commit_id, branch_name, repo_dir, service_config, request_id, persistent=True
+                )
+        else:
+            _prepare_checkout(repo_url, commit_id, branch_name, repo_dir, service_config, request_id)
 
         # 3. 检查是否为Maven项目
         pom_path = os.path.join(repo_dir, "pom.xml")
@@ -253,6 +689,9 @@ def _run_local_scan(
 
         logger.info(f"[{request_id}] 找到Maven项目")
 
+        # 检出目录扫描后即删除，在这里计算本次推送的变更行
+        changes = _collect_changed_lines(repo_dir, before_commit, service_config, request_id)
+
         # 4. 检查项目源代码结构
         logger.info(f"[{request_id}] 检查项目源代码...")
         src_main_java = os.path.join(repo_dir, "src", "main", "java")
@@ -274,7 +713,7 @@ def _run_local_scan(
         shutil.copy2(pom_path, pom_backup)
 
         try:
-            enhance_pom_simple(pom_path, request_id)
+            enhance_pom_simple(pom_path, request_id, _surefire_settings(service_config))
         except Exception as e:
             logger.warning(f"[{request_id}] pom.xml增强失败: {str(e)}")
             # 如果增强失败，恢复备份
@@ -287,20 +726,93 @@ def _run_local_scan(
         # 6. 运行Maven测试和JaCoCo
         logger.info(f"[{request_id}] 运行Maven测试和JaCoCo...")
 
-        maven_cmd = [
-            "mvn", "clean", "test", "jacoco:report",
+        goals = list(service_config.get('maven_goals') or ["clean", "test", "jacoco:report"])
+        maven_args = [
             "-Dmaven.test.failure.ignore=true",
             "-Dproject.build.sourceEncoding=UTF-8",
             "--batch-mode"
-        ]
+        ] + _maven_parallel_args(service_config)
+
+        from src.module_reports import discover_modules, find_module_report, merge_module_reports, reactor_modules
+        from src.lazy_report import DATA_DIR_NAME, package_report_data
+        from config.config import REPORT_CONFIG
+        modules = discover_modules(repo_dir)
+        if modules:
+            logger.info(f"[{request_id}] 多模块项目，共 {len(modules)} 个模块")
+
+        # 只构建变更模块（需要增量工作区保存的上次提交和各模块报告）
+        target_modules = None
+        changed_files = None
+        if workspace_cache:
+            from src.maven_cache import hash_pom_files
+            pom_hash = hash_pom_files(repo_dir)
+            clean_reason = _incremental_clean_reason(workspace_state, pom_hash, repo_dir, commit_id, request_id)
+            if clean_reason:
+                logger.info(f"[{request_id}] 全量构建: {clean_reason}")
+                if "clean" not in goals:
+                    goals.insert(0, "clean")
+            else:
+                logger.info(f"[{request_id}] 增量构建，跳过clean")
+                goals = [goal for goal in goals if goal != "clean"]
+                changed_files = _changed_files(workspace_state["commit_id"], commit_id, repo_dir, request_id)
+                if modules and service_config.get('changed_modules_only') and changed_files is not None:
+                    target_modules = _changed_modules(changed_files, modules, request_id)
+                # -am -amd 还会重新构建和测试上下游模块，它们的旧执行数据同样要删除
+                rebuilt_modules = target_modules
+                if target_modules:
+                    rebuilt_modules = reactor_modules(repo_dir, modules, target_modules)
+                    logger.info(f"[{request_id}] 本次构建的模块（含上下游）: {rebuilt_modules}")
+                _remove_stale_coverage_files(repo_dir, rebuilt_modules)
+        elif service_config.get('changed_modules_only') or service_config.get('test_selection'):
+            logger.info(f"[{request_id}] changed_modules_only/test_selection 需要开启 incremental_build")
+
+        # 只运行受影响的测试，其余测试的覆盖率来自基线执行数据
+        impact_index = None
+        selected_tests = None
+        test_args = []
+        if workspace_cache and service_config.get('test_selection'):
+            from src.impact_analysis import ImpactIndex
+            impact_index = ImpactIndex(f"{repo_dir}.impact")
+            selected_tests = _select_tests(
+                impact_index, changed_files, workspace_state, repo_dir, modules, service_config, request_id
+            )
+            if selected_tests:
+                test_args = [
+                    "-Dtest=" + ",".join(selected_tests),
+                    "-Dsurefire.failIfNoSpecifiedTests=false",
+                    "-DfailIfNoTests=false",
+                ]
+            elif selected_tests is not None:
+                test_args = ["-DskipTests"]
+
+        if target_modules == []:
+            logger.info(f"[{request_id}] 没有模块变更，沿用上次各模块的覆盖率")
+            result = subprocess.CompletedProcess(["mvn"] + goals, 0, "", "")
+        else:
+            # 未变更的上游模块不会安装到本地仓库，需要 -am 一起构建
+            module_args = ["-pl", ",".join(target_modules), "-am", "-amd"] if target_modules else []
+            result = _run_maven_build(
+                ["mvn"] + goals + maven_args + module_args + test_args, repo_dir, service_config, request_id
+            )
 
-        result = subprocess.run(
-            maven_cmd,
-            cwd=repo_dir,
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
+        if workspace_cache:
+            if result.returncode != 0 and "clean" not in goals:
+                logger.warning(f"[{request_id}] 增量构建失败，clean后重新构建")
+                goals.insert(0, "clean")
+                # clean 会删除恢复的基线执行数据，重新构建时运行全部测试
+                selected_tests = None
+                result = _run_maven_build(["mvn"] + goals + maven_args, repo_dir, service_config, request_id)
+            if impact_index is not None and result.returncode == 0:
+                impact_index.save_baseline(repo_dir, modules, merge=selected_tests is not None)
+                if selected_tests is None:
+                    impact_index.rebuild(repo_dir)
+                impact_index.save()
+            workspace_cache.save_state(repo_dir, {
+                "commit_id": commit_id,
+                "pom_hash": pom_hash,
+                "build_ok": result.returncode == 0,
+                "selective_runs": 0 if selected_tests is None else workspace_state.get("selective_runs", 0) + 1,
+            })
 
         logger.info(f"[{request_id}] Maven执行完成，返回码: {result.returncode}")
         if result.returncode != 0:
@@ -330,13 +842,30 @@ def _run_local_scan(
         jacoco_xml = None
         jacoco_html_dir = None
 
+        # 多模块项目：合并各模块报告（未重新构建的模块使用工作区中上次的报告）
+        module_reports = {}
+        for module in modules:
+            report_dir = find_module_report(repo_dir, module)
+            if report_dir:
+                module_reports[module] = report_dir
+        if module_reports:
+            merged_dir = os.path.join(temp_dir, "merged_report")
+            merge_module_reports(
+                module_reports, merged_dir, service_config.get('service_name', 'project'),
+                copy_html=not REPORT_CONFIG["lazy_html"]
+            )
+            jacoco_xml = os.path.join(merged_dir, "jacoco.xml")
+            jacoco_html_dir = merged_dir
+            logger.info(f"[{request_id}] 合并了 {len(module_reports)}/{len(modules)} 个模块的JaCoCo报告")
+
         # 查找XML报告
-        for location in possible_locations:
-            if os.path.exists(location):
-                jacoco_xml = location
-                jacoco_html_dir = os.path.dirname(location)
-                logger.info(f"[{request_id}] 找到JaCoCo XML报告: {location}")
-                break
+        if not jacoco_xml:
+            for location in possible_locations:
+                if os.path.exists(location):
+                    jacoco_xml = location
+                    jacoco_html_dir = os.path.dirname(location)
+                    logger.info(f"[{request_id}] 找到JaCoCo XML报告: {location}")
+                    break
 
         # 如果还没找到，搜索整个target目录
         if not jacoco_xml:
@@ -360,24 +889,47 @@ def _run_local_scan(
             "return_code": result.returncode,
             "scan_method": "local"
         }
+        if changes is not None:
+            scan_result["changed_lines"] = changes
+        if impact_index is not None:
+            scan_result["tests_selected"] = "all" if selected_tests is None else len(selected_tests)
 
         os.makedirs(reports_dir, exist_ok=True)
 
         if jacoco_xml and os.path.exists(jacoco_xml):
             logger.info(f"[{request_id}] 找到JaCoCo XML报告: {jacoco_xml}")
 
+            # 一次性工作区扫描后即删除，报告文件可以直接硬链接或移动；
+            # 增量构建的工作区会被下次构建原地改写，只能 reflink 或复制
+            disposable = workspace_cache is None
+
             # 复制XML报告到输出目录
             xml_dest = os.path.join(reports_dir, "jacoco.xml")
-            shutil.copy2(jacoco_xml, xml_dest)
-            logger.info(f"[{request_id}] 复制XML报告到: {xml_dest}")
+            method = clone_file(jacoco_xml, xml_dest, allow_link=disposable)
+            logger.info(f"[{request_id}] 复制XML报告到: {xml_dest} ({method})")
+
+            # 复制CSV报告（如果存在）
+            csv_path = os.path.join(jacoco_html_dir, "jacoco.csv")
+            if os.path.exists(csv_path):
+                csv_dest = os.path.join(reports_dir, "jacoco.csv")
+                clone_file(csv_path, csv_dest, allow_link=disposable)
+                logger.info(f"[{request_id}] 复制CSV报告到: {csv_dest}")
+
+            if REPORT_CONFIG["lazy_html"]:
+                # 只保存生成 HTML 所需的数据，首次访问报告时再生成
+                data_dir = os.path.join(reports_dir, DATA_DIR_NAME)
+                stats = package_report_data(repo_dir, modules, data_dir)
+                clone_file(xml_dest, os.path.join(data_dir, "jacoco.xml"), allow_link=True)
+                logger.info(f"[{request_id}] 保存报告数据到: {data_dir} "
+                            f"(exec: {stats['exec_files']}, class: {stats['classes']}, 源码: {stats['sources']})")
 
             # 复制整个JaCoCo HTML目录
-            if jacoco_html_dir and os.path.exists(jacoco_html_dir):
+            elif jacoco_html_dir and os.path.exists(jacoco_html_dir):
                 html_output = os.path.join(reports_dir, "html")
                 if os.path.exists(html_output):
                     shutil.rmtree(html_output)
-                shutil.copytree(jacoco_html_dir, html_output)
-                logger.info(f"[{request_id}] 复制完整HTML报告到: {html_output}")
+                method = transfer_tree(jacoco_html_dir, html_output, disposable)
+                logger.info(f"[{request_id}] 复制完整HTML报告到: {html_output} ({method})")
 
                 # 列出复制的文件
                 html_files = []
@@ -387,13 +939,6 @@ def _run_local_scan(
                         html_files.append(rel_path)
                 logger.info(f"[{request_id}] 复制了 {len(html_files)} 个HTML文件")
 
-            # 复制CSV报告（如果存在）
-            csv_path = os.path.join(jacoco_html_dir, "jacoco.csv")
-            if os.path.exists(csv_path):
-                csv_dest = os.path.join(reports_dir, "jacoco.csv")
-                shutil.copy2(csv_path, csv_dest)
-                logger.info(f"[{request_id}] 复制CSV报告到: {csv_dest}")
-
             # 解析报告
             try:
                 parsed_reports = parse_jacoco_reports(reports_dir, request_id)
@@ -457,6 +1002,9 @@ def _run_local_scan(
 
         return scan_result
 
+    except ScanCancelledError:
+        logger.info(f"[{request_id}] 本地扫描已取消")
+        raise
     except subprocess.TimeoutExpired:
         logger.error(f"[{request_id}] 本地扫描超时")
         return {"status": "timeout", "message": "本地扫描超时", "scan_method": "local"}
@@ -464,6 +1012,7 @@ def _run_local_scan(
         logger.error(f"[{request_id}] 本地扫描失败: {str(e)}")
         return {"status": "error", "message": str(e), "scan_method": "local"}
     finally:
+        workspace_lock.close()
         # 清理临时目录
         try:
             shutil.rmtree(temp_dir)
@@ -672,9 +1221,10 @@ def create_independent_pom(repo_dir: str, request_id: str) -> str:
         logger.error(f"[{request_id}] 创建独立pom.xml失败: {e}")
         return None
 
-def enhance_pom_simple(pom_path: str, request_id: str) -> bool:
+def enhance_pom_simple(pom_path: str, request_id: str, surefire_settings: Dict[str, str] = None) -> bool:
     """
     使用字符串替换简单增强pom.xml
+    surefire_settings: 写入 Surefire 插件配置的并行参数（forkCount、parallel 等）
     """
     try:
         import re
@@ -848,6 +1398,20 @@ def enhance_pom_simple(pom_path: str, request_id: str) -> bool:
                 </executions>
             </plugin>'''
 
+        if surefire_settings:
+            surefire_config = ''.join(
+                f'\n                    <{name}>{value}</{name}>' for name, value in surefire_settings.items()
+            )
+            maven_plugins = maven_plugins.replace(
+                '<argLine>${argLine}</argLine>', '<argLine>${argLine}</argLine>' + surefire_config
+            )
+            # 多个测试 JVM 写入同一个 jacoco.exec，必须追加而不是覆盖
+            maven_plugins = maven_plugins.replace(
+                '<propertyName>argLine</propertyName>',
+                '<propertyName>argLine</propertyName>\n                            <append>true</append>'
+            )
+            logger.info(f"[{request_id}] Surefire并行配置: {surefire_settings}")
+
         if '<plugins>' in content:
             # 在现有plugins中添加
             content = content.replace(
@@ -24,11 +24,13 @@ class LarkNotifier:
     def send_jacoco_report(
         self, repo_url: str, branch_name: str, commit_id: str,
         coverage_data: Dict[str, Any], scan_result: Dict[str, Any],
-        request_id: str, html_report_url: str = None
+        request_id: str, html_report_url: str = None, diff_coverage: Dict[str, Any] = None,
+        coverage_delta: Dict[str, Any] = None
     ) -> bool:
         try:
             message = self._build_jacoco_message(
-                repo_url, branch_name, commit_id, coverage_data, scan_result, request_id, html_report_url
+                repo_url, branch_name, commit_id, coverage_data, scan_result, request_id, html_report_url,
+                diff_coverage, coverage_delta
             )
             return self._send_message(message)
         except Exception as e:
@@ -55,7 +57,8 @@ class LarkNotifier:
     def _build_jacoco_message(
         self, repo_url: str, branch_name: str, commit_id: str,
         coverage_data: Dict[str, Any], scan_result: Dict[str, Any],
-        request_id: str, html_report_url: str = None
+        request_id: str, html_report_url: str = None, diff_coverage: Dict[str, Any] = None,
+        coverage_delta: Dict[str, Any] = None
     ) -> Dict[str, Any]:
 
         # 检查扫描状态，如果失败则发送错误通知
@@ -112,6 +115,22 @@ class LarkNotifier:
             }
         }
         
+        # 与基准分支最近一次构建相比的变化
+        line_delta = (coverage_delta or {}).get('line', {}).get('delta')
+        if line_delta is not None:
+            message["card"]["elements"].append({
+                "tag": "div",
+                "text": {
+                    "tag": "lark_md",
+                    "content": f"{'📈' if line_delta >= 0 else '📉'} **行覆盖率 {line_delta:+.1f}%** "
+                               f"对比 {coverage_delta['base_branch']} 最近一次构建 `{coverage_delta['base_commit'][:8]}`"
+                }
+            })
+
+        # 本次推送变更行的覆盖率
+        if diff_coverage and diff_coverage.get('lines_executable'):
+            message["card"]["elements"].append(self._build_diff_coverage_element(diff_coverage))
+
         # 添加HTML报告链接按钮（如果有）
         if html_report_url:
             message["card"]["elements"].append({
@@ -158,6 +177,22 @@ class LarkNotifier:
         
         return message
 
+    def _build_diff_coverage_element(self, diff_coverage: Dict[str, Any]) -> Dict[str, Any]:
+        """变更行覆盖率：总体 + 覆盖率最低的几个文件"""
+        content = (
+            f"## 🆕 变更行覆盖率\n\n**{diff_coverage['coverage']:.1f}%** "
+            f"({diff_coverage['lines_covered']}/{diff_coverage['lines_executable']} 行，"
+            f"基于 `{diff_coverage.get('base_commit', '')[:8]}` 之后的变更)"
+        )
+        files = sorted(diff_coverage.get('files', []), key=lambda f: f['coverage'])
+        for item in [f for f in files if f['lines_covered'] < f['lines_executable']][:5]:
+            uncovered = ", ".join(str(n) for n in item['uncovered_lines'][:10])
+            content += (
+                f"\n- `{item['path'].rsplit('/', 1)[-1]}` {item['coverage']:.1f}% "
+                f"({item['lines_covered']}/{item['lines_executable']})，未覆盖行: {uncovered}"
+            )
+        return {"tag": "div", "text": {"tag": "lark_md", "content": content}}
+
     def _build_scan_failure_message(
         self, repo_url: str, branch_name: str, commit_id: str,
         scan_result: Dict[str, Any], request_id: str
@@ -357,7 +392,9 @@ def send_jacoco_notification(
     html_report_url: str = None,
     webhook_url: str = None,
     bot_id: str = "default",
-    bot_config: Dict[str, Any] = None
+    bot_config: Dict[str, Any] = None,
+    diff_coverage: Dict[str, Any] = None,
+    coverage_delta: Dict[str, Any] = None
 ) -> bool:
     """发送JaCoCo覆盖率报告通知"""
     try:
@@ -368,7 +405,8 @@ def send_jacoco_notification(
 
         logger.info(f"[{request_id}] 发送通知到机器人: {notifier.bot_name}")
         return notifier.send_jacoco_report(
-            repo_url, branch_name, commit_id, coverage_data, scan_result, request_id, html_report_url
+            repo_url, branch_name, commit_id, coverage_data, scan_result, request_id, html_report_url,
+            diff_coverage, coverage_delta
         )
     except Exception as e:
         logger.error(f"[{request_id}] 发送通知失败: {e}")
@@ -0,0 +1,372 @@
+"""按需生成 HTML 报告
+
+扫描时不再复制完整的 JaCoCo HTML 目录（每次扫描数万个小文件，而大部分报告从未被打开），
+只在报告目录的 `_data/` 下保存紧凑的数据：
+    jacoco.xml    覆盖率报告
+    jacoco.exec   执行数据（多模块时合并为一个文件）
+    classes.zip   编译后的 class 文件
+    sources.zip   源码（按包路径存放）
+第一次访问 `/reports/{project}/{commit}/...` 时生成 HTML 并保存在报告目录中（开启归档时按目录打包，见 report_archive），之后直接返回。
+配置了 jacococli（JACOCO_CLI_JAR）且有 java 时使用 JaCoCo 官方渲染，否则根据 jacoco.xml 和源码用 Python 生成。
+"""
+
+import os
+import html
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from src.blob_store import get_blob_store
+from src.jacoco_xml import LINE_FIELDS, CoverageRecord, iter_coverage
+from src.report_archive import has_archive, pack_report
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR_NAME = "_data"
+
+_render_locks: Dict[str, threading.Lock] = {}
+_render_locks_guard = threading.Lock()
+
+
+# ---- 扫描端：收集报告数据 ----
+
+def _zip_tree(zip_file: zipfile.ZipFile, source_dir: str, prefix: str, suffix: str, seen: set) -> int:
+    added = 0
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            if not name.endswith(suffix):
+                continue
+            rel_path = os.path.relpath(os.path.join(root, name), source_dir).replace(os.sep, "/")
+            arcname = f"{prefix}{rel_path}"
+            if arcname in seen:
+                continue
+            seen.add(arcname)
+            zip_file.write(os.path.join(root, name), arcname)
+            added += 1
+    return added
+
+
+def package_report_data(project_dir: str, modules: List[str], dest_dir: str) -> Dict[str, int]:
+    """把执行数据、class 文件和源码打包到 dest_dir，返回各部分的文件数"""
+    from src.jacoco_exec import ExecFormatError, merge_exec_files
+
+    os.makedirs(dest_dir, exist_ok=True)
+    module_dirs = [os.path.join(project_dir, *m.split("/")) for m in modules] or [project_dir]
+    stats = {"exec_files": 0, "classes": 0, "sources": 0}
+
+    exec_files = [
+        os.path.join(d, "target", "jacoco.exec") for d in module_dirs
+        if os.path.isfile(os.path.join(d, "target", "jacoco.exec"))
+    ]
+    if exec_files:
+        try:
+            merge_exec_files(exec_files, os.path.join(dest_dir, "jacoco.exec"))
+            stats["exec_files"] = len(exec_files)
+        except (ExecFormatError, OSError) as e:
+            logger.warning(f"合并执行数据失败: {str(e)}")
+
+    seen = set()
+    with zipfile.ZipFile(os.path.join(dest_dir, "classes.zip"), "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for module, module_dir in zip(modules or [""], module_dirs):
+            classes_dir = os.path.join(module_dir, "target", "classes")
+            if os.path.isdir(classes_dir):
+                # 按模块区分目录，不同模块的同名类不会互相覆盖
+                prefix = f"{module}/" if module else ""
+                stats["classes"] += _zip_tree(zip_file, classes_dir, prefix, ".class", seen)
+
+    seen = set()
+    with zipfile.ZipFile(os.path.join(dest_dir, "sources.zip"), "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for module_dir in module_dirs:
+            source_dir = os.path.join(module_dir, "src", "main", "java")
+            if os.path.isdir(source_dir):
+                stats["sources"] += _zip_tree(zip_file, source_dir, "", ".java", seen)
+    return stats
+
+
+def has_report_data(report_dir: str) -> bool:
+    return os.path.isfile(os.path.join(report_dir, DATA_DIR_NAME, "jacoco.xml"))
+
+
+def is_rendered(report_dir: str) -> bool:
+    return os.path.isfile(os.path.join(report_dir, "index.html")) or has_archive(report_dir)
+
+
+# ---- 服务端：按需渲染 ----
+
+def ensure_rendered(report_dir: str, report_name: str) -> bool:
+    """报告未生成 HTML 时生成；同一报告的并发请求只渲染一次"""
+    if is_rendered(report_dir):
+        return True
+    if not has_report_data(report_dir):
+        return False
+
+    from config.config import REPORT_CONFIG
+
+    key = os.path.abspath(report_dir)
+    with _render_locks_guard:
+        lock = _render_locks.setdefault(key, threading.Lock())
+    with lock:
+        if is_rendered(report_dir):
+            return True
+        output_dir = tempfile.mkdtemp(prefix=".render-", dir=report_dir)
+        try:
+            if not _render_with_cli(report_dir, output_dir, report_name):
+                render_html(report_dir, output_dir, report_name)
+            if REPORT_CONFIG.get("archive_reports"):
+                # 按目录保存为归档并去重，report.zip 最后写入
+                stats = pack_report(output_dir, report_dir, get_blob_store())
+                logger.info(f"HTML报告生成完成: {report_dir}（{stats['files']} 个文件，{stats['archives']} 个归档，"
+                            f"{stats['deduplicated']} 个去重）")
+            else:
+                _move_rendered(output_dir, report_dir)
+                logger.info(f"HTML报告生成完成: {report_dir}")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    with _render_locks_guard:
+        _render_locks.pop(key, None)
+    return True
+
+
+def _move_rendered(output_dir: str, report_dir: str):
+    blob_store = get_blob_store()
+    if blob_store is not None:
+        # jacoco-resources 和未改动类的页面与其他报告相同，只保存一份
+        blob_store.store_tree(output_dir)
+    # index.html 最后移动，作为渲染完成的标志
+    names = sorted(os.listdir(output_dir), key=lambda n: n == "index.html")
+    for name in names:
+        target = os.path.join(report_dir, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(os.path.join(output_dir, name), target)
+
+
+def _render_with_cli(report_dir: str, output_dir: str, report_name: str) -> bool:
+    """使用 jacococli 渲染；缺少 jar、java 或执行数据时返回 False"""
+    from config.config import REPORT_CONFIG
+
+    cli_jar = REPORT_CONFIG.get("jacoco_cli_jar")
+    data_dir = os.path.join(report_dir, DATA_DIR_NAME)
+    exec_path = os.path.join(data_dir, "jacoco.exec")
+    classes_path = os.path.join(data_dir, "classes.zip")
+    if not cli_jar or not os.path.isfile(cli_jar) or not shutil.which("java"):
+        return False
+    if not os.path.isfile(exec_path) or not os.path.isfile(classes_path):
+        return False
+
+    sources_dir = tempfile.mkdtemp(prefix="jacoco_sources_")
+    try:
+        sources_zip = os.path.join(data_dir, "sources.zip")
+        if os.path.isfile(sources_zip):
+            with zipfile.ZipFile(sources_zip) as zip_file:
+                zip_file.extractall(sources_dir)
+        result = subprocess.run(
+            ["java", "-jar", cli_jar, "report", exec_path, "--classfiles", classes_path,
+             "--sourcefiles", sources_dir, "--encoding", "UTF-8", "--name", report_name, "--html", output_dir],
+            capture_output=True, text=True, timeout=REPORT_CONFIG.get("render_timeout", 300)
+        )
+        if result.returncode == 0:
+            return True
+        error = result.stderr
+    except (subprocess.TimeoutExpired, OSError) as e:
+        error = str(e)
+    finally:
+        shutil.rmtree(sources_dir, ignore_errors=True)
+
+    logger.warning(f"jacococli 渲染失败，使用内置渲染: {error}")
+    # 清掉可能生成了一半的输出
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir, exist_ok=True)
+    return False
+
+
+# ---- 内置渲染 ----
+
+_COUNTER_COLUMNS = ("INSTRUCTION", "BRANCH", "LINE", "METHOD", "CLASS")
+_COLUMN_TITLES = {"INSTRUCTION": "指令", "BRANCH": "分支", "LINE": "行", "METHOD": "方法", "CLASS": "类"}
+
+_STYLE = """
+body { font-family: sans-serif; font-size: 13px; margin: 16px; }
+table.coverage { border-collapse: collapse; }
+table.coverage th, table.coverage td { border: 1px solid #ccc; padding: 3px 8px; text-align: right; }
+table.coverage td:first-child, table.coverage th:first-child { text-align: left; }
+table.coverage tfoot td { font-weight: bold; background: #f3f3f3; }
+pre.source { font-size: 12px; line-height: 1.4; }
+pre.source > span { display: block; }
+.fc { background: #ddffdd; } .pc { background: #ffffaa; } .nc { background: #ffaaaa; }
+.nr { color: #888; display: inline-block; width: 5em; }
+"""
+
+
+def _counters(counters: Dict[str, Dict[str, int]]) -> Dict[str, Tuple[int, int]]:
+    return {counter_type: (values["missed"], values["covered"]) for counter_type, values in counters.items()}
+
+
+def _cells(counters: Dict[str, Tuple[int, int]], tag: str = "td") -> str:
+    cells = []
+    for counter_type in _COUNTER_COLUMNS:
+        missed, covered = counters.get(counter_type, (0, 0))
+        total = missed + covered
+        text = f"{covered / total * 100:.0f}% ({covered}/{total})" if total else "n/a"
+        cells.append(f"<{tag}>{text}</{tag}>")
+    return "".join(cells)
+
+
+def _page(title: str, breadcrumb: str, body: str) -> str:
+    return (
+        "<!DOCTYPE html>\n<html><head><meta charset=\"UTF-8\">"
+        f"<title>{html.escape(title)}</title><style>{_STYLE}</style></head><body>\n"
+        f"<div>{breadcrumb}</div><h1>{html.escape(title)}</h1>\n{body}\n</body></html>\n"
+    )
+
+
+def _table(rows: List[str], totals: Dict[str, Tuple[int, int]], first_column: str) -> str:
+    header = "".join(f"<th>{_COLUMN_TITLES[t]}</th>" for t in _COUNTER_COLUMNS)
+    return (
+        f"<table class=\"coverage\"><thead><tr><th>{first_column}</th>{header}</tr></thead>\n"
+        f"<tbody>\n{''.join(rows)}</tbody>\n"
+        f"<tfoot><tr><td>合计</td>{_cells(totals)}</tr></tfoot></table>"
+    )
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def _line_class(mi: int, ci: int, mb: int, cb: int) -> str:
+    if ci == 0 and cb == 0:
+        return "nc" if mi or mb else ""
+    if mi or mb:
+        return "pc"
+    return "fc"
+
+
+def _render_sourcefile(
+    record: CoverageRecord,
+    sources: Optional[zipfile.ZipFile],
+    path: str,
+    breadcrumb: str
+):
+    package_name, file_name = record.parent, record.name
+    lines = record.lines or {}
+    line_status = {
+        nr: _line_class(mi, ci, mb, cb)
+        for nr, mi, ci, mb, cb in zip(*(lines.get(field, ()) for field in LINE_FIELDS))
+    }
+    source_text = None
+    if sources is not None:
+        try:
+            source_text = sources.read(f"{package_name}/{file_name}" if package_name else file_name)
+            source_text = source_text.decode("utf-8", "replace")
+        except KeyError:
+            source_text = None
+
+    if source_text is None:
+        body = "<p>源码不可用，仅显示各行覆盖状态。</p><pre class=\"source\">" + "".join(
+            f"<span class=\"{status}\"><span class=\"nr\">{nr}</span></span>"
+            for nr, status in sorted(line_status.items())
+        ) + "</pre>"
+    else:
+        body = "<pre class=\"source\">" + "".join(
+            f"<span class=\"{line_status.get(nr, '')}\" id=\"L{nr}\"><span class=\"nr\">{nr}</span>"
+            f"{html.escape(text)}</span>"
+            for nr, text in enumerate(source_text.splitlines(), 1)
+        ) + "</pre>"
+    _write(path, _page(file_name, breadcrumb, body))
+
+
+class _Container:
+    """渲染中的 report / group 节点：子 group 和 package 各占一行"""
+
+    def __init__(self, output_dir: str, depth: int):
+        self.output_dir = output_dir
+        self.depth = depth
+        self.rows: List[str] = []
+        self.has_group = False
+
+
+def _row(link: Optional[str], name: str, counters: Dict[str, Dict[str, int]]) -> str:
+    label = f"<a href=\"{html.escape(link)}\">{html.escape(name)}</a>" if link else html.escape(name)
+    return f"<tr><td>{label}</td>{_cells(_counters(counters))}</tr>\n"
+
+
+def render_html(report_dir: str, output_dir: str, report_name: str):
+    """根据 jacoco.xml 和源码生成 HTML 报告
+
+    使用流式解析（src/jacoco_xml.py）：每个源文件的页面在其元素结束时写出，内存中只保留当前各级
+    group / package 的表格行，与报告大小无关
+    """
+    data_dir = os.path.join(report_dir, DATA_DIR_NAME)
+    sources_zip = os.path.join(data_dir, "sources.zip")
+    sources = zipfile.ZipFile(sources_zip) if os.path.isfile(sources_zip) else None
+    # 按所在的各级 group 索引的容器，() 为 report 本身
+    containers: Dict[Tuple[str, ...], _Container] = {(): _Container(output_dir, 0)}
+    # 当前包中的源文件行和类行（没有源码信息时按类列出）
+    file_rows: List[str] = []
+    class_rows: List[str] = []
+
+    def container(groups: Tuple[str, ...]) -> Optional[_Container]:
+        """各级 group 对应的容器；名称不安全（绝对路径、..）的 group 及其中的内容不渲染"""
+        if groups not in containers:
+            parent = container(groups[:-1])
+            name = groups[-1]
+            if parent is None or not name or name.startswith("/") or ".." in name.split("/"):
+                return None
+            containers[groups] = _Container(os.path.join(parent.output_dir, name), parent.depth + len(name.split("/")))
+        return containers[groups]
+
+    try:
+        kinds = ("report", "group", "package", "class", "sourcefile")
+        for record in iter_coverage(os.path.join(data_dir, "jacoco.xml"), kinds, with_lines=True):
+            owner = container(record.groups)
+            if owner is None:
+                continue
+            if record.kind == "sourcefile":
+                display_name = record.parent.replace("/", ".") or "(default)"
+                package_dir = os.path.join(owner.output_dir, record.parent.replace("/", ".") or "default")
+                link = f"{record.name}.html"
+                file_rows.append(_row(link, record.name, record.counters))
+                _render_sourcefile(
+                    record, sources, os.path.join(package_dir, link),
+                    f"<a href=\"index.html\">{html.escape(display_name)}</a>"
+                )
+            elif record.kind == "class":
+                class_rows.append(_row(None, record.name.split("/")[-1], record.counters))
+            elif record.kind == "package":
+                name = record.name.replace("/", ".") or "default"
+                display_name = record.name.replace("/", ".") or "(default)"
+                up = "../" * owner.depth
+                breadcrumb = f"<a href=\"../{up}index.html\">首页</a> &gt; {html.escape(display_name)}"
+                _write(
+                    os.path.join(owner.output_dir, name, "index.html"),
+                    _page(display_name, breadcrumb, _table(file_rows or class_rows, _counters(record.counters), "源文件"))
+                )
+                file_rows, class_rows = [], []
+                owner.rows.append(_row(f"{name}/index.html", name, record.counters))
+            else:
+                # group / report 在其中的内容都结束后产出
+                if record.kind == "group":
+                    group = container(record.groups + (record.name,))
+                    if group is None:
+                        continue
+                    owner.has_group = True
+                    owner.rows.append(_row(f"{record.name}/index.html", record.name, record.counters))
+                    del containers[record.groups + (record.name,)]
+                    title = record.name
+                else:
+                    group = owner
+                    title = report_name or record.name or "JaCoCo"
+                up = "../" * group.depth
+                breadcrumb = f"<a href=\"{up}index.html\">首页</a>" if group.depth else ""
+                first_column = "模块 / 包" if group.has_group else "包"
+                _write(os.path.join(group.output_dir, "index.html"),
+                       _page(title, breadcrumb, _table(group.rows, _counters(record.counters), first_column)))
+    finally:
+        if sources is not None:
+            sources.close()
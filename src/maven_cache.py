@@ -0,0 +1,234 @@
+"""共享 Maven 本地仓库缓存
+
+宿主机上维护一个 Maven 本地仓库目录，挂载到所有扫描容器的 `/root/.m2/repository`，
+依赖和插件只需下载一次。扫描期间持有共享锁，超出容量预算时的清理需要独占锁，
+因此不会删除正在被构建使用的文件。命中率等指标从 Maven 输出中的下载记录统计。
+
+本地扫描还会按检出目录中所有 pom.xml 的哈希记录依赖是否已预取：首次出现的哈希先执行
+`dependency:go-offline`，构建成功后打上标记，之后相同哈希的构建使用 `-o` 离线模式。
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下不做跨进程加锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Maven 3.9+ 的解析器文件锁配置，多个 Maven 进程共享同一本地仓库时避免写冲突（旧版本会忽略）
+CONCURRENT_RESOLVER_ARGS = [
+    "-Daether.syncContext.named.factory=file-lock",
+    "-Daether.syncContext.named.nameMapper=file-gav",
+]
+
+# 离线构建因缺少构件而失败时 Maven 输出的关键字
+_OFFLINE_FAILURE_PATTERN = re.compile(r"offline mode", re.IGNORECASE)
+
+_DOWNLOADED_PATTERN = re.compile(r"Downloaded from [^:]+: \S+ \((\d+(?:\.\d+)?) (B|kB|KB|MB|GB)")
+_SIZE_UNITS = {"B": 1, "kB": 1024, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+_ARTIFACT_SUFFIXES = (".jar", ".pom")
+
+
+def parse_download_stats(maven_output: str) -> Tuple[int, int]:
+    """从 Maven 输出中统计下载的构件数量和字节数"""
+    count = 0
+    total_bytes = 0
+    for match in _DOWNLOADED_PATTERN.finditer(maven_output or ""):
+        count += 1
+        total_bytes += int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+    return count, total_bytes
+
+
+def is_offline_resolution_failure(maven_output: str) -> bool:
+    return bool(_OFFLINE_FAILURE_PATTERN.search(maven_output or ""))
+
+
+def hash_pom_files(project_dir: str) -> str:
+    """计算检出目录中所有 pom.xml 的整体哈希（路径 + 内容）"""
+    digest = hashlib.sha256()
+    pom_files = []
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if d not in (".git", "target", "node_modules")]
+        if "pom.xml" in files:
+            pom_files.append(os.path.join(root, "pom.xml"))
+    for pom_path in sorted(pom_files):
+        digest.update(os.path.relpath(pom_path, project_dir).replace(os.sep, "/").encode("utf-8"))
+        digest.update(b"\0")
+        with open(pom_path, "rb") as f:
+            digest.update(f.read())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class MavenRepoCache:
+    """宿主机共享的 Maven 本地仓库"""
+
+    def __init__(self, root_dir: str, max_bytes: int, prune_interval: int = 600):
+        self.root_dir = os.path.abspath(root_dir)
+        self.repository_dir = os.path.join(self.root_dir, "repository")
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.prefetched_dir = os.path.join(self.root_dir, "prefetched")
+        self._metrics_path = os.path.join(self.root_dir, "metrics.json")
+        self._lock_path = os.path.join(self.root_dir, ".lock")
+        self._metrics_lock = threading.Lock()
+        self._last_prune = 0.0
+        os.makedirs(self.repository_dir, exist_ok=True)
+        os.makedirs(self.prefetched_dir, exist_ok=True)
+
+    @contextmanager
+    def _flock(self, mode: int, blocking: bool = True):
+        if fcntl is None:
+            yield True
+            return
+        with open(self._lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, mode | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def in_use(self):
+        """构建期间持有共享锁，防止清理任务删除正在使用的构件"""
+        with self._flock(fcntl.LOCK_SH if fcntl else 0):
+            yield self.repository_dir
+
+    def record_build(self, maven_output: str, request_id: str = None) -> Dict[str, Any]:
+        """记录一次构建的下载情况，返回本次统计"""
+        downloaded, downloaded_bytes = parse_download_stats(maven_output)
+        with self._metrics_lock:
+            metrics = self._load_metrics()
+            metrics["builds"] += 1
+            metrics["artifacts_downloaded"] += downloaded
+            metrics["bytes_downloaded"] += downloaded_bytes
+            if downloaded == 0:
+                metrics["builds_fully_cached"] += 1
+            self._save_metrics(metrics)
+        if request_id:
+            logger.info(f"[{request_id}] Maven缓存: 本次下载 {downloaded} 个构件 ({downloaded_bytes / 1024 / 1024:.1f} MB)")
+        return {"artifacts_downloaded": downloaded, "bytes_downloaded": downloaded_bytes}
+
+    def is_prefetched(self, pom_hash: str) -> bool:
+        """该 POM 哈希的依赖是否已完整下载到缓存中"""
+        return os.path.exists(os.path.join(self.prefetched_dir, pom_hash))
+
+    def mark_prefetched(self, pom_hash: str):
+        with open(os.path.join(self.prefetched_dir, pom_hash), "w") as f:
+            f.write(str(time.time()))
+
+    def clear_prefetched(self, pom_hash: str = None):
+        """清除预取标记；不指定哈希时清除全部（缓存被清理后离线构建不再可靠）"""
+        names = [pom_hash] if pom_hash else os.listdir(self.prefetched_dir)
+        for name in names:
+            try:
+                os.remove(os.path.join(self.prefetched_dir, name))
+            except OSError:
+                pass
+
+    def _load_metrics(self) -> Dict[str, Any]:
+        metrics = {"builds": 0, "builds_fully_cached": 0, "artifacts_downloaded": 0, "bytes_downloaded": 0}
+        try:
+            with open(self._metrics_path, "r") as f:
+                metrics.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return metrics
+
+    def _save_metrics(self, metrics: Dict[str, Any]):
+        tmp_path = f"{self._metrics_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metrics, f)
+        os.replace(tmp_path, self._metrics_path)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            metrics = self._load_metrics()
+        builds = metrics["builds"]
+        metrics["hit_rate"] = round(metrics["builds_fully_cached"] / builds, 4) if builds else None
+        metrics["max_bytes"] = self.max_bytes
+        metrics["repository_dir"] = self.repository_dir
+        return metrics
+
+    def _artifact_dirs(self) -> List[Tuple[float, int, str]]:
+        """列出所有构件版本目录: (最近访问时间, 大小, 路径)"""
+        entries = []
+        for root, _, files in os.walk(self.repository_dir):
+            if not any(f.endswith(_ARTIFACT_SUFFIXES) for f in files):
+                continue
+            last_used = 0.0
+            size = 0
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                last_used = max(last_used, stat.st_atime, stat.st_mtime)
+                size += stat.st_size
+            entries.append((last_used, size, root))
+        return entries
+
+    def _remove_empty_parents(self, path: str):
+        parent = os.path.dirname(path)
+        while parent.startswith(self.repository_dir + os.sep):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    def prune(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """超出容量预算时按最近使用时间淘汰构件目录；有构建进行中时跳过"""
+        now = time.time()
+        if not force and now - self._last_prune < self.prune_interval:
+            return None
+        self._last_prune = now
+
+        with self._flock(fcntl.LOCK_EX if fcntl else 0, blocking=False) as acquired:
+            if not acquired:
+                logger.info("Maven缓存正在被构建使用，跳过本次清理")
+                return None
+
+            entries = self._artifact_dirs()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            freed = 0
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    if total - freed <= self.max_bytes:
+                        break
+                    shutil.rmtree(path, ignore_errors=True)
+                    self._remove_empty_parents(path)
+                    removed += 1
+                    freed += size
+                self.clear_prefetched()
+                logger.info(f"Maven缓存清理: 删除 {removed} 个构件目录，释放 {freed / 1024 / 1024:.1f} MB")
+            return {"total_bytes": total - freed, "removed": removed, "freed_bytes": freed}
+
+
+_maven_cache: Optional[MavenRepoCache] = None
+_maven_cache_guard = threading.Lock()
+
+
+def get_maven_cache() -> MavenRepoCache:
+    global _maven_cache
+    with _maven_cache_guard:
+        if _maven_cache is None:
+            from config.config import CACHE_CONFIG
+            _maven_cache = MavenRepoCache(CACHE_CONFIG["maven_repo_dir"], CACHE_CONFIG["maven_repo_max_bytes"])
+        return _maven_cache
@@ -0,0 +1,124 @@
+"""常驻 Maven 守护进程池（mvnd）
+
+每次本地扫描启动一个冷的 `mvn` JVM，小项目的大部分时间花在 JVM 启动和插件类加载上。
+启用 `maven_executor: "mvnd"` 后，本地扫描改用 mvnd 客户端，构建在常驻的守护进程中执行。
+每个扫描 worker 使用独立的守护进程目录（互不共享守护进程），累计构建次数达到上限
+或守护进程内存超过上限时停止并在下一次构建时重新启动。未安装 mvnd 时回退到 `mvn`。
+"""
+
+import os
+import re
+import shutil
+import logging
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_RSS_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([kmg])i?b?$", re.IGNORECASE)
+_RSS_UNITS_MB = {"k": 1 / 1024, "m": 1, "g": 1024}
+
+
+def parse_daemon_rss_mb(status_output: str) -> List[float]:
+    """从 `mvnd --status` 输出中提取各守护进程的内存占用（MB）"""
+    values = []
+    for line in (status_output or "").splitlines():
+        for token in line.split():
+            match = _RSS_PATTERN.match(token)
+            if match:
+                values.append(float(match.group(1)) * _RSS_UNITS_MB[match.group(2).lower()])
+                break
+    return values
+
+
+class MavenDaemonPool:
+    """按 worker 隔离的 mvnd 守护进程"""
+
+    def __init__(self, executable: str, daemon_dir: str, max_builds: int = 50, max_rss_mb: int = 2048):
+        self.executable = executable
+        self.daemon_dir = os.path.abspath(daemon_dir)
+        self.max_builds = max_builds
+        self.max_rss_mb = max_rss_mb
+        self._builds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return shutil.which(self.executable) is not None
+
+    def _storage(self, worker: str) -> str:
+        path = os.path.join(self.daemon_dir, re.sub(r"[^A-Za-z0-9._-]", "_", worker))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def command(self, maven_cmd: List[str], worker: str = None) -> List[str]:
+        """把 `mvn ...` 命令改写为使用该 worker 守护进程的 mvnd 命令"""
+        worker = worker or threading.current_thread().name
+        return [self.executable, f"-Dmvnd.daemonStorage={self._storage(worker)}"] + maven_cmd[1:]
+
+    def _run(self, args: List[str], worker: str, timeout: int = 60) -> Optional[subprocess.CompletedProcess]:
+        try:
+            return subprocess.run(
+                [self.executable, f"-Dmvnd.daemonStorage={self._storage(worker)}"] + args,
+                capture_output=True, text=True, timeout=timeout
+            )
+        except (subprocess.TimeoutExpired, OSError) as e:
+            logger.warning(f"mvnd 命令执行失败 ({worker}): {str(e)}")
+            return None
+
+    def stop(self, worker: str):
+        self._run(["--stop"], worker)
+        with self._lock:
+            self._builds.pop(worker, None)
+
+    def after_build(self, worker: str = None, request_id: str = None):
+        """记录一次构建，达到回收条件时停止该 worker 的守护进程"""
+        worker = worker or threading.current_thread().name
+        with self._lock:
+            builds = self._builds.get(worker, 0) + 1
+            self._builds[worker] = builds
+
+        reason = None
+        if builds >= self.max_builds:
+            reason = f"已执行 {builds} 次构建"
+        elif self.max_rss_mb:
+            status = self._run(["--status"], worker, timeout=30)
+            rss_values = parse_daemon_rss_mb(status.stdout) if status and status.returncode == 0 else []
+            if rss_values and max(rss_values) > self.max_rss_mb:
+                reason = f"内存占用 {max(rss_values):.0f} MB"
+
+        if reason:
+            logger.info(f"[{request_id or worker}] 回收Maven守护进程 ({worker}): {reason}")
+            self.stop(worker)
+
+    def stop_all(self):
+        if not os.path.isdir(self.daemon_dir) or not self.available():
+            return
+        for worker in os.listdir(self.daemon_dir):
+            self.stop(worker)
+
+
+_daemon_pool: Optional[MavenDaemonPool] = None
+_daemon_pool_guard = threading.Lock()
+
+
+def get_daemon_pool() -> MavenDaemonPool:
+    global _daemon_pool
+    with _daemon_pool_guard:
+        if _daemon_pool is None:
+            from config.config import MAVEN_DAEMON_CONFIG
+            _daemon_pool = MavenDaemonPool(
+                MAVEN_DAEMON_CONFIG["executable"],
+                MAVEN_DAEMON_CONFIG["daemon_dir"],
+                MAVEN_DAEMON_CONFIG["max_builds"],
+                MAVEN_DAEMON_CONFIG["max_rss_mb"],
+            )
+        return _daemon_pool
+
+
+def shutdown_daemon_pool():
+    """服务停止时关闭已启动的守护进程"""
+    with _daemon_pool_guard:
+        pool = _daemon_pool
+    if pool is not None:
+        pool.stop_all()
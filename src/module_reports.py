@@ -0,0 +1,293 @@
+"""多模块 Maven 项目的模块定位与报告合并
+
+- 解析聚合 pom 的 `<modules>`，得到所有 reactor 模块的相对路径
+- 把变更文件映射到所属模块，用于 `-pl` 只构建变更模块；按模块间的 parent/依赖关系
+  计算 `-am -amd` 实际会构建的模块
+- 把各模块的 jacoco.xml / jacoco.csv / HTML 报告合并为一份报告：每个模块对应一个 group，
+  根节点的 counter 为所有模块的汇总，HTML 首页列出各模块的覆盖率
+"""
+
+import os
+import csv
+import html
+import shutil
+import posixpath
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.jacoco_xml import COUNTER_TYPES
+
+# 模块内 JaCoCo 报告的可能位置（与单模块扫描的查找顺序一致）
+REPORT_LOCATIONS = (
+    ("target", "site", "jacoco"),
+    ("target", "jacoco-reports"),
+    ("target", "jacoco"),
+    ("target", "reports", "jacoco"),
+)
+
+_DOCTYPE = '<!DOCTYPE report PUBLIC "-//JACOCO//DTD Report 1.1//EN" "report.dtd">'
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _pom_modules(pom_path: str) -> List[str]:
+    try:
+        root = ET.parse(pom_path).getroot()
+    except (ET.ParseError, OSError):
+        return []
+    modules = []
+    for child in root:
+        if _local_name(child.tag) == "modules":
+            modules += [m.text.strip() for m in child if _local_name(m.tag) == "module" and m.text]
+    return modules
+
+
+def discover_modules(project_dir: str) -> List[str]:
+    """递归解析 `<modules>`，返回所有子模块相对路径（POSIX 形式）；单模块项目返回空列表"""
+    found: List[str] = []
+    pending = [""]
+    while pending:
+        base = pending.pop()
+        for module in _pom_modules(os.path.join(project_dir, base, "pom.xml")):
+            path = posixpath.normpath(posixpath.join(base, module))
+            if path in found or not os.path.isfile(os.path.join(project_dir, path, "pom.xml")):
+                continue
+            found.append(path)
+            pending.append(path)
+    return sorted(found)
+
+
+def modules_for_files(changed_files: Iterable[str], modules: List[str]) -> Tuple[Set[str], List[str]]:
+    """把变更文件映射到所属的最内层模块，返回 (变更模块, 不属于任何模块的文件)"""
+    by_depth = sorted(modules, key=len, reverse=True)
+    changed: Set[str] = set()
+    unowned: List[str] = []
+    for path in changed_files:
+        owner = next((m for m in by_depth if path == m or path.startswith(m + "/")), None)
+        if owner is None:
+            unowned.append(path)
+        else:
+            changed.add(owner)
+    return changed, unowned
+
+
+def _text(element: ET.Element, name: str) -> Optional[str]:
+    for child in element:
+        if _local_name(child.tag) == name and child.text:
+            return child.text.strip()
+    return None
+
+
+def _pom_coordinates(pom_path: str) -> Optional[Tuple[Tuple[str, str], Optional[Tuple[str, str]], Set[Tuple[str, str]]]]:
+    """返回 ((groupId, artifactId), parent, 引用的制品)；引用包括依赖、插件、插件依赖和扩展，
+    不包括 dependencyManagement/pluginManagement 中只声明版本的条目"""
+    try:
+        root = ET.parse(pom_path).getroot()
+    except (ET.ParseError, OSError):
+        return None
+    parent = None
+    for child in root:
+        if _local_name(child.tag) == "parent":
+            parent = (_text(child, "groupId") or "", _text(child, "artifactId") or "")
+    group_id = _text(root, "groupId") or (parent[0] if parent else "")
+    variables = {
+        "${project.groupId}": group_id, "${pom.groupId}": group_id, "${groupId}": group_id,
+        "${project.parent.groupId}": parent[0] if parent else "",
+    }
+
+    references: Set[Tuple[str, str]] = set()
+    pending = [child for child in root if _local_name(child.tag) != "parent"]
+    while pending:
+        element = pending.pop()
+        name = _local_name(element.tag)
+        if name in ("dependencyManagement", "pluginManagement"):
+            continue
+        if name in ("dependency", "plugin", "extension"):
+            artifact_id = _text(element, "artifactId")
+            if artifact_id:
+                ref_group = _text(element, "groupId") or (group_id if name == "dependency" else "org.apache.maven.plugins")
+                references.add((variables.get(ref_group, ref_group), artifact_id))
+        pending.extend(element)
+    return (group_id, _text(root, "artifactId") or ""), parent, references
+
+
+def reactor_modules(project_dir: str, modules: List[str], selected: Iterable[str]) -> List[str]:
+    """`mvn -pl <selected> -am -amd` 实际构建的模块：选中模块 + 它们的上游和下游模块（传递闭包）。
+    根项目记为 ""，作为其他模块的 parent 或被依赖时同样会被构建"""
+    coordinates = {}
+    upstream: Dict[str, Set[str]] = {}
+    parsed = {}
+    for module in [""] + list(modules):
+        result = _pom_coordinates(os.path.join(project_dir, module, "pom.xml"))
+        if result:
+            parsed[module] = result
+            coordinates[result[0]] = module
+    for module, (_, parent, references) in parsed.items():
+        refs = references | ({parent} if parent else set())
+        upstream[module] = {coordinates[ref] for ref in refs if ref in coordinates and coordinates[ref] != module}
+    downstream: Dict[str, Set[str]] = {module: set() for module in upstream}
+    for module, deps in upstream.items():
+        for dep in deps:
+            downstream[dep].add(module)
+
+    built = set(selected)
+    for graph in (upstream, downstream):
+        pending = list(selected)
+        seen = set(pending)
+        while pending:
+            for other in graph.get(pending.pop(), ()):
+                if other not in seen:
+                    seen.add(other)
+                    pending.append(other)
+        built |= seen
+    return sorted(built)
+
+
+def find_module_report(project_dir: str, module: str) -> Optional[str]:
+    """返回模块报告目录（包含 jacoco.xml）"""
+    for location in REPORT_LOCATIONS:
+        report_dir = os.path.join(project_dir, module, *location)
+        if os.path.isfile(os.path.join(report_dir, "jacoco.xml")):
+            return report_dir
+    return None
+
+
+def _report_counters(element: ET.Element) -> Dict[str, Dict[str, int]]:
+    """元素自身（不含子节点）的 counter"""
+    counters = {}
+    for counter in element.findall("counter"):
+        counters[counter.get("type")] = {
+            "missed": int(counter.get("missed", 0)),
+            "covered": int(counter.get("covered", 0)),
+        }
+    return counters
+
+
+def _append_counters(parent: ET.Element, counters: Dict[str, Dict[str, int]]):
+    for counter_type in COUNTER_TYPES:
+        if counter_type in counters:
+            ET.SubElement(parent, "counter", {
+                "type": counter_type,
+                "missed": str(counters[counter_type]["missed"]),
+                "covered": str(counters[counter_type]["covered"]),
+            })
+
+
+def merge_module_reports(
+    report_dirs: Dict[str, str],
+    dest_dir: str,
+    report_name: str,
+    copy_html: bool = True
+) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """合并各模块报告到 dest_dir（jacoco.xml、jacoco.csv、HTML），返回各模块的汇总 counter
+
+    copy_html 为 False 时不复制各模块的 HTML（按需生成 HTML 报告时只需要 xml/csv）
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    merged = ET.Element("report", {"name": report_name})
+    session_ids: Set[str] = set()
+    groups = []
+    module_counters: Dict[str, Dict[str, Dict[str, int]]] = {}
+    totals = {t: {"missed": 0, "covered": 0} for t in COUNTER_TYPES}
+
+    for module in sorted(report_dirs):
+        module_root = ET.parse(os.path.join(report_dirs[module], "jacoco.xml")).getroot()
+        for session in module_root.findall("sessioninfo"):
+            if session.get("id") not in session_ids:
+                session_ids.add(session.get("id"))
+                merged.append(session)
+
+        group = ET.Element("group", {"name": module})
+        for child in module_root:
+            if child.tag in ("group", "package"):
+                group.append(child)
+        counters = _report_counters(module_root)
+        _append_counters(group, counters)
+        groups.append(group)
+
+        module_counters[module] = counters
+        for counter_type, values in counters.items():
+            if counter_type in totals:
+                totals[counter_type]["missed"] += values["missed"]
+                totals[counter_type]["covered"] += values["covered"]
+
+    # DTD 要求 sessioninfo 在前、counter 在后
+    merged.extend(groups)
+    _append_counters(merged, {t: v for t, v in totals.items() if v["missed"] or v["covered"]})
+
+    with open(os.path.join(dest_dir, "jacoco.xml"), "wb") as f:
+        f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>')
+        f.write(_DOCTYPE.encode("utf-8"))
+        f.write(ET.tostring(merged, encoding="utf-8"))
+
+    _merge_csv(report_dirs, os.path.join(dest_dir, "jacoco.csv"))
+    if copy_html:
+        _copy_html(report_dirs, dest_dir, report_name, module_counters)
+    return module_counters
+
+
+def _merge_csv(report_dirs: Dict[str, str], dest_path: str):
+    """合并 jacoco.csv，GROUP 列改为模块路径"""
+    header = None
+    rows = []
+    for module in sorted(report_dirs):
+        csv_path = os.path.join(report_dirs[module], "jacoco.csv")
+        if not os.path.isfile(csv_path):
+            continue
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            module_header = next(reader, None)
+            if module_header is None:
+                continue
+            header = header or module_header
+            rows += [[module] + row[1:] for row in reader if row]
+    if header is None:
+        return
+    with open(dest_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _percent(counters: Dict[str, Dict[str, int]], counter_type: str) -> str:
+    values = counters.get(counter_type)
+    if not values or not values["missed"] + values["covered"]:
+        return "n/a"
+    return f"{values['covered'] / (values['missed'] + values['covered']) * 100:.1f}%"
+
+
+def _copy_html(
+    report_dirs: Dict[str, str],
+    dest_dir: str,
+    report_name: str,
+    module_counters: Dict[str, Dict[str, Dict[str, int]]]
+):
+    """复制各模块 HTML 报告到 <模块路径>/，并生成模块列表首页"""
+    rows = []
+    for module in sorted(report_dirs):
+        module_html = os.path.join(dest_dir, *module.split("/"))
+        if os.path.exists(module_html):
+            shutil.rmtree(module_html)
+        shutil.copytree(
+            report_dirs[module], module_html,
+            ignore=shutil.ignore_patterns("jacoco.xml", "jacoco.csv", "*.exec")
+        )
+        counters = module_counters[module]
+        link = f'<a href="{html.escape(module)}/index.html">{html.escape(module)}</a>'
+        cells = "".join(
+            f"<td>{_percent(counters, t)}</td>" for t in ("INSTRUCTION", "BRANCH", "LINE", "METHOD", "CLASS")
+        )
+        rows.append(f"<tr><td>{link}</td>{cells}</tr>")
+
+    with open(os.path.join(dest_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(
+            "<!DOCTYPE html>\n<html><head><meta charset=\"UTF-8\">"
+            f"<title>{html.escape(report_name)}</title></head><body>\n"
+            f"<h1>{html.escape(report_name)}</h1>\n"
+            "<table border=\"1\" cellspacing=\"0\" cellpadding=\"4\">\n"
+            "<tr><th>模块</th><th>指令</th><th>分支</th><th>行</th><th>方法</th><th>类</th></tr>\n"
+            + "\n".join(rows) +
+            "\n</table>\n</body></html>\n"
+        )
@@ -0,0 +1,149 @@
+"""仓库镜像缓存
+
+每个仓库在本地磁盘保存一份 bare mirror，扫描时只需 `git fetch` 增量更新，
+再通过 `git clone --shared`（alternates 共享对象）生成每个任务独立的检出目录，
+避免每次推送都重新下载完整历史。同一仓库的并发任务通过文件锁串行更新镜像，
+先拿到锁的任务完成 fetch 后，其余任务发现提交已存在即可直接检出。
+"""
+
+import os
+import re
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 下仅使用进程内锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CommandRunner = Callable[..., subprocess.CompletedProcess]
+
+_FULL_SHA_PATTERN = re.compile(r"^[0-9a-fA-F]{40}$")
+
+
+def _default_runner(command: List[str], cwd: str = None, timeout: int = None) -> subprocess.CompletedProcess:
+    return subprocess.run(command, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+
+
+class RepoMirrorCache:
+    """按仓库URL维护 bare mirror 的本地缓存"""
+
+    def __init__(self, cache_dir: str, git_timeout: int = 600):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.git_timeout = git_timeout
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._thread_locks_guard = threading.Lock()
+
+    def mirror_path(self, repo_url: str) -> str:
+        name = repo_url.rstrip('/').split('/')[-1].replace('.git', '') or "repo"
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', name)
+        digest = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{name}-{digest}.git")
+
+    @contextmanager
+    def lock(self, repo_url: str):
+        """同一仓库的镜像更新互斥（进程内线程锁 + 跨进程文件锁）"""
+        mirror = self.mirror_path(repo_url)
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.setdefault(mirror, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{mirror}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _has_commit(self, mirror: str, commit_id: str, run: CommandRunner) -> bool:
+        # 分支名等可变引用总是需要 fetch 最新内容
+        if not _FULL_SHA_PATTERN.match(commit_id or ""):
+            return False
+        result = run(["git", "--git-dir", mirror, "cat-file", "-e", f"{commit_id}^{{commit}}"], timeout=30)
+        return result.returncode == 0
+
+    def update(self, repo_url: str, commit_id: str, request_id: str, run: CommandRunner = None) -> str:
+        """确保镜像中包含指定提交，返回镜像路径"""
+        run = run or _default_runner
+        mirror = self.mirror_path(repo_url)
+
+        with self.lock(repo_url):
+            started = time.time()
+            if not os.path.exists(os.path.join(mirror, "HEAD")):
+                logger.info(f"[{request_id}] 创建仓库镜像: {mirror}")
+                tmp_mirror = f"{mirror}.tmp-{os.getpid()}-{threading.get_ident()}"
+                result = run(["git", "clone", "--mirror", repo_url, tmp_mirror], timeout=self.git_timeout)
+                if result.returncode != 0:
+                    shutil.rmtree(tmp_mirror, ignore_errors=True)
+                    raise Exception(f"创建仓库镜像失败: {result.stderr}")
+                os.replace(tmp_mirror, mirror)
+            elif self._has_commit(mirror, commit_id, run):
+                logger.info(f"[{request_id}] 镜像中已包含提交 {commit_id[:8]}，跳过 fetch")
+                return mirror
+            else:
+                logger.info(f"[{request_id}] 更新仓库镜像: {mirror}")
+                result = run(
+                    ["git", "--git-dir", mirror, "fetch", "--prune", "--tags", "origin"],
+                    timeout=self.git_timeout
+                )
+                if result.returncode != 0:
+                    raise Exception(f"更新仓库镜像失败: {result.stderr}")
+            logger.info(f"[{request_id}] 仓库镜像就绪，耗时 {time.time() - started:.1f}s")
+        return mirror
+
+    def checkout(
+        self,
+        repo_url: str,
+        commit_id: str,
+        branch_name: Optional[str],
+        dest_dir: str,
+        request_id: str,
+        run: CommandRunner = None,
+        persistent: bool = False
+    ) -> str:
+        """从镜像生成独立的检出目录。
+        一次性的检出目录通过 alternates 与镜像共享对象；persistent（长期保留的工作区）时使用本地克隆
+        （对象文件硬链接），不依赖镜像中的对象，镜像 fetch --prune / gc 后也不会损坏"""
+        run = run or _default_runner
+        mirror = self.update(repo_url, commit_id, request_id, run)
+
+        clone_args = ["--no-checkout"] if persistent else ["--shared", "--no-checkout"]
+        result = run(["git", "clone", *clone_args, mirror, dest_dir], timeout=self.git_timeout)
+        if result.returncode != 0:
+            raise Exception(f"从镜像检出失败: {result.stderr}")
+        run(["git", "remote", "set-url", "origin", repo_url], cwd=dest_dir, timeout=30)
+
+        result = run(["git", "checkout", "--detach", commit_id], cwd=dest_dir, timeout=self.git_timeout)
+        if result.returncode != 0 and branch_name:
+            logger.warning(f"[{request_id}] 切换提交失败，使用分支 {branch_name}: {result.stderr}")
+            result = run(
+                ["git", "checkout", "--detach", f"origin/{branch_name}"], cwd=dest_dir, timeout=self.git_timeout
+            )
+        if result.returncode != 0:
+            logger.warning(f"[{request_id}] 切换提交失败，使用默认分支: {result.stderr}")
+            run(["git", "checkout", "--detach", "HEAD"], cwd=dest_dir, timeout=self.git_timeout)
+        return dest_dir
+
+
+_repo_cache: Optional[RepoMirrorCache] = None
+_repo_cache_guard = threading.Lock()
+
+
+def get_repo_cache() -> RepoMirrorCache:
+    global _repo_cache
+    with _repo_cache_guard:
+        if _repo_cache is None:
+            from config.config import CACHE_CONFIG
+            _repo_cache = RepoMirrorCache(CACHE_CONFIG["repo_cache_dir"], CACHE_CONFIG["git_timeout"])
+        return _repo_cache
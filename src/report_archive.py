@@ -0,0 +1,220 @@
+"""归档保存的 HTML 报告
+
+一份 HTML 报告有数千个小文件。开启归档后报告按目录打包（deflate 压缩）：
+    report.zip             根目录及非末级目录中的文件（首页、会话页、模块首页）
+    report.d/<目录>.zip     每个末级目录一个归档（jacoco-resources、每个包的页面）
+归档以固定的时间戳和顺序写出，内容相同的目录得到完全相同的归档。开启去重（blob_store）时归档
+同样以硬链接指向 blob：jacoco-resources 和未改动的包在所有报告间只保存一份，每份报告也只占几十到几百个文件。
+
+请求时直接从归档中读取成员：客户端接受 gzip 时把成员的 deflate 数据原样加上 gzip 头尾返回，
+不需要解压再压缩；否则解压后返回。归档的成员目录按 文件路径 + mtime 缓存在进程内。
+
+响应带强 ETag（成员的 CRC32 和大小）。同一提交重新扫描后新报告发布到相同地址，因此不使用 immutable，
+只短时间缓存，之后按 ETag 重新验证（内容未变时返回 304）。
+"""
+
+import os
+import zlib
+import struct
+import zipfile
+import logging
+import posixpath
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_NAME = "report.zip"
+PACK_DIR_NAME = "report.d"
+
+# 缓存成员目录的归档数（每个归档的目录为数千个条目）
+_INDEX_CACHE_SIZE = 64
+# 本身已压缩的文件以 stored 方式保存
+_STORED_SUFFIXES = (".png", ".gif", ".jpg", ".jpeg", ".ico", ".zip", ".gz", ".woff", ".woff2")
+# 成员使用固定的时间戳，相同内容的目录打包结果逐字节相同（便于去重）
+_MEMBER_DATE = (1980, 1, 1, 0, 0, 0)
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+class ArchiveMember(NamedTuple):
+    header_offset: int
+    compress_type: int
+    compress_size: int
+    file_size: int
+    crc: int
+
+
+class MemberContent(NamedTuple):
+    body: bytes
+    encoding: Optional[str]
+    etag: str
+
+
+def has_archive(report_dir: str) -> bool:
+    return os.path.isfile(os.path.join(report_dir, ARCHIVE_NAME))
+
+
+def _write_archive(entries: List[Tuple[str, str]], archive_path: str):
+    """把 (成员名, 文件路径) 按给定顺序写为归档（先写临时文件再替换）"""
+    fd, tmp_path = tempfile.mkstemp(prefix=".archive-", suffix=".tmp", dir=os.path.dirname(archive_path))
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_path, "w") as zip_file:
+            for arcname, path in entries:
+                info = zipfile.ZipInfo(arcname, date_time=_MEMBER_DATE)
+                info.external_attr = 0o644 << 16
+                # 已压缩的内容（png、gif 等）不再压缩，返回时也不使用 gzip
+                info.compress_type = (zipfile.ZIP_STORED if arcname.lower().endswith(_STORED_SUFFIXES)
+                                      else zipfile.ZIP_DEFLATED)
+                with open(path, "rb") as f:
+                    zip_file.writestr(info, f.read(), compresslevel=6)
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _tree_files(source_dir: str) -> Dict[str, List[Tuple[str, str]]]:
+    """按所在目录（相对路径，根目录为 ""）列出文件，每项为 (相对路径, 文件路径)"""
+    files_by_dir: Dict[str, List[Tuple[str, str]]] = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        rel_dir = os.path.relpath(root, source_dir).replace(os.sep, "/")
+        rel_dir = "" if rel_dir == "." else rel_dir
+        files_by_dir[rel_dir] = [
+            (posixpath.join(rel_dir, name), os.path.join(root, name)) for name in sorted(files)
+        ]
+    return files_by_dir
+
+
+def pack_report(source_dir: str, report_dir: str, blob_store=None) -> Dict[str, int]:
+    """把 HTML 报告按目录打包到 report_dir（report.d/ 下的各目录归档，最后写 report.zip）；
+    传入 blob_store 时归档去重。返回成员数、归档数和去重的归档数"""
+    files_by_dir = _tree_files(source_dir)
+    parents = {posixpath.dirname(rel_dir) for rel_dir in files_by_dir if rel_dir}
+    leaf_dirs = {rel_dir for rel_dir, files in files_by_dir.items() if rel_dir and files and rel_dir not in parents}
+    stats = {"files": 0, "archives": 0, "deduplicated": 0}
+    archives = []
+    for rel_dir in sorted(leaf_dirs):
+        archive_path = os.path.join(report_dir, PACK_DIR_NAME, *f"{rel_dir}.zip".split("/"))
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        # 末级目录的归档中成员名不带目录
+        _write_archive([(posixpath.basename(name), path) for name, path in files_by_dir[rel_dir]], archive_path)
+        archives.append(archive_path)
+        stats["files"] += len(files_by_dir[rel_dir])
+
+    # report.zip 最后写入，作为报告已生成的标志
+    root_entries = [
+        entry for rel_dir, files in sorted(files_by_dir.items()) if rel_dir not in leaf_dirs for entry in files
+    ]
+    archive_path = os.path.join(report_dir, ARCHIVE_NAME)
+    _write_archive(root_entries, archive_path + ".new")
+    archives.append(archive_path + ".new")
+    stats["files"] += len(root_entries)
+
+    for path in archives:
+        stats["archives"] += 1
+        if blob_store is not None and blob_store.store_file(path, path):
+            stats["deduplicated"] += 1
+    os.replace(archive_path + ".new", archive_path)
+    return stats
+
+
+_index_cache: "OrderedDict[Tuple[str, int, int], Dict[str, ArchiveMember]]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def _archive_index(f, archive_path: str) -> Dict[str, ArchiveMember]:
+    stat = os.fstat(f.fileno())
+    key = (os.path.abspath(archive_path), stat.st_mtime_ns, stat.st_size)
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    with zipfile.ZipFile(f) as zip_file:
+        index = {
+            info.filename: ArchiveMember(info.header_offset, info.compress_type, info.compress_size,
+                                         info.file_size, info.CRC)
+            for info in zip_file.infolist() if not info.is_dir()
+        }
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _read_raw(f, member: ArchiveMember) -> bytes:
+    """读取成员的原始（压缩后的）数据"""
+    f.seek(member.header_offset)
+    header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+    if header[0] != b"PK\x03\x04":
+        raise zipfile.BadZipFile("成员本地文件头损坏")
+    # 本地文件头的文件名和扩展字段长度可能与中央目录不同
+    f.seek(header[9] + header[10], os.SEEK_CUR)
+    return f.read(member.compress_size)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """按 Accept-Encoding 的编码名和 q 值判断客户端是否接受 gzip（`gzip;q=0` 表示不接受，`*` 匹配未列出的编码）"""
+    qualities: Dict[str, float] = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return qualities.get("*", 0) > 0
+
+
+def member_etag(member: ArchiveMember, encoding: Optional[str] = None) -> str:
+    suffix = f"-{encoding}" if encoding else ""
+    return f'"{member.crc:08x}-{member.file_size:x}{suffix}"'
+
+
+def read_report_member(report_dir: str, name: str, accept_gzip: bool = False) -> Optional[MemberContent]:
+    """读取报告中的文件（name 为报告内的相对路径）；按目录打包的报告先查所在目录的归档，
+    只有一个 report.zip 的旧报告直接从中读取"""
+    rel_dir, base_name = posixpath.split(name)
+    if rel_dir:
+        archive_path = os.path.join(report_dir, PACK_DIR_NAME, *f"{rel_dir}.zip".split("/"))
+        if os.path.isfile(archive_path):
+            return read_member(archive_path, base_name, accept_gzip)
+    archive_path = os.path.join(report_dir, ARCHIVE_NAME)
+    if not os.path.isfile(archive_path):
+        return None
+    return read_member(archive_path, name, accept_gzip)
+
+
+def read_member(archive_path: str, name: str, accept_gzip: bool = False) -> Optional[MemberContent]:
+    """读取归档成员；成员不存在时返回 None"""
+    # 目录和数据从同一个打开的文件读取，归档被替换时也不会错位
+    with open(archive_path, "rb") as f:
+        member = _archive_index(f, archive_path).get(name)
+        if member is None:
+            return None
+        raw = _read_raw(f, member)
+    if member.compress_type == zipfile.ZIP_STORED:
+        return MemberContent(raw, None, member_etag(member))
+    if member.compress_type != zipfile.ZIP_DEFLATED:
+        raise zipfile.BadZipFile(f"不支持的压缩方式 {member.compress_type}: {name}")
+    if accept_gzip:
+        trailer = struct.pack("<II", member.crc, member.file_size & 0xFFFFFFFF)
+        return MemberContent(_GZIP_HEADER + raw + trailer, "gzip", member_etag(member, "gzip"))
+    return MemberContent(zlib.decompress(raw, -zlib.MAX_WBITS), None, member_etag(member))
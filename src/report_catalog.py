@@ -0,0 +1,320 @@
+"""已发布报告的目录（catalog）
+
+发布报告时写入 SQLite，`GET /reports` 按索引分页查询，不再每次遍历报告目录。
+按 (created_at, project, commit_dir) 倒序分页，游标是上一页最后一项的这三个值，
+翻页时不受新发布报告的影响。目录与磁盘不一致时（手动删除、升级前的报告）执行 rebuild 从磁盘重建。
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.report_summary import load_summary
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_catalog (
+    project TEXT NOT NULL,
+    commit_dir TEXT NOT NULL,
+    commit_id TEXT,
+    branch TEXT,
+    created_at REAL NOT NULL,
+    line_coverage REAL,
+    branch_coverage REAL,
+    coverage TEXT,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project, commit_dir)
+);
+CREATE INDEX IF NOT EXISTS idx_report_catalog_time ON report_catalog (created_at, project, commit_dir);
+CREATE INDEX IF NOT EXISTS idx_report_catalog_project ON report_catalog (project, created_at);
+CREATE INDEX IF NOT EXISTS idx_report_catalog_branch ON report_catalog (project, branch, created_at);
+"""
+
+_COLUMNS = (
+    "project", "commit_dir", "commit_id", "branch", "created_at", "line_coverage", "branch_coverage", "coverage",
+    "size_bytes"
+)
+
+
+def report_marker(report_dir: str) -> Optional[str]:
+    """报告目录中标志报告已发布的文件（按需生成的报告以数据文件为准，HTML 可能尚未生成）"""
+    for name in (os.path.join("_data", "jacoco.xml"), "report.zip", "index.html"):
+        path = os.path.join(report_dir, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def report_size(report_dir: str) -> int:
+    """报告占用的磁盘空间：硬链接共享的文件（去重存储）按引用它的报告数分摊，
+    报告总和与实际磁盘占用一致，而不是每份报告都按完整大小计入"""
+    from src.blob_store import get_blob_store
+
+    # 开启去重时 blob 本身占一个链接
+    blob_links = 1 if get_blob_store() is not None else 0
+    total = 0
+    for root, _, files in os.walk(report_dir):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.st_nlink > 1:
+                total += stat.st_size // max(1, stat.st_nlink - blob_links)
+            else:
+                total += stat.st_size
+    return total
+
+
+def encode_cursor(item: Dict[str, Any]) -> str:
+    raw = json.dumps([item["created_at"], item["project"], item["commit_dir"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, project, commit_dir = json.loads(raw)
+        return float(created_at), str(project), str(commit_dir)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def _row_item(row: sqlite3.Row) -> Dict[str, Any]:
+    item = {column: row[column] for column in _COLUMNS}
+    item["coverage"] = json.loads(row["coverage"]) if row["coverage"] else None
+    return item
+
+
+class ReportCatalog:
+    """SQLite 报告目录"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.created = not os.path.exists(db_path)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(report_catalog)")}
+            if "size_bytes" not in columns:
+                conn.execute("ALTER TABLE report_catalog ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- 写入 ----
+
+    @staticmethod
+    def _values(project, commit_dir, commit_id, branch, created_at, summary, size_bytes) -> tuple:
+        coverage = summary["coverage"] if summary else None
+        return (
+            project, commit_dir, commit_id.lower() if commit_id else None, branch, created_at,
+            coverage.get("line_coverage") if coverage else None,
+            coverage.get("branch_coverage") if coverage else None,
+            json.dumps(coverage) if coverage else None,
+            size_bytes or 0,
+        )
+
+    def record(
+        self,
+        project: str,
+        commit_dir: str,
+        commit_id: str = None,
+        branch: str = None,
+        summary: Dict[str, Any] = None,
+        created_at: float = None,
+        size_bytes: int = 0
+    ):
+        """记录（或更新）一份已发布的报告；summary 为 report_summary 的摘要"""
+        values = self._values(project, commit_dir, commit_id, branch, created_at or time.time(), summary, size_bytes)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO report_catalog ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                values
+            )
+
+    def update_size(self, project: str, commit_dir: str, size_bytes: int):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE report_catalog SET size_bytes = ? WHERE project = ? AND commit_dir = ?",
+                (size_bytes, project, commit_dir)
+            )
+
+    def remove(self, project: str, commit_dir: str):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM report_catalog WHERE project = ? AND commit_dir = ?", (project, commit_dir))
+
+    def rebuild(self, reports_dir: str) -> int:
+        """按磁盘上的报告目录重建，返回报告数
+
+        遍历磁盘期间不持有锁；写入时与已有记录合并：遍历开始后新记录的报告保持不变，
+        磁盘上没有提交SHA和分支时沿用已有记录中的，只删除开始前已记录、磁盘上已不存在的报告"""
+        from src.coverage_store import get_coverage_store
+
+        started = time.time()
+        store = get_coverage_store()
+        rows = []
+        if os.path.isdir(reports_dir):
+            for project in sorted(os.listdir(reports_dir)):
+                project_dir = os.path.join(reports_dir, project)
+                # 以 . 开头的是内部目录（如 .blobs）
+                if project.startswith(".") or not os.path.isdir(project_dir):
+                    continue
+                for commit_dir in sorted(os.listdir(project_dir)):
+                    # 以 . 开头的是报告的版本目录，通过 <提交> 链接收录
+                    if commit_dir.startswith("."):
+                        continue
+                    commit_path = os.path.join(project_dir, commit_dir)
+                    marker = report_marker(commit_path)
+                    if marker is None:
+                        continue
+                    xml_path = marker if marker.endswith(".xml") else os.path.join(commit_path, "jacoco.xml")
+                    # 提交SHA和分支只有扫描记录里有
+                    scan = store.find_scan(project, commit_dir)
+                    rows.append(list(self._values(
+                        project, commit_dir,
+                        scan["commit_id"] if scan else None, scan["branch"] if scan else None,
+                        os.path.getmtime(marker), load_summary(commit_path, xml_path), report_size(commit_path)
+                    )))
+
+        on_disk = {(row[0], row[1]) for row in rows}
+        with self._lock, self._connect() as conn:
+            existing = {
+                (row["project"], row["commit_dir"]): row
+                for row in conn.execute("SELECT project, commit_dir, commit_id, branch, created_at FROM report_catalog")
+            }
+            merged = []
+            for row in rows:
+                current = existing.get((row[0], row[1]))
+                if current is not None:
+                    if current["created_at"] >= started:
+                        continue
+                    row[2] = row[2] or current["commit_id"]
+                    row[3] = row[3] or current["branch"]
+                merged.append(row)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO report_catalog ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                merged
+            )
+            conn.executemany(
+                "DELETE FROM report_catalog WHERE project = ? AND commit_dir = ? AND created_at < ?",
+                [key + (started,) for key in existing if key not in on_disk]
+            )
+        logger.info(f"报告目录重建完成: {len(rows)} 份报告")
+        return len(rows)
+
+    # ---- 查询 ----
+
+    def list_reports(
+        self,
+        project: str = None,
+        branch: str = None,
+        since: float = None,
+        limit: int = 100,
+        cursor: str = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """按发布时间倒序分页，返回 (报告列表, 下一页游标)"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions, params = [], []
+        if project:
+            conditions.append("project = ?")
+            params.append(project)
+        if branch:
+            conditions.append("branch = ?")
+            params.append(branch)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if cursor:
+            conditions.append("(created_at, project, commit_dir) < (?, ?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM report_catalog {where}"
+                " ORDER BY created_at DESC, project DESC, commit_dir DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        items = [_row_item(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def latest_per_branch(self, project: str) -> List[Dict[str, Any]]:
+        """每个分支最近一次发布的报告"""
+        with self._connect() as conn:
+            # SQLite 中与 MAX() 一起查询的其他列取自最大值所在的行
+            rows = conn.execute(
+                "SELECT *, MAX(created_at) FROM report_catalog WHERE project = ? GROUP BY branch"
+                " ORDER BY created_at DESC",
+                (project,)
+            ).fetchall()
+        return [_row_item(row) for row in rows]
+
+    def retention_entries(self) -> List[Dict[str, Any]]:
+        """清理策略需要的字段，按项目、分支、发布时间倒序"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT project, commit_dir, commit_id, branch, created_at, size_bytes FROM report_catalog"
+                " ORDER BY project, branch, created_at DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM report_catalog").fetchone()[0]
+
+
+_report_catalog: Optional[ReportCatalog] = None
+_report_catalog_guard = threading.Lock()
+
+
+def get_report_catalog() -> ReportCatalog:
+    global _report_catalog
+    with _report_catalog_guard:
+        if _report_catalog is None:
+            from config.config import REPORT_CONFIG
+            _report_catalog = ReportCatalog(REPORT_CONFIG["catalog_db"])
+            if _report_catalog.created:
+                # 新建的目录在后台收录已有的报告（遍历报告目录、解析摘要），不阻塞调用方
+                threading.Thread(
+                    target=_initial_rebuild, args=(_report_catalog, REPORT_CONFIG["reports_dir"]),
+                    name="report-catalog-rebuild", daemon=True
+                ).start()
+        return _report_catalog
+
+
+def _initial_rebuild(catalog: ReportCatalog, reports_dir: str):
+    try:
+        catalog.rebuild(reports_dir)
+    except Exception as e:
+        logger.error(f"报告目录重建失败: {str(e)}")
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行: python -m src.report_catalog rebuild [报告目录]"""
+    argv = sys.argv[1:] if argv is None else argv
+    from config.config import REPORT_CONFIG
+    if argv and argv[0] == "rebuild" and len(argv) <= 2:
+        reports_dir = argv[1] if len(argv) == 2 else REPORT_CONFIG["reports_dir"]
+        count = ReportCatalog(REPORT_CONFIG["catalog_db"]).rebuild(reports_dir)
+        print(f"报告目录已重建: {count} 份报告 ({REPORT_CONFIG['catalog_db']})")
+        return 0
+    print(main.__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
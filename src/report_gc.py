@@ -0,0 +1,266 @@
+"""报告保留策略与后台清理
+
+后台线程定期执行一轮清理：
+- 报告：按报告目录（report_catalog）中的记录决定删除哪些，不遍历报告目录
+    1. 受保护分支（main/master 等）在 protected_days 天内的报告全部保留
+    2. 其余报告每个项目每个分支保留最近 keep_per_branch 份
+    3. 报告总大小超过 max_total_bytes 时从最旧的未受保护报告开始删除（每个分支至少保留最近一份）
+- 扫描临时目录：系统临时目录和 staging 目录下超过 temp_max_age 的 jacoco_reports_* 等目录（异常退出的扫描留下的），
+  以及重新发布时替换下来的旧报告
+- 未发布的版本目录：发布中断或同一提交并发发布时留下的、没有被报告链接引用且超过 temp_max_age 的 `.<提交>.<版本>` 目录
+- 覆盖率：删除报告时一并删除该提交在 coverage_store 中的细粒度覆盖率，以及写入中断留下的数据
+- blob：删除报告后按 blob_prune_interval 清理不再被引用的 blob
+
+每轮最多删除 max_deletions_per_pass 份报告，剩下的留到下一轮；删除文件按 delete_rate（个/秒）限速，
+避免与正在进行的扫描争抢磁盘 I/O。项目级规则通过 project_overrides 覆盖全局规则。
+"""
+
+import os
+import time
+import shutil
+import fnmatch
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.report_publish import RETIRED_PREFIX, orphan_versions, unpublish
+
+logger = logging.getLogger(__name__)
+
+# 扫描过程中创建的临时目录前缀
+TEMP_DIR_PREFIXES = ("jacoco_reports_", "jacoco_local_", "jacoco_docker_", "jacoco_sources_")
+# 重新发布时替换下来的旧版本，短暂保留给正在读取的请求
+RETIRED_GRACE_SECONDS = 60
+
+
+class RateLimiter:
+    """按每秒操作数限速（令牌桶）"""
+
+    def __init__(self, rate: float, stop_event: threading.Event = None):
+        self.rate = rate
+        self._stop_event = stop_event
+        self._tokens = rate
+        self._last = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens < 1:
+            delay = (1 - self._tokens) / self.rate
+            if self._stop_event is not None:
+                self._stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+            self._last = time.monotonic()
+            self._tokens = 1
+        self._tokens -= 1
+
+
+def remove_tree(path: str, limiter: RateLimiter = None) -> int:
+    """限速删除目录，返回删除的文件数"""
+    removed = 0
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                os.unlink(os.path.join(root, name))
+                removed += 1
+            except FileNotFoundError:
+                continue
+        for name in dirs:
+            full_path = os.path.join(root, name)
+            if os.path.islink(full_path):
+                os.unlink(full_path)
+            else:
+                shutil.rmtree(full_path, ignore_errors=True)
+    shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+def _rules_for(config: Dict[str, Any], project: str) -> Dict[str, Any]:
+    rules = {key: config[key] for key in ("keep_per_branch", "protected_branches", "protected_days")}
+    rules.update((config.get("project_overrides") or {}).get(project, {}))
+    return rules
+
+
+def plan_deletions(entries: List[Dict[str, Any]], config: Dict[str, Any], now: float = None) -> List[Dict[str, Any]]:
+    """根据保留规则选出要删除的报告（entries 为 ReportCatalog.retention_entries 的结果），最旧的在前"""
+    now = now or time.time()
+    doomed, survivors = [], []
+    position: Dict[tuple, int] = {}
+    for entry in entries:
+        rules = _rules_for(config, entry["project"])
+        key = (entry["project"], entry["branch"])
+        # entries 按项目、分支、时间倒序，position 即该分支上更新的报告数
+        rank = position.get(key, 0)
+        position[key] = rank + 1
+        branch = entry["branch"] or ""
+        protected = (
+            any(fnmatch.fnmatchcase(branch, pattern) for pattern in rules["protected_branches"])
+            and now - entry["created_at"] < rules["protected_days"] * 86400
+        )
+        if protected or rank < rules["keep_per_branch"]:
+            survivors.append(dict(entry, protected=protected or rank == 0))
+        else:
+            doomed.append(entry)
+
+    budget = config.get("max_total_bytes") or 0
+    if budget > 0:
+        total = sum(entry["size_bytes"] for entry in survivors)
+        for entry in sorted((e for e in survivors if not e["protected"]), key=lambda e: e["created_at"]):
+            if total <= budget:
+                break
+            doomed.append(entry)
+            total -= entry["size_bytes"]
+        if total > budget:
+            logger.warning(f"只剩受保护的报告，仍有 {total / 1024 / 1024:.1f} MB，超过报告总大小上限")
+    doomed.sort(key=lambda e: e["created_at"])
+    return doomed
+
+
+class ReportGarbageCollector:
+    """后台清理线程"""
+
+    def __init__(self, reports_dir: str, config: Dict[str, Any], temp_dirs: List[str] = None):
+        self.reports_dir = reports_dir
+        self.config = config
+        self.temp_dirs = temp_dirs or [tempfile.gettempdir()]
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        self._pending_prune = False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="report-gc", daemon=True)
+        self._thread.start()
+        logger.info(f"启动报告清理线程（间隔 {self.config['interval']} 秒）")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        # 启动后先等一个间隔，不与启动时的扫描争抢 I/O
+        while not self._stop_event.wait(self.config["interval"]):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"报告清理失败: {str(e)}")
+
+    def run_once(self) -> Dict[str, int]:
+        """执行一轮清理"""
+        from src.report_catalog import get_report_catalog
+        from src.coverage_store import get_coverage_store
+
+        limiter = RateLimiter(self.config["delete_rate"], self._stop_event)
+        stats = {"reports": 0, "temp_dirs": 0, "orphans": 0, "files": 0, "blobs": 0}
+
+        catalog = get_report_catalog()
+        coverage_store = get_coverage_store()
+        doomed = plan_deletions(catalog.retention_entries(), self.config)
+        for entry in doomed[:self.config["max_deletions_per_pass"]]:
+            if self._stop_event.is_set():
+                break
+            report_dir = os.path.join(self.reports_dir, entry["project"], entry["commit_dir"])
+            # 先从目录中移除并撤下链接，列表和链接不再指向删除中的报告
+            catalog.remove(entry["project"], entry["commit_dir"])
+            target = unpublish(report_dir)
+            if target is not None:
+                stats["files"] += remove_tree(target, limiter)
+            self._delete_coverage(coverage_store, entry)
+            stats["reports"] += 1
+        if stats["reports"]:
+            self._pending_prune = True
+            logger.info(f"清理报告 {stats['reports']} 份（待清理 {len(doomed) - stats['reports']} 份）")
+
+        coverage_store.delete_incomplete()
+        stats["temp_dirs"], files = self._clean_temp_dirs(limiter)
+        stats["files"] += files
+        stats["orphans"], files = self._clean_orphan_versions(limiter)
+        stats["files"] += files
+
+        if self._pending_prune and time.time() - self._last_prune >= self.config["blob_prune_interval"]:
+            from src.blob_store import get_blob_store
+            blob_store = get_blob_store()
+            if blob_store is not None:
+                stats["blobs"] = blob_store.prune(limiter)["removed"]
+            self._last_prune = time.time()
+            self._pending_prune = False
+        return stats
+
+    @staticmethod
+    def _delete_coverage(coverage_store, entry: Dict[str, Any]):
+        """报告删除后同时删除该提交的细粒度覆盖率"""
+        commit_id = entry.get("commit_id")
+        if not commit_id:
+            # 从磁盘重建的目录项没有完整SHA，按报告目录名（SHA前8位）查找
+            scan = coverage_store.find_scan(entry["project"], entry["commit_dir"])
+            commit_id = scan["commit_id"] if scan else None
+        if commit_id:
+            try:
+                coverage_store.delete_scan(entry["project"], commit_id)
+            except Exception as e:
+                logger.warning(f"删除覆盖率数据失败: {entry['project']}/{commit_id[:8]}: {str(e)}")
+
+    def _clean_orphan_versions(self, limiter: RateLimiter):
+        """删除发布中断或并发发布留下的、没有被报告链接引用的版本目录"""
+        removed_dirs = removed_files = 0
+        try:
+            projects = [entry for entry in os.scandir(self.reports_dir)
+                        if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return 0, 0
+        for project in projects:
+            if self._stop_event.is_set():
+                break
+            try:
+                orphans = orphan_versions(project.path, self.config["temp_max_age"])
+            except OSError:
+                continue
+            for path in orphans:
+                if os.path.islink(path):
+                    os.unlink(path)
+                else:
+                    removed_files += remove_tree(path, limiter)
+                removed_dirs += 1
+                logger.info(f"清理未发布的报告版本: {path}")
+        return removed_dirs, removed_files
+
+    def _clean_temp_dirs(self, limiter: RateLimiter):
+        """删除异常退出的扫描留下的临时目录和重新发布时替换下来的旧报告"""
+        removed_dirs = removed_files = 0
+        now = time.time()
+        for temp_dir in self.temp_dirs:
+            try:
+                entries = list(os.scandir(temp_dir))
+            except OSError:
+                continue
+            for entry in entries:
+                if self._stop_event.is_set():
+                    break
+                if entry.name.startswith(RETIRED_PREFIX):
+                    max_age = RETIRED_GRACE_SECONDS
+                elif entry.name.startswith(TEMP_DIR_PREFIXES):
+                    max_age = self.config["temp_max_age"]
+                else:
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                    if not entry.is_dir(follow_symlinks=False) or now - max(stat.st_mtime, stat.st_ctime) < max_age:
+                        continue
+                except OSError:
+                    continue
+                removed_files += remove_tree(entry.path, limiter)
+                removed_dirs += 1
+                logger.info(f"清理过期临时目录: {entry.path}")
+        return removed_dirs, removed_files
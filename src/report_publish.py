@@ -0,0 +1,187 @@
+"""报告发布：少复制、原子替换
+
+扫描的临时报告目录建在报告目录所在文件系统的 `.staging/` 下，发布时文件通过 rename / 硬链接进入报告目录，
+不再逐个复制。从构建工作区取报告时：一次性工作区直接 rename（或硬链接），增量构建保留的工作区
+使用 reflink（btrfs/XFS 等支持时共享数据块），都不支持时才复制。
+
+每份报告发布到 `<项目>/.<提交>.<版本>/`，`<项目>/<提交>` 是指向它的符号链接；重新发布同一提交时
+先写好新版本再原子地替换符号链接，读取方看到的总是完整的旧报告或新报告。替换下来的旧版本移到
+`.staging/` 下，由清理线程限速删除；发布中断留下的、没有被链接引用的版本目录也由清理线程删除。
+"""
+
+import os
+import time
+import uuid
+import errno
+import ctypes
+import shutil
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+RETIRED_PREFIX = "jacoco_retired_"
+LINK_SUFFIX = ".link"
+
+# linux/fs.h: FICLONE
+_FICLONE = 0x40049409
+# fcntl.h: AT_FDCWD, RENAME_EXCHANGE
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:  # 非 Linux
+        return False
+    try:
+        with open(src, "rb") as source, open(dst, "wb") as target:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def clone_file(src: str, dst: str, allow_link: bool = False) -> str:
+    """不复制数据地得到 src 的副本：硬链接（allow_link 时，src 之后不会被原地改写）、reflink，最后才复制。
+    返回使用的方式"""
+    if allow_link:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def transfer_tree(src: str, dst: str, disposable: bool = False) -> str:
+    """把目录放到 dst：src 可丢弃时直接 rename（同一文件系统），否则逐个文件 clone_file"""
+    if disposable:
+        try:
+            os.rename(src, dst)
+            return "rename"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    methods = set()
+
+    def copy_function(source, target):
+        methods.add(clone_file(source, target, allow_link=disposable))
+
+    shutil.copytree(src, dst, copy_function=copy_function)
+    return "/".join(sorted(methods)) or "copy"
+
+
+def transfer_file(src: str, dst: str, disposable: bool = False) -> str:
+    if disposable:
+        try:
+            os.rename(src, dst)
+            return "rename"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    return clone_file(src, dst, allow_link=disposable)
+
+
+def new_version_dir(final_path: str) -> str:
+    """final_path 的新版本目录（与 final_path 同目录，名称以 . 开头）"""
+    parent, name = os.path.split(final_path)
+    path = os.path.join(parent, f".{name}.{uuid.uuid4().hex[:12]}")
+    os.makedirs(path)
+    return path
+
+
+def retire(path: str, staging_dir: str):
+    """把不再使用的目录移到 staging_dir，由清理线程删除"""
+    os.makedirs(staging_dir, exist_ok=True)
+    target = os.path.join(staging_dir, f"{RETIRED_PREFIX}{uuid.uuid4().hex[:12]}")
+    try:
+        os.rename(path, target)
+    except OSError as e:
+        logger.warning(f"移出旧报告失败，直接删除: {path}: {str(e)}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _exchange(path_a: str, path_b: str) -> bool:
+    """原子地交换两个路径（Linux renameat2 RENAME_EXCHANGE），不支持时返回 False"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError, TypeError):
+        return False
+    result = renameat2(_AT_FDCWD, os.fsencode(path_a), _AT_FDCWD, os.fsencode(path_b), _RENAME_EXCHANGE)
+    if result != 0:
+        error = ctypes.get_errno()
+        if error in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP):
+            return False
+        raise OSError(error, os.strerror(error), path_a)
+    return True
+
+
+def publish_dir(version_dir: str, final_path: str, staging_dir: str):
+    """原子地让 final_path 指向 version_dir，并移走旧版本"""
+    parent, name = os.path.split(final_path)
+    link_tmp = os.path.join(parent, f".{name}.{uuid.uuid4().hex[:12]}{LINK_SUFFIX}")
+    os.symlink(os.path.basename(version_dir), link_tmp)
+    try:
+        if os.path.isdir(final_path) and not os.path.islink(final_path):
+            # 升级前发布的普通目录：符号链接不能直接替换目录，与临时链接原子交换，交换下来的目录再移走
+            if _exchange(link_tmp, final_path):
+                retire(link_tmp, staging_dir)
+                return
+            # 不支持交换时只能先移走再建立链接（短暂不可见）
+            retire(final_path, staging_dir)
+        previous = os.path.realpath(final_path) if os.path.islink(final_path) else None
+        os.replace(link_tmp, final_path)
+    except BaseException:
+        if os.path.lexists(link_tmp):
+            os.unlink(link_tmp)
+        raise
+
+    if previous and previous != os.path.realpath(version_dir) and os.path.isdir(previous):
+        retire(previous, staging_dir)
+
+
+def is_version_name(name: str) -> bool:
+    """报告目录中的版本目录（.<提交>.<版本>）或发布用的临时链接"""
+    return name.startswith(".") and name.count(".") >= 2
+
+
+def orphan_versions(project_dir: str, max_age: float, now: float = None) -> List[str]:
+    """项目目录中没有被任何报告链接引用、且超过 max_age 秒未修改的版本目录和临时链接
+    （发布中断或同一提交并发发布时留下的）"""
+    now = now or time.time()
+    entries = list(os.scandir(project_dir))
+    referenced = set()
+    for entry in entries:
+        if not entry.name.startswith(".") and entry.is_symlink():
+            referenced.add(os.path.basename(os.readlink(entry.path)))
+    orphans = []
+    for entry in entries:
+        if not is_version_name(entry.name) or entry.name in referenced:
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if now - max(stat.st_mtime, stat.st_ctime) >= max_age:
+            orphans.append(entry.path)
+    return orphans
+
+
+def unpublish(final_path: str) -> Optional[str]:
+    """撤下报告：先删除链接（不再可见），返回需要删除的实际目录"""
+    if os.path.islink(final_path):
+        target = os.path.realpath(final_path)
+        os.unlink(final_path)
+        return target if os.path.isdir(target) else None
+    if os.path.isdir(final_path):
+        return final_path
+    return None
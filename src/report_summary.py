@@ -0,0 +1,131 @@
+"""报告摘要（summary.json）与解析结果缓存
+
+扫描时从 jacoco.xml 计算一次报告级别的覆盖率，写入报告目录下的 summary.json；
+之后解析结果、报告列表等都读取摘要，不再解析 XML。读取过的摘要按 文件路径 + mtime + 大小
+缓存在进程内，超过容量时淘汰最久未使用的条目。没有摘要的旧报告在第一次读取时从 XML 补写。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.jacoco_xml import coverage_percentages, read_report_counters
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILE = "summary.json"
+SUMMARY_VERSION = 1
+
+
+class SummaryCache:
+    """按字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, int, int], Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> Optional[Tuple[str, int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        key = self._key(path)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, path: str, value: Dict[str, Any], size: int):
+        key = self._key(path)
+        if key is None or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+
+_summary_cache: Optional[SummaryCache] = None
+_summary_cache_guard = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    global _summary_cache
+    with _summary_cache_guard:
+        if _summary_cache is None:
+            from config.config import REPORT_CONFIG
+            _summary_cache = SummaryCache(REPORT_CONFIG["summary_cache_bytes"])
+        return _summary_cache
+
+
+def build_summary(xml_path: str) -> Dict[str, Any]:
+    """从 jacoco.xml 计算报告级别的覆盖率（流式解析）"""
+    counters = read_report_counters(xml_path)
+    return {
+        "summary_version": SUMMARY_VERSION,
+        "coverage": coverage_percentages(counters),
+        "counters": counters,
+        "generated_at": time.time(),
+    }
+
+
+def write_summary(report_dir: str, xml_path: str) -> Dict[str, Any]:
+    """计算摘要并写入 report_dir/summary.json"""
+    summary = build_summary(xml_path)
+    path = os.path.join(report_dir, SUMMARY_FILE)
+    data = json.dumps(summary, ensure_ascii=False)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    get_summary_cache().put(path, summary, len(data))
+    return summary
+
+
+def load_summary(report_dir: str, xml_path: str = None) -> Optional[Dict[str, Any]]:
+    """读取报告摘要；没有有效摘要且提供了 xml_path 时从 XML 生成一次"""
+    path = os.path.join(report_dir, SUMMARY_FILE)
+    cache = get_summary_cache()
+    summary = cache.get(path)
+    if summary is not None:
+        return summary
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = f.read()
+        summary = json.loads(data)
+        if summary.get("summary_version") == SUMMARY_VERSION:
+            cache.put(path, summary, len(data))
+            return summary
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    if xml_path and os.path.isfile(xml_path):
+        try:
+            return write_summary(report_dir, xml_path)
+        except Exception as e:
+            logger.warning(f"生成报告摘要失败: {xml_path}: {str(e)}")
+    return None
@@ -0,0 +1,116 @@
+"""提交级扫描结果缓存
+
+以 仓库URL + 完整提交SHA + 扫描配置哈希 为键保存扫描结果。
+同一提交再次触发扫描（webhook 重发、从已扫描提交创建分支、打标签）时
+直接返回已保存的覆盖率和报告链接，不再克隆仓库和运行 Maven。
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_FULL_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_results (
+    cache_key TEXT PRIMARY KEY,
+    repo_url TEXT NOT NULL,
+    commit_id TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    project TEXT,
+    report_path TEXT,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_scan_results_repo_commit ON scan_results (repo_url, commit_id);
+"""
+
+
+def is_full_commit_sha(commit_id: str) -> bool:
+    """只有完整的提交SHA才能作为缓存键（分支名等会随推送变化）"""
+    return bool(commit_id) and bool(_FULL_SHA_PATTERN.match(commit_id.lower()))
+
+
+def make_cache_key(repo_url: str, commit_id: str, config_hash: str) -> str:
+    raw = f"{repo_url}\n{commit_id.lower()}\n{config_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ScanResultCache:
+    """SQLite 扫描结果缓存"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, repo_url: str, commit_id: str, config_hash: str) -> Optional[Dict[str, Any]]:
+        """查询缓存；报告目录已被删除时视为未命中"""
+        if not is_full_commit_sha(commit_id):
+            return None
+        cache_key = make_cache_key(repo_url, commit_id, config_hash)
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM scan_results WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is None:
+            return None
+        if row["report_path"] and not os.path.exists(row["report_path"]):
+            logger.info(f"缓存的报告已不存在，忽略缓存: {row['report_path']}")
+            self.invalidate(repo_url, commit_id, config_hash)
+            return None
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE scan_results SET hits = hits + 1 WHERE cache_key = ?", (cache_key,))
+        entry = json.loads(row["result"])
+        entry["cached_at"] = row["created_at"]
+        return entry
+
+    def put(
+        self,
+        repo_url: str,
+        commit_id: str,
+        config_hash: str,
+        result: Dict[str, Any],
+        project: str = None,
+        report_path: str = None
+    ) -> bool:
+        if not is_full_commit_sha(commit_id):
+            return False
+        cache_key = make_cache_key(repo_url, commit_id, config_hash)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_results (cache_key, repo_url, commit_id, config_hash, project,"
+                " report_path, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, repo_url, commit_id.lower(), config_hash, project, report_path,
+                 json.dumps(result, ensure_ascii=False, default=str), time.time())
+            )
+        return True
+
+    def invalidate(self, repo_url: str, commit_id: str, config_hash: str = None) -> int:
+        with self._lock, self._connect() as conn:
+            if config_hash:
+                cursor = conn.execute(
+                    "DELETE FROM scan_results WHERE cache_key = ?",
+                    (make_cache_key(repo_url, commit_id, config_hash),)
+                )
+            else:
+                cursor = conn.execute(
+                    "DELETE FROM scan_results WHERE repo_url = ? AND commit_id = ?",
+                    (repo_url, commit_id.lower())
+                )
+            return cursor.rowcount
@@ -0,0 +1,418 @@
+"""扫描任务队列
+
+基于 SQLite 的持久化任务队列：webhook 只负责入队，后台 worker 线程池
+依次取出任务执行扫描。服务重启后，未完成的任务会重新回到队列中；
+每次领取都会计数，已领取 max_attempts 次仍未完成的任务（如每次都导致进程崩溃）标记为失败，不再重试。
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_SUPERSEDED = "superseded"
+
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED, STATUS_SUPERSEDED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT,
+    project TEXT,
+    repo_url TEXT,
+    branch_name TEXT,
+    commit_id TEXT,
+    event_type TEXT,
+    params TEXT,
+    result TEXT,
+    coverage_summary TEXT,
+    report_url TEXT,
+    stage_times TEXT,
+    superseded_by TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    available_at REAL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_status_created ON scan_jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_project_branch ON scan_jobs (project, branch_name, created_at);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_repo_branch_status ON scan_jobs (repo_url, branch_name, status);
+"""
+
+# 旧版本数据库中缺少的列
+_MIGRATION_COLUMNS = {
+    "coverage_summary": "TEXT",
+    "report_url": "TEXT",
+    "stage_times": "TEXT",
+    "superseded_by": "TEXT",
+    "cancel_requested": "INTEGER NOT NULL DEFAULT 0",
+    "available_at": "REAL",
+}
+
+
+class JobCancelled(Exception):
+    """扫描任务在执行过程中被取消（被新推送取代或被手动取消）"""
+
+
+def new_job_id() -> str:
+    """生成不会冲突的任务ID（同一秒内的多次推送也互不相同）"""
+    return f"scan_{uuid.uuid4().hex}"
+
+
+class ScanQueue:
+    """SQLite 持久化扫描队列"""
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        self.db_path = db_path
+        self.max_attempts = max(1, max_attempts)
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA.split(";")[0])
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(scan_jobs)")}
+            for column, column_type in _MIGRATION_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE scan_jobs ADD COLUMN {column} {column_type}")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for key in ("params", "result", "coverage_summary", "stage_times"):
+            if job.get(key):
+                job[key] = json.loads(job[key])
+        return job
+
+    def enqueue(
+        self,
+        repo_url: str,
+        commit_id: str,
+        branch_name: str,
+        project: str,
+        event_type: str,
+        params: Dict[str, Any] = None,
+        job_id: str = None,
+        coalesce: bool = False,
+        delay: float = 0
+    ) -> str:
+        """新增扫描任务，返回任务ID
+
+        coalesce 为 True 时，同一仓库同一分支上尚未开始的任务会被标记为 superseded；
+        delay 秒内任务不会被领取，以便合并短时间内的连续推送。
+        """
+        job_id = job_id or new_job_id()
+        now = time.time()
+        params = dict(params or {})
+        with self._lock, self._connect() as conn:
+            if coalesce:
+                # 合并后的任务覆盖所有被取代的推送，变更范围从最早一次推送的 before 开始
+                oldest = conn.execute(
+                    "SELECT params FROM scan_jobs WHERE repo_url = ? AND branch_name = ? AND status = ?"
+                    " ORDER BY created_at LIMIT 1",
+                    (repo_url, branch_name, STATUS_QUEUED)
+                ).fetchone()
+                if oldest is not None and params.get("before_commit"):
+                    oldest_before = json.loads(oldest["params"] or "{}").get("before_commit")
+                    if oldest_before:
+                        params["before_commit"] = oldest_before
+                cursor = conn.execute(
+                    "UPDATE scan_jobs SET status = ?, stage = ?, superseded_by = ?, finished_at = ?"
+                    " WHERE repo_url = ? AND branch_name = ? AND status = ?",
+                    (STATUS_SUPERSEDED, STATUS_SUPERSEDED, job_id, now, repo_url, branch_name, STATUS_QUEUED)
+                )
+                if cursor.rowcount:
+                    logger.info(f"[{job_id}] 合并推送: 取代了 {cursor.rowcount} 个排队中的任务")
+            conn.execute(
+                "INSERT INTO scan_jobs (job_id, status, stage, project, repo_url, branch_name, commit_id,"
+                " event_type, params, stage_times, available_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, STATUS_QUEUED, project, repo_url, branch_name, commit_id,
+                 event_type, json.dumps(params, ensure_ascii=False),
+                 json.dumps({STATUS_QUEUED: now}), now + max(0, delay), now)
+            )
+        return job_id
+
+    def request_cancel_running(self, repo_url: str, branch_name: str, superseded_by: str) -> List[str]:
+        """标记同一仓库同一分支上正在执行的任务需要取消，返回这些任务ID"""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM scan_jobs WHERE repo_url = ? AND branch_name = ? AND status = ? AND job_id != ?",
+                (repo_url, branch_name, STATUS_RUNNING, superseded_by)
+            ).fetchall()
+            job_ids = [row["job_id"] for row in rows]
+            for running_id in job_ids:
+                conn.execute(
+                    "UPDATE scan_jobs SET cancel_requested = 1, superseded_by = ? WHERE job_id = ?",
+                    (superseded_by, running_id)
+                )
+        return job_ids
+
+    def request_cancel(self, job_id: str) -> bool:
+        """标记正在执行的任务需要取消"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE scan_jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?",
+                (job_id, STATUS_RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM scan_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def mark_cancelled(self, job_id: str, reason: str = None):
+        """将执行中被取消的任务标记为结束（被新推送取代时状态为 superseded）"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT superseded_by FROM scan_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            status = STATUS_SUPERSEDED if row and row["superseded_by"] else STATUS_CANCELLED
+            self._set_stage(conn, job_id, status, now)
+            conn.execute(
+                "UPDATE scan_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (status, reason, now, job_id)
+            )
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """取出最早入队的任务并标记为运行中"""
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT * FROM scan_jobs WHERE status = ? AND COALESCE(available_at, created_at) <= ?"
+                " ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE scan_jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (STATUS_RUNNING, now, row["job_id"])
+            )
+            self._set_stage(conn, row["job_id"], "starting", now)
+            job = self._row_to_job(row)
+            job.update({"status": STATUS_RUNNING, "stage": "starting", "started_at": now, "attempts": row["attempts"] + 1})
+            return job
+
+    def _set_stage(self, conn: sqlite3.Connection, job_id: str, stage: str, now: float):
+        row = conn.execute("SELECT stage_times FROM scan_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        stage_times = json.loads(row["stage_times"]) if row and row["stage_times"] else {}
+        stage_times[stage] = now
+        conn.execute(
+            "UPDATE scan_jobs SET stage = ?, stage_times = ? WHERE job_id = ?",
+            (stage, json.dumps(stage_times), job_id)
+        )
+
+    def update_stage(self, job_id: str, stage: str):
+        with self._lock, self._connect() as conn:
+            self._set_stage(conn, job_id, stage, time.time())
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        report_data = result.get("report_data") or {}
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            self._set_stage(conn, job_id, "done", now)
+            conn.execute(
+                "UPDATE scan_jobs SET status = ?, result = ?, coverage_summary = ?, report_url = ?, finished_at = ?"
+                " WHERE job_id = ?",
+                (STATUS_COMPLETED, json.dumps(result, ensure_ascii=False, default=str),
+                 json.dumps(report_data.get("coverage_summary") or {}), report_data.get("html_report_url"),
+                 now, job_id)
+            )
+
+    def fail(self, job_id: str, error: str):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            self._set_stage(conn, job_id, "failed", now)
+            conn.execute(
+                "UPDATE scan_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (STATUS_FAILED, error, now, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM scan_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(
+        self,
+        project: str = None,
+        branch_name: str = None,
+        status: str = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """按项目/分支/状态分页查询任务（不返回完整扫描结果）"""
+        conditions = []
+        args: List[Any] = []
+        if project:
+            conditions.append("project = ?")
+            args.append(project)
+        if branch_name:
+            conditions.append("branch_name = ?")
+            args.append(branch_name)
+        if status:
+            conditions.append("status = ?")
+            args.append(status)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ("job_id, status, stage, project, repo_url, branch_name, commit_id, event_type,"
+                   " coverage_summary, report_url, stage_times, superseded_by, cancel_requested, error,"
+                   " attempts, created_at, started_at, finished_at")
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM scan_jobs{where}", args).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {columns} FROM scan_jobs{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                args + [limit, offset]
+            ).fetchall()
+        return {"total": total, "jobs": [self._row_to_job(row) for row in rows]}
+
+    def cancel(self, job_id: str) -> bool:
+        """取消尚未开始的任务"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE scan_jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                (STATUS_CANCELLED, now, job_id, STATUS_QUEUED)
+            )
+            if cursor.rowcount:
+                self._set_stage(conn, job_id, STATUS_CANCELLED, now)
+            return cursor.rowcount > 0
+
+    def delete(self, job_id: str) -> bool:
+        """删除已结束任务的记录"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM scan_jobs WHERE job_id = ? AND status IN ({', '.join('?' * len(FINISHED_STATUSES))})",
+                (job_id,) + FINISHED_STATUSES
+            )
+            return cursor.rowcount > 0
+
+    def requeue_running(self) -> int:
+        """服务重启时，将中断的运行中任务重新放回队列；已领取 max_attempts 次的任务标记为失败"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE scan_jobs SET status = CASE WHEN superseded_by IS NULL THEN ? ELSE ? END,"
+                " stage = CASE WHEN superseded_by IS NULL THEN ? ELSE ? END, finished_at = ?"
+                " WHERE status = ? AND cancel_requested = 1",
+                (STATUS_CANCELLED, STATUS_SUPERSEDED, STATUS_CANCELLED, STATUS_SUPERSEDED, now, STATUS_RUNNING)
+            )
+            rows = conn.execute(
+                "SELECT job_id, attempts FROM scan_jobs WHERE status = ? AND attempts >= ?",
+                (STATUS_RUNNING, self.max_attempts)
+            ).fetchall()
+            for row in rows:
+                logger.warning(f"[{row['job_id']}] 扫描任务已中断 {row['attempts']} 次，不再重试")
+                self._set_stage(conn, row["job_id"], "failed", now)
+                conn.execute(
+                    "UPDATE scan_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                    (STATUS_FAILED, f"扫描任务执行期间服务中断 {row['attempts']} 次，不再重试", now, row["job_id"])
+                )
+            cursor = conn.execute(
+                "UPDATE scan_jobs SET status = ?, stage = ? WHERE status = ?",
+                (STATUS_QUEUED, STATUS_QUEUED, STATUS_RUNNING)
+            )
+            return cursor.rowcount
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS total FROM scan_jobs GROUP BY status").fetchall()
+        return {row["status"]: row["total"] for row in rows}
+
+
+class ScanWorkerPool:
+    """后台扫描 worker 线程池，持续从队列中取任务执行"""
+
+    def __init__(
+        self,
+        queue: ScanQueue,
+        handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+        worker_count: int = 2,
+        poll_interval: float = 1.0,
+        on_finished: Callable[[str], None] = None
+    ):
+        """on_finished 在任务状态写为结束状态之后调用（释放任务相关的进程内状态）"""
+        self.queue = queue
+        self.handler = handler
+        self.on_finished = on_finished
+        self.worker_count = max(1, worker_count)
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        requeued = self.queue.requeue_running()
+        if requeued:
+            logger.info(f"重新入队 {requeued} 个中断的扫描任务")
+        self._stop_event.clear()
+        for index in range(self.worker_count):
+            thread = threading.Thread(target=self._worker_loop, name=f"scan-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"启动 {self.worker_count} 个扫描 worker")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """有新任务入队时唤醒空闲 worker"""
+        self._wakeup.set()
+
+    def _worker_loop(self):
+        worker_name = threading.current_thread().name
+        while not self._stop_event.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logger.error(f"[{worker_name}] 获取扫描任务失败: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id = job["job_id"]
+            logger.info(f"[{worker_name}] 开始执行扫描任务 {job_id}")
+            try:
+                result = self.handler(job)
+                self.queue.complete(job_id, result or {})
+                logger.info(f"[{worker_name}] 扫描任务完成 {job_id}")
+            except JobCancelled as e:
+                logger.info(f"[{worker_name}] 扫描任务已取消 {job_id}: {e}")
+                self.queue.mark_cancelled(job_id, str(e))
+            except Exception as e:
+                logger.error(f"[{worker_name}] 扫描任务失败 {job_id}: {e}")
+                self.queue.fail(job_id, str(e))
+            finally:
+                if self.on_finished is not None:
+                    self.on_finished(job_id)
@@ -87,19 +87,16 @@ def extract_coverage_from_xml(xml_file):
         return None
     
     try:
-        import xml.etree.ElementTree as ET
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        
+        from src.jacoco_xml import read_report_counters
+
         coverage_data = {}
-        
-        # 查找总体覆盖率计数器
-        for counter in root.findall('.//counter'):
-            counter_type = counter.get('type')
-            missed = int(counter.get('missed', 0))
-            covered = int(counter.get('covered', 0))
+
+        # 报告级别的总体覆盖率计数器（流式解析）
+        for counter_type, values in read_report_counters(xml_file).items():
+            missed = values['missed']
+            covered = values['covered']
             total = missed + covered
-            
+
             if total > 0:
                 percentage = (covered / total) * 100
                 coverage_data[counter_type.lower()] = {
@@ -108,7 +105,7 @@ def extract_coverage_from_xml(xml_file):
                     'total': total,
                     'percentage': round(percentage, 2)
                 }
-        
+
         return coverage_data
     except Exception as e:
         print(f"解析覆盖率XML失败: {e}")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""测试 git diff -U0 的解析（src/diff_coverage.py）"""
+
+from src.diff_coverage import parse_unified_diff
+
+DIFF = """\
+diff --git a/core/src/main/java/com/example/Foo.java b/core/src/main/java/com/example/Foo.java
+index 3b18e51..a8c4f2d 100644
+--- a/core/src/main/java/com/example/Foo.java
++++ b/core/src/main/java/com/example/Foo.java
+@@ -10,0 +11,3 @@ public class Foo {
++    int a;
++    int b;
++    int c;
+@@ -20 +23 @@ public class Foo {
+-        return 1;
++        return 2;
+@@ -30,2 +32,0 @@ public class Foo {
+-    // removed
+-    // removed
+diff --git a/src/main/java/com/example/New.java b/src/main/java/com/example/New.java
+new file mode 100644
+index 0000000..e69de29
+--- /dev/null
++++ b/src/main/java/com/example/New.java
+@@ -0,0 +1,5 @@
++package com.example;
++
++public class New {
++    // @@ -1 +1 @@ 不是区间头
++}
+diff --git a/src/main/java/com/example/Gone.java b/src/main/java/com/example/Gone.java
+deleted file mode 100644
+index e69de29..0000000
+--- a/src/main/java/com/example/Gone.java
++++ /dev/null
+@@ -1,3 +0,0 @@
+-package com.example;
+-
+-class Gone {}
+diff --git a/src/main/java/com/example/Old.java b/src/main/java/com/example/Renamed.java
+similarity index 90%
+rename from src/main/java/com/example/Old.java
+rename to src/main/java/com/example/Renamed.java
+--- a/src/main/java/com/example/Old.java
++++ b/src/main/java/com/example/Renamed.java
+@@ -4 +4 @@ class Old {
+-class Old {
++class Renamed {
+"""
+
+
+def test_parse_unified_diff():
+    """新增/修改区间按新文件的行号记录；纯删除的区间和删除的文件不计，重命名按新路径"""
+    assert parse_unified_diff(DIFF) == {
+        "core/src/main/java/com/example/Foo.java": [(11, 3), (23, 1)],
+        "src/main/java/com/example/New.java": [(1, 5)],
+        "src/main/java/com/example/Renamed.java": [(4, 1)],
+    }
+
+
+def test_parse_only_deletions():
+    diff = (
+        "--- a/A.java\n"
+        "+++ b/A.java\n"
+        "@@ -5,2 +4,0 @@\n"
+        "-x\n"
+        "-y\n"
+    )
+    assert parse_unified_diff(diff) == {}
+    assert parse_unified_diff("") == {}
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""测试 jacoco.exec 的读写与合并（src/jacoco_exec.py）"""
+
+import io
+import struct
+
+import pytest
+
+from src.jacoco_exec import (
+    ClassExecution, ExecFormatError, ExecutionData, SessionInfo, merge_exec_files, read_exec, write_exec,
+    _read_utf, _write_utf
+)
+
+
+def _utf(text: bytes) -> bytes:
+    return struct.pack(">H", len(text)) + text
+
+
+# 按 JaCoCo agent（ExecutionDataWriter，格式版本 0x1007）的写法逐字节构造：
+# 以 append 方式写入的文件中有两段文件头 + 会话，第二段中 Foo 再次出现（探针需要合并）
+AGENT_EXEC = b"".join([
+    # 文件头: 0x01, magic 0xC0C0, 版本 0x1007
+    b"\x01\xc0\xc0\x10\x07",
+    # 会话: 0x10, id, start, dump
+    b"\x10", _utf(b"host-1a2b3c4d"), struct.pack(">qq", 1700000000000, 1700000005000),
+    # com/example/Foo: 类ID 0x8d3e.. (负数 long)，10 个探针，命中 0、2、9 -> 0b00000101, 0b00000010
+    b"\x11", struct.pack(">Q", 0x8D3E5F0A1B2C3D4E), _utf(b"com/example/Foo"), b"\x0a", b"\x05\x02",
+    # com/example/Bar: 130 个探针（长度为两字节的变长整数 0x82 0x01），只命中最后一个
+    b"\x11", struct.pack(">Q", 0x0123456789ABCDEF), _utf(b"com/example/Bar"), b"\x82\x01",
+    b"\x00" * 16 + b"\x02",
+    # 第二段
+    b"\x01\xc0\xc0\x10\x07",
+    b"\x10", _utf(b"host-1a2b3c4d-2"), struct.pack(">qq", 1700000010000, 1700000015000),
+    # Foo 再次出现，命中 1、2 -> 0b00000110, 0b00000000
+    b"\x11", struct.pack(">Q", 0x8D3E5F0A1B2C3D4E), _utf(b"com/example/Foo"), b"\x0a", b"\x06\x00",
+])
+
+FOO_ID = 0x8D3E5F0A1B2C3D4E
+BAR_ID = 0x0123456789ABCDEF
+
+
+def test_read_agent_exec():
+    """读取 agent 写出的文件：多段文件头、负数类ID、多字节变长整数、同一个类的探针合并"""
+    data = read_exec(io.BytesIO(AGENT_EXEC))
+
+    assert [s.id for s in data.sessions] == ["host-1a2b3c4d", "host-1a2b3c4d-2"]
+    assert data.sessions[0] == SessionInfo("host-1a2b3c4d", 1700000000000, 1700000005000)
+
+    foo = data.classes[FOO_ID]
+    assert foo.name == "com/example/Foo"
+    assert foo.probe_count == 10
+    assert [i for i, hit in enumerate(foo.probes) if hit] == [0, 1, 2, 9]
+
+    bar = data.classes[BAR_ID]
+    assert bar.probe_count == 130
+    assert [i for i, hit in enumerate(bar.probes) if hit] == [129]
+    assert bar.covered_count == 1
+
+
+def test_write_round_trip():
+    """写出后再读取内容不变；只有一个文件头，执行数据按类ID排序，字节与 agent 的编码一致"""
+    data = read_exec(io.BytesIO(AGENT_EXEC))
+    output = io.BytesIO()
+    write_exec(output, data)
+    raw = output.getvalue()
+
+    assert raw.count(b"\x01\xc0\xc0\x10\x07") == 1
+    # Bar 的类ID小于 Foo（按无符号比较），先写出；探针数 130 编码为 0x82 0x01
+    bar_block = b"\x11" + struct.pack(">Q", BAR_ID) + _utf(b"com/example/Bar") + b"\x82\x01"
+    assert raw.index(bar_block) < raw.index(struct.pack(">Q", FOO_ID))
+
+    again = read_exec(io.BytesIO(raw))
+    assert again.sessions == data.sessions
+    assert sorted(again.classes) == sorted(data.classes)
+    for class_id, execution in data.classes.items():
+        assert again.classes[class_id].name == execution.name
+        assert again.classes[class_id].probes == execution.probes
+
+
+def test_merge_files(tmp_path):
+    """合并多个文件：探针按位或，会话去重，结果写出到文件"""
+    first = tmp_path / "a.exec"
+    first.write_bytes(AGENT_EXEC)
+
+    other = ExecutionData()
+    other.add_session(SessionInfo("host-1a2b3c4d", 1700000000000, 1700000005000))
+    other.add_class(ClassExecution.from_probes(FOO_ID, "com/example/Foo", [False] * 5 + [True] + [False] * 4))
+    other.add_class(ClassExecution.from_probes(42, "com/example/Baz", [True, False, True]))
+    second = tmp_path / "b.exec"
+    write_exec(str(second), other)
+
+    merged_path = tmp_path / "merged.exec"
+    merged = merge_exec_files([str(first), str(second)], str(merged_path))
+
+    assert len(merged.sessions) == 2
+    assert [i for i, hit in enumerate(merged.classes[FOO_ID].probes) if hit] == [0, 1, 2, 5, 9]
+    assert merged.classes[42].probes == [True, False, True]
+    assert merged.classes[BAR_ID].covered_count == 1
+
+    reread = read_exec(str(merged_path))
+    assert {k: v.probes for k, v in reread.classes.items()} == {k: v.probes for k, v in merged.classes.items()}
+
+
+def test_merge_rejects_mismatched_probes():
+    """同一个类ID的探针数量不一致（类已改变）时报错，不静默合并"""
+    data = read_exec(io.BytesIO(AGENT_EXEC))
+    with pytest.raises(ExecFormatError):
+        data.add_class(ClassExecution.from_probes(FOO_ID, "com/example/Foo", [True] * 11))
+
+
+@pytest.mark.parametrize("text", ["com/example/Foo", "", "com/例子/Ünïcode", "a\x00b", "emoji\U0001F600"])
+def test_modified_utf8(text):
+    """modified UTF-8：NUL 编码为 0xC0 0x80，补充平面字符编码为两个三字节的代理项"""
+    stream = io.BytesIO()
+    _write_utf(stream, text)
+    raw = stream.getvalue()
+    assert b"\x00" not in raw[2:]
+    if "\U0001F600" in text:
+        assert b"\xed\xa0\xbd\xed\xb8\x80" in raw
+    stream.seek(0)
+    assert _read_utf(stream) == text
+
+
+def test_rejects_invalid_files():
+    with pytest.raises(ExecFormatError):
+        read_exec(io.BytesIO(b"\x10" + _utf(b"x") + b"\x00" * 16))
+    with pytest.raises(ExecFormatError):
+        read_exec(io.BytesIO(b"\x01\xca\xfe\x10\x07"))
+    with pytest.raises(ExecFormatError):
+        read_exec(io.BytesIO(b"\x01\xc0\xc0\x10\x06"))
+    with pytest.raises(ExecFormatError):
+        read_exec(io.BytesIO(AGENT_EXEC[:-1]))
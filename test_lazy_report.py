@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""测试按需生成的 HTML 报告（src/lazy_report.py）"""
+
+import os
+import zipfile
+
+from src.lazy_report import DATA_DIR_NAME, render_html
+
+COUNTERS = "".join(
+    f'<counter type="{t}" missed="1" covered="3"/>' for t in ("INSTRUCTION", "BRANCH", "LINE", "METHOD", "CLASS")
+)
+
+
+def _package(name, with_sources=True):
+    classes = f'<class name="{name}/Foo" sourcefilename="Foo.java">{COUNTERS}</class>'
+    sourcefiles = (
+        '<sourcefile name="Foo.java"><line nr="1" mi="0" ci="2" mb="0" cb="0"/>'
+        f'<line nr="2" mi="3" ci="0" mb="0" cb="0"/><line nr="3" mi="1" ci="1" mb="1" cb="1"/>{COUNTERS}</sourcefile>'
+    ) if with_sources else ""
+    return f'<package name="{name}">{classes}{sourcefiles}{COUNTERS}</package>'
+
+
+def _render(tmp_path, xml):
+    report_dir = tmp_path / "report"
+    (report_dir / DATA_DIR_NAME).mkdir(parents=True)
+    (report_dir / DATA_DIR_NAME / "jacoco.xml").write_text(xml)
+    with zipfile.ZipFile(report_dir / DATA_DIR_NAME / "sources.zip", "w") as zip_file:
+        zip_file.writestr("com/example/Foo.java", "class Foo {\n  int a;\n  void b() {}\n}\n")
+    output_dir = tmp_path / "html"
+    output_dir.mkdir()
+    render_html(str(report_dir), str(output_dir), "demo")
+    return output_dir
+
+
+def test_render_multi_module_report(tmp_path):
+    """每个模块（group）一个目录，包页面和源文件页面在模块目录下；不安全的 group 名称不渲染"""
+    xml = (
+        '<?xml version="1.0"?><report name="demo"><sessioninfo id="s" start="1" dump="2"/>'
+        f'<group name="core">{_package("com/example")}{COUNTERS}</group>'
+        f'<group name="svc/api"><group name="inner">{_package("com/other", False)}{COUNTERS}</group>{COUNTERS}</group>'
+        f'<group name="../evil">{_package("com/evil")}{COUNTERS}</group>'
+        f'{COUNTERS}</report>'
+    )
+    output_dir = _render(tmp_path, xml)
+    files = sorted(
+        os.path.relpath(os.path.join(root, name), output_dir).replace(os.sep, "/")
+        for root, _, names in os.walk(output_dir) for name in names
+    )
+    assert files == [
+        "core/com.example/Foo.java.html",
+        "core/com.example/index.html",
+        "core/index.html",
+        "index.html",
+        "svc/api/index.html",
+        "svc/api/inner/com.other/index.html",
+        "svc/api/inner/index.html",
+    ]
+    assert not (tmp_path / "evil").exists()
+
+    index = (output_dir / "index.html").read_text()
+    assert '<a href="core/index.html">core</a>' in index and '<a href="svc/api/index.html">svc/api</a>' in index
+    assert "evil" not in index and "模块 / 包" in index
+    assert "75% (3/4)" in index
+
+    package_page = (output_dir / "svc/api/inner/com.other/index.html").read_text()
+    # 没有源文件信息时按类列出，首页链接按目录深度回到根目录
+    assert '<a href="../../../../index.html">首页</a>' in package_page
+    assert "<td>Foo</td>" in package_page
+
+    source_page = (output_dir / "core/com.example/Foo.java.html").read_text()
+    assert '<span class="fc" id="L1"><span class="nr">1</span>class Foo {</span>' in source_page
+    assert '<span class="nc" id="L2">' in source_page and '<span class="pc" id="L3">' in source_page
+    assert '<span class="" id="L4">' in source_page
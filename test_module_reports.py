@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""测试多模块项目的模块定位（src/module_reports.py）"""
+
+import pytest
+
+from src.module_reports import discover_modules, modules_for_files, reactor_modules
+
+
+def _pom(artifact_id, parent=None, modules=(), dependencies=(), managed=(), plugins=()):
+    parts = ['<project xmlns="http://maven.apache.org/POM/4.0.0">']
+    if parent:
+        parts.append(f"<parent><groupId>com.example</groupId><artifactId>{parent}</artifactId></parent>")
+    else:
+        parts.append("<groupId>com.example</groupId>")
+    parts.append(f"<artifactId>{artifact_id}</artifactId>")
+    if modules:
+        parts.append("<modules>" + "".join(f"<module>{m}</module>" for m in modules) + "</modules>")
+    deps = "".join(
+        f"<dependency><groupId>${{project.groupId}}</groupId><artifactId>{d}</artifactId></dependency>" for d in dependencies
+    )
+    parts.append(f"<dependencies>{deps}</dependencies>")
+    if managed:
+        parts.append("<dependencyManagement><dependencies>" + "".join(
+            f"<dependency><groupId>com.example</groupId><artifactId>{d}</artifactId></dependency>" for d in managed
+        ) + "</dependencies></dependencyManagement>")
+    if plugins:
+        parts.append("<build><plugins>" + "".join(
+            f"<plugin><groupId>com.example</groupId><artifactId>{p}</artifactId></plugin>" for p in plugins
+        ) + "</plugins></build>")
+    return "".join(parts) + "</project>"
+
+
+@pytest.fixture
+def project(tmp_path):
+    """parent 聚合 common、core、api、app、tools、docs；依赖关系 common <- core <- api <- app，tools 作为 docs 的插件"""
+    poms = {
+        "": _pom("parent", modules=["common", "core", "api", "app", "tools", "docs"],
+                 managed=["common", "core", "api", "app"]),
+        "common": _pom("common", parent="parent"),
+        "core": _pom("core", parent="parent", dependencies=["common"]),
+        "api": _pom("api", parent="parent", dependencies=["core"]),
+        "app": _pom("app", parent="parent", dependencies=["api"]),
+        "tools": _pom("tools", parent="parent"),
+        "docs": _pom("docs", parent="parent", plugins=["tools"]),
+    }
+    for module, content in poms.items():
+        (tmp_path / module).mkdir(exist_ok=True)
+        (tmp_path / module / "pom.xml").write_text(content)
+    return str(tmp_path)
+
+
+def test_discover_and_map(project):
+    modules = discover_modules(project)
+    assert modules == ["api", "app", "common", "core", "docs", "tools"]
+    assert modules_for_files(["core/src/main/java/A.java", "README.md"], modules) == ({"core"}, ["README.md"])
+
+
+@pytest.mark.parametrize("selected, expected", [
+    # 上游 common、parent（-am），下游 api、app（-amd）；dependencyManagement 不构成依赖
+    (["core"], ["", "api", "app", "common", "core"]),
+    (["app"], ["", "api", "app", "common", "core"]),
+    (["common"], ["", "api", "app", "common", "core"]),
+    # 插件也是 reactor 依赖
+    (["tools"], ["", "docs", "tools"]),
+    (["docs"], ["", "docs", "tools"]),
+])
+def test_reactor_modules(project, selected, expected):
+    assert reactor_modules(project, discover_modules(project), selected) == expected
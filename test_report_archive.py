@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""测试归档保存的报告及其响应（src/report_archive.py、app.py）"""
+
+import gzip
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from src.blob_store import BlobStore
+from src.report_archive import (
+    ARCHIVE_NAME, PACK_DIR_NAME, accepts_gzip, pack_report, read_member, read_report_member
+)
+
+PAGE = "<html><body>" + "covered line " * 200 + "</body></html>"
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+
+def _html_report(root, class_page=PAGE):
+    """与 jacococli 输出相同的布局：首页、会话页、jacoco-resources、每个包一个目录"""
+    files = {
+        "index.html": "<html>index</html>",
+        "jacoco-sessions.html": f"<html>{root}</html>",
+        "jacoco-resources/report.css": "body { color: black; }",
+        "jacoco-resources/branchfc.gif": PNG,
+        "com.example/index.html": "<html>package</html>",
+        "com.example/Foo.html": class_page,
+        "com.example.util/Bar.html": PAGE,
+    }
+    for name, content in files.items():
+        path = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content if isinstance(content, bytes) else content.encode("utf-8"))
+    return str(root)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", True),
+    ("gzip, deflate, br", True),
+    ("deflate, gzip;q=0.5", True),
+    ("x-gzip", True),
+    ("GZIP ; Q=0.001", True),
+    ("*", True),
+    ("br, *;q=0.1", True),
+    ("gzip;q=0", False),
+    ("gzip;q=0.0, *", False),
+    ("*;q=0", False),
+    ("x-gzip-foo", False),
+    ("identity", False),
+    ("gzip;q=abc", False),
+    ("", False),
+    (None, False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_pack_report_layout(tmp_path):
+    """末级目录各自一个归档，其余文件在 report.zip 中；读取时按路径找到所在的归档"""
+    source = _html_report(tmp_path / "html")
+    report_dir = tmp_path / "report"
+    report_dir.mkdir()
+    stats = pack_report(source, str(report_dir))
+
+    assert stats == {"files": 7, "archives": 4, "deduplicated": 0}
+    assert sorted(os.listdir(report_dir / PACK_DIR_NAME)) == ["com.example.util.zip", "com.example.zip", "jacoco-resources.zip"]
+    assert read_member(str(report_dir / ARCHIVE_NAME), "com.example/Foo.html") is None
+
+    foo = read_report_member(str(report_dir), "com.example/Foo.html")
+    assert foo.body.decode("utf-8") == PAGE and foo.encoding is None
+    assert read_report_member(str(report_dir), "index.html").body == b"<html>index</html>"
+    assert read_report_member(str(report_dir), "com.example/Missing.html") is None
+    assert read_report_member(str(report_dir), "missing/index.html") is None
+
+
+def test_gzip_member(tmp_path):
+    """接受 gzip 时返回成员的压缩数据；已压缩的图片不使用 gzip；两种编码的 ETag 不同"""
+    report_dir = tmp_path / "report"
+    report_dir.mkdir()
+    pack_report(_html_report(tmp_path / "html"), str(report_dir))
+
+    plain = read_report_member(str(report_dir), "com.example/Foo.html")
+    packed = read_report_member(str(report_dir), "com.example/Foo.html", accept_gzip=True)
+    assert packed.encoding == "gzip"
+    assert len(packed.body) < len(plain.body)
+    assert gzip.decompress(packed.body) == plain.body
+    assert packed.etag != plain.etag
+
+    image = read_report_member(str(report_dir), "jacoco-resources/branchfc.gif", accept_gzip=True)
+    assert image.encoding is None and image.body == PNG
+
+
+def test_archives_are_deduplicated(tmp_path):
+    """内容相同的目录打包结果逐字节相同，开启去重时两份报告共用同一个文件"""
+    store = BlobStore(str(tmp_path / ".blobs"))
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    pack_report(_html_report(tmp_path / "html-1"), str(first), store)
+    stats = pack_report(_html_report(tmp_path / "html-2", class_page=PAGE + "changed"), str(second), store)
+
+    # 会话页不同（report.zip），com.example 的类页面有变化，其余两个目录的归档相同
+    assert stats["archives"] == 4
+    for name, shared in [("jacoco-resources.zip", True), ("com.example.util.zip", True), ("com.example.zip", False)]:
+        assert os.path.samefile(first / PACK_DIR_NAME / name, second / PACK_DIR_NAME / name) is shared
+    assert not os.path.samefile(first / ARCHIVE_NAME, second / ARCHIVE_NAME)
+    assert read_report_member(str(second), "com.example/Foo.html").body.decode("utf-8") == PAGE + "changed"
+
+
+def test_legacy_single_archive(tmp_path):
+    """只有一个 report.zip 的旧报告仍按完整路径读取"""
+    import zipfile
+
+    report_dir = tmp_path / "report"
+    report_dir.mkdir()
+    with zipfile.ZipFile(report_dir / ARCHIVE_NAME, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("index.html", "<html>index</html>")
+        zip_file.writestr("com.example/Foo.html", PAGE)
+    assert read_report_member(str(report_dir), "com.example/Foo.html").body.decode("utf-8") == PAGE
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    report_dir = tmp_path / "reports" / "demo" / "abcdef12"
+    report_dir.mkdir(parents=True)
+    pack_report(_html_report(tmp_path / "html"), str(report_dir))
+    monkeypatch.setattr(app_module, "REPORTS_BASE_DIR", str(tmp_path / "reports"))
+    return TestClient(app_module.app)
+
+
+def test_serve_archived_report(client):
+    response = client.get("/reports/demo/abcdef12/com.example/Foo.html", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.text == PAGE
+    assert response.headers["content-type"].startswith("text/html")
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "immutable" not in response.headers["cache-control"]
+
+    # 目录地址返回其中的 index.html
+    assert client.get("/reports/demo/abcdef12/com.example/").text == "<html>package</html>"
+    assert client.get("/reports/demo/abcdef12/").text == "<html>index</html>"
+    assert client.get("/reports/demo/abcdef12/com.example/Missing.html").status_code == 404
+    assert client.get("/reports/demo/abcdef12/../../etc/passwd").status_code == 404
+
+
+@pytest.mark.parametrize("accept_encoding, encoded", [("gzip, br", True), ("gzip;q=0, br", False), ("x-gzip-foo", False)])
+def test_gzip_negotiation(client, accept_encoding, encoded):
+    response = client.get("/reports/demo/abcdef12/com.example/Foo.html", headers={"Accept-Encoding": accept_encoding})
+    assert response.status_code == 200
+    assert (response.headers.get("content-encoding") == "gzip") is encoded
+    # 客户端按 Content-Encoding 解压
+    assert response.text == PAGE
+
+
+def test_etag_not_modified(client):
+    url = "/reports/demo/abcdef12/com.example/Foo.html"
+    etag = client.get(url, headers={"Accept-Encoding": "identity"}).headers["etag"]
+    assert etag.startswith('"')
+
+    for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        response = client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    assert client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": '"other"'}).status_code == 200
+    # gzip 响应的 ETag 不同，原始内容的 ETag 不能用于验证 gzip 响应
+    response = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""测试报告目录的分页（src/report_catalog.py）"""
+
+import pytest
+
+from src.report_catalog import ReportCatalog, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = ReportCatalog(str(tmp_path / "catalog.db"))
+    # 每两份报告的发布时间相同，翻页时靠 (project, commit_dir) 区分先后
+    for index, (project, branch) in enumerate([
+        ("alpha", "main"), ("alpha", "dev"), ("beta", "main"), ("alpha", "main"), ("beta", "feat"), ("测试", "main"),
+    ]):
+        catalog.record(project, f"{index:08x}", f"{index:08x}" * 5, branch, created_at=1000.0 + index // 2)
+    return catalog
+
+
+def _walk(catalog, limit, cursor=None, **filters):
+    keys = []
+    while True:
+        items, cursor = catalog.list_reports(limit=limit, cursor=cursor, **filters)
+        keys += [(item["project"], item["commit_dir"]) for item in items]
+        if cursor is None:
+            return keys
+
+
+def test_cursor_round_trip():
+    item = {"created_at": 1700000000.123456, "project": "测试/项目", "commit_dir": "abcdef12"}
+    cursor = encode_cursor(item)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == (1700000000.123456, "测试/项目", "abcdef12")
+
+
+@pytest.mark.parametrize("cursor", ["zzz", "", "bm90IGpzb24"])
+def test_invalid_cursor(cursor):
+    """不是 base64 或不是游标内容的 JSON 时报 ValueError（接口返回 400）"""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 6, 100])
+def test_pages_cover_all_reports_once(catalog, limit):
+    """任意页大小翻页都不重复、不遗漏，顺序与一次查询全部时相同（发布时间相同时也稳定）"""
+    expected = [(item["project"], item["commit_dir"]) for item in catalog.list_reports(limit=100)[0]]
+    assert len(expected) == 6
+    assert _walk(catalog, limit) == expected
+
+
+def test_filters_and_new_reports(catalog):
+    """按项目/分支过滤后翻页；翻页过程中新发布的报告不影响后面的页"""
+    assert _walk(catalog, 1, project="alpha", branch="main") == [("alpha", "00000003"), ("alpha", "00000000")]
+
+    first, cursor = catalog.list_reports(limit=2)
+    catalog.record("alpha", "ffffffff", "f" * 40, "main", created_at=9999.0)
+    rest = _walk(catalog, 2, cursor)
+    assert ("alpha", "ffffffff") not in rest
+    assert len(first) + len(rest) == 6
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""测试扫描任务队列（src/scan_queue.py）"""
+
+import pytest
+
+from src.scan_queue import (
+    STATUS_CANCELLED, STATUS_COMPLETED, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUPERSEDED, ScanQueue
+)
+
+REPO = "http://git.example.com/team/demo.git"
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return ScanQueue(str(tmp_path / "queue.db"), max_attempts=2)
+
+
+def _enqueue(queue, commit, branch="main", before=None, **kwargs):
+    params = {"before_commit": before} if before else {}
+    return queue.enqueue(REPO, commit, branch, "demo", "push", params, **kwargs)
+
+
+def test_enqueue_coalesces_queued_jobs(queue):
+    """同一分支上排队中的任务被新推送取代，变更范围从最早一次推送的 before 开始；其他分支和运行中的任务不受影响"""
+    first = _enqueue(queue, "c1", before="c0", coalesce=True)
+    other_branch = _enqueue(queue, "d1", branch="dev", coalesce=True)
+    second = _enqueue(queue, "c2", before="c1", coalesce=True)
+    third = _enqueue(queue, "c3", before="c2", coalesce=True)
+
+    for job_id, superseded_by in [(first, second), (second, third)]:
+        job = queue.get(job_id)
+        assert job["status"] == STATUS_SUPERSEDED
+        assert job["superseded_by"] == superseded_by
+        assert job["finished_at"] is not None
+    assert queue.get(other_branch)["status"] == STATUS_QUEUED
+    assert queue.get(third)["params"] == {"before_commit": "c0"}
+
+    # 已开始执行的任务不会被取代
+    assert queue.claim()["job_id"] == other_branch
+    _enqueue(queue, "d2", branch="dev", coalesce=True)
+    assert queue.get(other_branch)["status"] == STATUS_RUNNING
+
+
+def test_enqueue_without_coalescing(queue):
+    first = _enqueue(queue, "c1")
+    second = _enqueue(queue, "c2")
+    assert first != second
+    assert queue.count_by_status() == {STATUS_QUEUED: 2}
+
+
+def test_claim_order_and_delay(queue):
+    """按入队顺序领取，延迟期内的任务不会被领取；领取时记录开始时间和次数"""
+    first = _enqueue(queue, "c1")
+    delayed = _enqueue(queue, "c2", branch="dev", delay=60)
+    second = _enqueue(queue, "c3", branch="feature")
+
+    job = queue.claim()
+    assert job["job_id"] == first
+    assert job["status"] == STATUS_RUNNING and job["attempts"] == 1
+    stored = queue.get(first)
+    assert stored["status"] == STATUS_RUNNING and stored["stage"] == "starting"
+    assert stored["started_at"] is not None and stored["attempts"] == 1
+
+    assert queue.claim()["job_id"] == second
+    assert queue.claim() is None
+    assert queue.get(delayed)["status"] == STATUS_QUEUED
+
+    queue.complete(first, {"report_data": {"coverage_summary": {"line_coverage": 80.0}, "html_report_url": "/r"}})
+    done = queue.get(first)
+    assert done["status"] == STATUS_COMPLETED
+    assert done["coverage_summary"] == {"line_coverage": 80.0} and done["report_url"] == "/r"
+    assert set(done["stage_times"]) == {STATUS_QUEUED, "starting", "done"}
+
+
+def test_cancel(queue):
+    """排队中的任务直接取消；运行中的任务只能请求取消，由 worker 结束"""
+    queued = _enqueue(queue, "c1")
+    assert queue.cancel(queued)
+    assert queue.get(queued)["status"] == STATUS_CANCELLED
+    assert not queue.cancel(queued)
+    assert queue.claim() is None
+
+    running = _enqueue(queue, "c2")
+    queue.claim()
+    assert not queue.cancel(running)
+    assert not queue.is_cancel_requested(running)
+    assert queue.request_cancel(running)
+    assert queue.is_cancel_requested(running)
+    queue.mark_cancelled(running, "手动取消")
+    job = queue.get(running)
+    assert job["status"] == STATUS_CANCELLED and job["error"] == "手动取消"
+
+    # 被新推送取代的运行中任务结束时状态为 superseded
+    superseded = _enqueue(queue, "c3")
+    queue.claim()
+    newer = _enqueue(queue, "c4")
+    assert queue.request_cancel_running(REPO, "main", newer) == [superseded]
+    queue.mark_cancelled(superseded)
+    assert queue.get(superseded)["status"] == STATUS_SUPERSEDED
+
+    assert queue.delete(running)
+    assert queue.get(running) is None
+    assert not queue.delete(newer)
+
+
+def test_requeue_running(queue):
+    """重启时中断的任务重新排队，请求过取消的任务直接结束"""
+    interrupted = _enqueue(queue, "c1")
+    cancelled = _enqueue(queue, "c2", branch="dev")
+    queue.claim()
+    queue.claim()
+    queue.request_cancel(cancelled)
+
+    assert queue.requeue_running() == 1
+    assert queue.get(interrupted)["status"] == STATUS_QUEUED
+    assert queue.get(cancelled)["status"] == STATUS_CANCELLED
+    assert queue.claim()["job_id"] == interrupted
+
+
+def test_requeue_gives_up_after_max_attempts(queue):
+    """每次执行都中断（如导致进程崩溃）的任务在领取 max_attempts 次后标记为失败，不再无限重试"""
+    job_id = _enqueue(queue, "c1")
+    for attempt in range(1, 3):
+        job = queue.claim()
+        assert job["job_id"] == job_id and job["attempts"] == attempt
+        queue.requeue_running()
+
+    job = queue.get(job_id)
+    assert job["status"] == STATUS_FAILED
+    assert job["attempts"] == 2
+    assert job["error"] and job["finished_at"] is not None
+    assert queue.claim() is None
+
+
+def test_requeue_keeps_queued_jobs_available(queue):
+    """排队中（未领取）的任务不受重启影响"""
+    job_id = _enqueue(queue, "c1")
+    assert queue.requeue_running() == 0
+    assert queue.claim()["job_id"] == job_id